@@ -0,0 +1,376 @@
+#!/usr/bin/env python
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+"""
+Benchmarks for the pyrasite-gui hot paths.
+
+Everything runs headless against synthetic data and local stand-in target
+processes, so neither a display nor a real target is required.  Results are
+written as JSON so runs from different commits can be compared::
+
+    python -m benchmarks.run --output before.json
+    python -m benchmarks.run --output after.json --compare before.json
+
+Benchmarks whose dependencies (pygobject, psutil, pyrasite, meliae) are not
+installed are reported as skipped.
+"""
+
+from __future__ import division, print_function
+
+import os
+import sys
+import json
+import time
+import random
+import platform
+import tempfile
+import subprocess
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyrasite_gui.heap import HeapGraph, DominatorTree
+
+BENCHMARKS = []
+
+# A stand-in target: a python process with some threads, files and sockets
+STAND_IN = """
+import os, sys, time, socket, tempfile, threading
+threads, files, sockets = [int(arg) for arg in sys.argv[1:4]]
+for i in range(threads):
+    t = threading.Thread(target=time.sleep, args=(3600,))
+    t.daemon = True
+    t.start()
+keep = [tempfile.TemporaryFile() for i in range(files)]
+server = socket.socket()
+server.bind(('127.0.0.1', 0))
+server.listen(sockets or 1)
+for i in range(sockets):
+    keep.append(socket.create_connection(server.getsockname()))
+    keep.append(server.accept()[0])
+sys.stdout.write('ready\\n')
+sys.stdout.flush()
+time.sleep(3600)
+"""
+
+
+class Skip(Exception):
+    """Raised by a benchmark whose dependencies are unavailable"""
+
+
+def benchmark(func):
+    BENCHMARKS.append(func)
+    return func
+
+
+def measure(func, repeat):
+    timings = []
+    for i in range(repeat):
+        start = time.time()
+        func()
+        timings.append(time.time() - start)
+    timings.sort()
+    return dict(min=timings[0], median=timings[len(timings) // 2],
+                max=timings[-1], repeat=repeat)
+
+
+def import_gui():
+    try:
+        from pyrasite_gui import gui
+    except (ImportError, SystemExit) as e:
+        raise Skip('pyrasite_gui.gui is not importable: %s' % e)
+    return gui
+
+
+class StandIn(object):
+    """Spawn local python processes to act as targets"""
+
+    def __init__(self, count=1, threads=0, files=0, sockets=0):
+        self.procs = []
+        for i in range(count):
+            proc = subprocess.Popen([sys.executable, '-c', STAND_IN,
+                                     str(threads), str(files), str(sockets)],
+                                    stdout=subprocess.PIPE)
+            self.procs.append(proc)
+        for proc in self.procs:
+            proc.stdout.readline()
+
+    @property
+    def pids(self):
+        return [proc.pid for proc in self.procs]
+
+    def close(self):
+        for proc in self.procs:
+            proc.kill()
+            proc.wait()
+
+
+class ScriptRecorder(object):
+    """Stands in for the WebKit view that receives generated scripts"""
+
+    def __init__(self):
+        self.scripts = []
+
+    def execute_script(self, script):
+        self.scripts.append(script)
+
+
+def synthetic_records(count, fanout=3, seed=0):
+    """Return (address, type, size, refs) tuples shaped like a meliae dump"""
+    rand = random.Random(seed)
+    types = ['str'] * 6 + ['dict'] * 3 + ['tuple'] * 3 + ['list', 'int',
+             'function', 'module']
+    records = []
+    for i in range(count):
+        address = 0x7f0000000000 + i * 48
+        kind = rand.choice(types)
+        refs = []
+        if kind in ('dict', 'tuple', 'list', 'module', 'function'):
+            refs = [0x7f0000000000 + rand.randrange(count) * 48
+                    for j in range(rand.randint(0, fanout * 2))]
+        records.append((address, kind, rand.randint(24, 4096), refs))
+    return records
+
+
+def write_meliae_dump(path, count):
+    with open(path, 'w') as f:
+        for address, kind, size, refs in synthetic_records(count):
+            f.write(json.dumps(dict(address=address, type=kind, size=size,
+                                    refs=refs)) + '\n')
+
+
+def synthetic_stacks(threads, depth):
+    lines = []
+    for t in range(threads):
+        lines.append('Thread 0x%x' % (0x7f0000000000 + t))
+        for d in range(depth):
+            lines.append('  File "/usr/lib/python3/site-packages/app/'
+                         'module%d.py", line %d, in handler_%d' % (d, d, d))
+            lines.append('    return self.dispatch(request, timeout=%d.5, '
+                         'name="worker")  # retry' % d)
+        lines.append('')
+    return '\n'.join(lines)
+
+
+##
+## Benchmarks
+##
+
+@benchmark
+def process_discovery(options):
+    """ProcessListStore scanning for python processes"""
+    gui = import_gui()
+    stand_in = StandIn(count=options.processes)
+    try:
+        return measure(gui.ProcessListStore, options.repeat), \
+                dict(processes=options.processes)
+    finally:
+        stand_in.close()
+
+
+@benchmark
+def poller_tick(options):
+    """One ResourceUsagePoller tick, excluding the blocking CPU sample"""
+    gui = import_gui()
+    stand_in = StandIn(threads=options.threads, files=options.files,
+                       sockets=options.sockets)
+    try:
+        poller = gui.ResourceUsagePoller(stand_in.pids[0])
+
+        def tick():
+            poller.poll_mem()
+            poller.poll_io()
+            poller.poll_threads()
+            poller.poll_connections()
+            poller.poll_files()
+        return measure(tick, options.repeat), dict(
+            threads=options.threads, files=options.files,
+            sockets=options.sockets)
+    finally:
+        stand_in.close()
+
+
+@benchmark
+def render_resource_usage(options):
+    """Sparkline script generation with many threads"""
+    gui = import_gui()
+    intervals = [float(i % 7) for i in range(gui.INTERVALS)]
+    gui.cpu_intervals = gui.mem_intervals = list(intervals)
+    gui.read_intervals = gui.write_intervals = list(intervals)
+    gui.thread_intervals = dict((tid, list(intervals))
+                                for tid in range(options.threads))
+    gui.thread_colors = dict((tid, gui.get_color())
+                             for tid in range(options.threads))
+
+    class Window(object):
+        info_view = ScriptRecorder()
+
+        def update_thread_table(self):
+            pass
+
+        def apply_resource_changes(self):
+            pass
+
+        def update_memory_breakdown(self):
+            pass
+
+        def check_triggers(self):
+            pass
+
+    window = Window()
+    render = gui.PyrasiteWindow.render_resource_usage
+    return measure(lambda: render(window), options.repeat), \
+            dict(threads=options.threads)
+
+
+@benchmark
+def fontify(options):
+    """Syntax highlighting of a large stack dump"""
+    gui = import_gui()
+
+    class Window(object):
+        source_buffer = gui.Gtk.TextBuffer()
+
+    window = Window()
+    for tag in ('bold', 'italic', 'comment', 'decorator', 'keyword',
+                'number', 'string'):
+        window.source_buffer.create_tag(tag)
+    window.source_buffer.set_text(synthetic_stacks(options.threads,
+                                                   options.depth))
+    return measure(lambda: gui.PyrasiteWindow.fontify(window),
+                   options.repeat), dict(threads=options.threads,
+                                         depth=options.depth)
+
+
+@benchmark
+def dump_objects_load(options):
+    """Loading and summarizing a synthetic meliae dump"""
+    try:
+        from meliae import loader
+    except ImportError as e:
+        raise Skip('meliae is not importable: %s' % e)
+    fd, path = tempfile.mkstemp(suffix='.objects')
+    os.close(fd)
+    try:
+        write_meliae_dump(path, options.objects)
+
+        def load():
+            loader.load(path, show_prog=False).summarize()
+        return measure(load, options.repeat), dict(objects=options.objects)
+    finally:
+        os.unlink(path)
+
+
+@benchmark
+def heap_graph_build(options):
+    """Indexing an object dump into a HeapGraph"""
+    records = synthetic_records(options.objects)
+    return measure(lambda: HeapGraph.from_records(records),
+                   options.repeat), dict(objects=options.objects)
+
+
+@benchmark
+def heap_graph_queries(options):
+    """Referrer, largest-instance and path-to-root queries"""
+    graph = HeapGraph.from_records(synthetic_records(options.objects))
+    graph.referrers(0)
+    rand = random.Random(1)
+    targets = [rand.randrange(len(graph)) for i in range(100)]
+
+    def queries():
+        graph._largest.clear()
+        graph.largest('str')
+        for i in targets:
+            graph.referrers(i)
+            graph.path_to_root(i)
+    return measure(queries, options.repeat), dict(objects=options.objects)
+
+
+@benchmark
+def dominator_tree(options):
+    """Dominator tree and retained sizes over a HeapGraph"""
+    graph = HeapGraph.from_records(synthetic_records(options.objects))
+    graph.referrers(0)
+    return measure(lambda: DominatorTree(graph).type_retained(),
+                   options.repeat), dict(objects=options.objects)
+
+
+##
+## Reporting
+##
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.STDOUT,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    print('\n%-25s %12s %12s %8s' % ('benchmark', 'baseline', 'current',
+                                     'change'))
+    for name, result in sorted(results['benchmarks'].items()):
+        before = baseline['benchmarks'].get(name, {})
+        if 'median' not in result or 'median' not in before:
+            continue
+        change = (result['median'] - before['median']) / before['median']
+        print('%-25s %11.4fs %11.4fs %+7.1f%%' % (
+            name, before['median'], result['median'], change * 100))
+
+
+def main():
+    parser = OptionParser(usage='%prog [options] [benchmark ...]')
+    parser.add_option('-o', '--output', help='write JSON results to a file')
+    parser.add_option('-c', '--compare', help='compare with a JSON result')
+    parser.add_option('-r', '--repeat', type='int', default=5)
+    parser.add_option('--processes', type='int', default=50)
+    parser.add_option('--threads', type='int', default=200)
+    parser.add_option('--files', type='int', default=500)
+    parser.add_option('--sockets', type='int', default=500)
+    parser.add_option('--depth', type='int', default=30)
+    parser.add_option('--objects', type='int', default=100000)
+    options, names = parser.parse_args()
+
+    results = dict(revision=git_revision(), time=time.time(),
+                   python=platform.python_version(),
+                   platform=platform.platform(), benchmarks={})
+    for func in BENCHMARKS:
+        if names and func.__name__ not in names:
+            continue
+        try:
+            timing, params = func(options)
+            timing['params'] = params
+            print('%-25s %10.4fs (min %.4fs)' % (
+                func.__name__, timing['median'], timing['min']))
+        except Skip as e:
+            timing = dict(skipped=str(e))
+            print('%-25s skipped: %s' % (func.__name__, e))
+        results['benchmarks'][func.__name__] = timing
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if options.compare:
+        with open(options.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+"""
+A standalone agent that lets pyrasite-gui analyze processes on another host.
+
+Run it on the server, next to the processes to inspect::
+
+    pyrasite-agent
+    pyrasite-agent unix:/run/pyrasite-agent.sock
+
+By default it only listens on tcp:127.0.0.1:7766; reach it over an SSH
+tunnel, or give it a UNIX socket that only trusted users can open.  There
+is no authentication, and anyone who can connect can inject code into
+every process the agent's user can trace, so never listen on a public
+address.
+
+Every message in either direction is a frame: a 4 byte big-endian length
+followed by zlib compressed JSON.  Requests look like
+``{"id": 1, "op": "profile", "args": {"pids": [...]}}`` and are answered
+with ``{"id": 1, "result": ...}`` or ``{"id": 1, "error": "..."}``.  The
+`watch` op keeps streaming ``{"id": n, "result": metrics}`` frames until
+the connection is closed.
+
+Results are aggregated on the agent, so only summaries cross the wire:
+stacks are deduplicated, profiles are merged folded stacks, and heap
+summaries are per-type totals.
+"""
+
+import os
+import sys
+import json
+import zlib
+import time
+import socket
+import struct
+import logging
+import threading
+
+try:
+    import socketserver
+except ImportError:  # Python 2
+    import SocketServer as socketserver
+
+log = logging.getLogger('pyrasite')
+
+DEFAULT_PORT = 7766
+MAX_FRAME = 64 << 20
+HEADER = struct.Struct('>I')
+
+
+class AgentError(Exception):
+    pass
+
+
+def send_frame(sock, message):
+    data = zlib.compress(json.dumps(message).encode('utf-8'))
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 16))
+        if not chunk:
+            raise EOFError('Connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_frame(sock):
+    size, = HEADER.unpack(recv_exactly(sock, HEADER.size))
+    if size > MAX_FRAME:
+        raise AgentError('Frame of %d bytes is too large' % size)
+    return json.loads(zlib.decompress(recv_exactly(sock, size)).decode('utf-8'))
+
+
+def parse_address(address):
+    """Turn ``tcp:host:port``, ``host:port`` or ``unix:path`` into a
+    (socket family, address) pair"""
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+    if address.startswith('tcp:'):
+        address = address[len('tcp:'):]
+    host, _, port = address.rpartition(':')
+    if not host:
+        host, port = port, DEFAULT_PORT
+    return socket.AF_INET, (host, int(port))
+
+
+##
+## Server
+##
+
+class Agent(object):
+    """The operations an agent exposes, keyed by name"""
+
+    def __init__(self):
+        self.targets = {}  # pid -> (TargetProcess, lock)
+        self.lock = threading.Lock()
+
+    def target(self, pid):
+        """Return the :class:`TargetProcess` for `pid` and the lock that
+        requests to it take turns holding"""
+        with self.lock:
+            if pid not in self.targets:
+                from pyrasite_gui.ipc import TargetProcess
+                self.targets[pid] = (TargetProcess(pid), threading.Lock())
+            return self.targets[pid]
+
+    def call(self, pid, func):
+        """Return `func(target)`, injecting into the target first if needed.
+        Only requests to the same target wait for each other."""
+        target, lock = self.target(pid)
+        with lock:
+            try:
+                if target.sock is None:
+                    target.connect()
+                return func(target)
+            except socket.error:
+                self.drop(pid, target)
+                raise
+
+    def drop(self, pid, target):
+        """Forget a target whose connection failed"""
+        with self.lock:
+            if self.targets.get(pid, (None,))[0] is target:
+                del self.targets[pid]
+        target.close()
+
+    def fan_out(self, func, pids):
+        from pyrasite_gui.fleet import FanOut
+        pool = FanOut(lambda pid: self.call(pid, func), pids)
+        while not pool.finished():
+            time.sleep(0.05)
+        errors = dict((pid, str(e)) for pid, e in pool.errors.items())
+        return pool.results, errors
+
+    def op_processes(self):
+        import psutil
+        from pyrasite_gui.ipc import is_python_process
+        found = []
+        for process in psutil.process_iter():
+            if process.pid == os.getpid():
+                continue
+            try:
+                if is_python_process(process):
+                    found.append(dict(pid=process.pid,
+                                      title=' '.join(process.cmdline()),
+                                      username=process.username()))
+            except (psutil.AccessDenied, psutil.NoSuchProcess):
+                pass
+        return found
+
+    def op_metrics(self, pids, processes):
+        """
+        Return resource usage of `pids`.  `processes` caches the
+        :class:`psutil.Process` objects of one connection, so its CPU
+        percentages are measured since that client last asked.
+        """
+        import psutil
+        for pid in set(processes) - set(pids):
+            del processes[pid]
+        metrics = {}
+        for pid in pids:
+            try:
+                process = processes.get(pid)
+                if process is None:
+                    process = processes[pid] = psutil.Process(pid)
+                with process.oneshot():
+                    meminfo = process.memory_info()
+                    metrics[pid] = dict(
+                        cpu=process.cpu_percent(interval=None),
+                        rss=meminfo.rss, vms=meminfo.vms,
+                        threads=process.num_threads(),
+                        files=len(process.open_files()),
+                        connections=len(process.connections()))
+            except (psutil.AccessDenied, psutil.NoSuchProcess) as e:
+                processes.pop(pid, None)
+                metrics[pid] = dict(error=str(e))
+        return metrics
+
+    def op_stacks(self, pids):
+        from pyrasite_gui.fleet import merge_stacks
+        dumps, errors = self.fan_out(lambda target: target.dump_stacks(),
+                                     pids)
+        return dict(stacks=merge_stacks(dumps), errors=errors)
+
+    def op_profile(self, pids, duration=1.0):
+        from pyrasite_gui.profiles import merge
+        results, errors = self.fan_out(
+            lambda target: target.wait_payload('sampler', 'sample',
+                                               duration=duration), pids)
+        profile = merge(results.values())
+        profile['errors'] = errors
+        return profile
+
+    def op_heap_summary(self, pids):
+        from pyrasite_gui.fleet import merge_summaries
+        results, errors = self.fan_out(
+            lambda target: target.wait_payload('type_summary', 'summary'),
+            pids)
+        return dict(summary=merge_summaries(results), errors=errors)
+
+    def handle(self, request, state=None):
+        """Run a request, with `state` kept for the connection it came on"""
+        func = getattr(self, 'op_' + request.get('op', ''), None)
+        if func is None:
+            raise AgentError('Unknown operation %r' % request.get('op'))
+        args = dict(request.get('args', {}))
+        if request.get('op') == 'metrics':
+            if state is None:
+                state = {}
+            args['processes'] = state.setdefault('processes', {})
+        return func(**args)
+
+    def close(self):
+        for target, lock in list(self.targets.values()):
+            target.close()
+
+
+class AgentHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        agent = self.server.agent
+        state = {}  # Only seen by this connection's requests
+        while True:
+            try:
+                request = recv_frame(self.request)
+            except EOFError:
+                return
+            if request.get('op') == 'watch':
+                return self.watch(agent, request, state)
+            try:
+                response = dict(id=request.get('id'),
+                                result=agent.handle(request, state))
+            except Exception as e:
+                log.exception('%s failed' % request.get('op'))
+                response = dict(id=request.get('id'), error=str(e))
+            send_frame(self.request, response)
+
+    def watch(self, agent, request, state):
+        """Stream metrics for the given pids until the client goes away"""
+        args = request.get('args', {})
+        interval = args.get('interval', 1.0)
+        processes = state.setdefault('processes', {})
+        try:
+            while True:
+                send_frame(self.request, dict(
+                    id=request.get('id'),
+                    result=agent.op_metrics(args.get('pids', []),
+                                            processes)))
+                time.sleep(interval)
+        except socket.error:
+            return
+
+
+class ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, 'UnixStreamServer'):
+    class ThreadingUnixServer(socketserver.ThreadingMixIn,
+                              socketserver.UnixStreamServer):
+        daemon_threads = True
+
+
+def serve(address, agent=None):
+    """Return a server for `address`; call `serve_forever()` to run it"""
+    family, address = parse_address(address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(address):
+            os.unlink(address)
+        server = ThreadingUnixServer(address, AgentHandler)
+    else:
+        server = ThreadingTCPServer(address, AgentHandler)
+    server.agent = agent or Agent()
+    return server
+
+
+##
+## Client
+##
+
+class AgentClient(object):
+    """A connection from the GUI to one agent"""
+
+    def __init__(self, address, timeout=120):
+        self.address = address
+        self.timeout = timeout
+        self.sock = self.connect()
+        self.lock = threading.Lock()
+        self.next_id = 0
+
+    def connect(self):
+        family, address = parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(address)
+        return sock
+
+    def request(self, op, **args):
+        with self.lock:
+            self.next_id += 1
+            send_frame(self.sock, dict(id=self.next_id, op=op, args=args))
+            response = recv_frame(self.sock)
+        if 'error' in response:
+            raise AgentError(response['error'])
+        return response['result']
+
+    def watch(self, pids, interval=1.0):
+        """Yield metrics for `pids` as the agent streams them"""
+        sock = self.connect()
+        try:
+            send_frame(sock, dict(id=0, op='watch',
+                                  args=dict(pids=pids, interval=interval)))
+            while True:
+                yield recv_frame(sock)['result']
+        finally:
+            sock.close()
+
+    def close(self):
+        self.sock.close()
+
+
+def main():
+    logging.basicConfig(level='-v' in sys.argv and logging.DEBUG
+                        or logging.INFO)
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('-')]
+    address = args and args[0] or 'tcp:127.0.0.1:%d' % DEFAULT_PORT
+    server = serve(address)
+    log.info('pyrasite agent listening on %s' % address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.agent.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+"""
+Captures: analysis results saved as JSON so they outlive the GUI session,
+such as the bundles taken when a trigger fires and call graph profiles.
+
+Each capture is one file named after its kind, process and creation time.
+Its ``kind``, ``pid``, ``title``, ``created`` and ``reason`` keys describe
+it in listings; the rest depends on the kind.
+"""
+
+from __future__ import division
+
+import os
+import json
+import time
+import logging
+
+from pyrasite_gui.heap_index import CACHE_DIR
+
+log = logging.getLogger('pyrasite')
+
+CAPTURE_DIR = os.path.join(CACHE_DIR, 'captures')
+MAX_CAPTURES = 200  # per kind; older captures are pruned
+
+
+def save(kind, capture, directory=CAPTURE_DIR, keep=MAX_CAPTURES):
+    """Write `capture` as a new capture of `kind`, returning its path"""
+    capture = dict(capture, kind=kind,
+                   created=capture.get('created', time.time()))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    path = os.path.join(directory, '%s-%s-%d.json' % (
+        kind, capture.get('pid', 0), capture['created'] * 1000))
+    with open(path + '.tmp', 'w') as f:
+        json.dump(capture, f)
+    os.rename(path + '.tmp', path)
+    prune(kind, directory, keep)
+    return path
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def paths(kind=None, directory=CAPTURE_DIR):
+    """Return the paths of captures, of one kind or all, newest first"""
+    if not os.path.isdir(directory):
+        return []
+    found = []
+    for name in os.listdir(directory):
+        if not name.endswith('.json'):
+            continue
+        parts = name[:-5].rsplit('-', 2)
+        if len(parts) != 3 or kind is not None and parts[0] != kind:
+            continue
+        try:
+            found.append((int(parts[2]), os.path.join(directory, name)))
+        except ValueError:
+            continue
+    return [path for created, path in sorted(found, reverse=True)]
+
+
+def captures(kind=None, directory=CAPTURE_DIR):
+    """Return (path, capture) pairs, newest first, skipping unreadable
+    files"""
+    found = []
+    for path in paths(kind, directory):
+        try:
+            found.append((path, load(path)))
+        except (IOError, ValueError) as e:
+            log.debug('Skipping capture %s: %s' % (path, e))
+    return found
+
+
+def prune(kind, directory=CAPTURE_DIR, keep=MAX_CAPTURES):
+    for path in paths(kind, directory)[keep:]:
+        try:
+            os.unlink(path)
+        except OSError as e:
+            log.debug('Unable to prune %s: %s' % (path, e))
+
+
+def describe(capture):
+    return '%s (%s) %s: %s' % (
+        capture.get('title', '?'), capture.get('pid', '?'),
+        time.strftime('%Y-%m-%d %H:%M:%S',
+                      time.localtime(capture['created'])),
+        capture.get('reason', capture['kind']))
@@ -0,0 +1,280 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+"""
+Streaming exporters for profiles and heap snapshots.
+
+Each writer takes an open file and writes the document a record at a time,
+so large captures are never rendered into one string.  Profile writers take
+a folded-stack profile as described in :mod:`pyrasite_gui.profiles`; heap
+writers take the summary rows stored with a snapshot or a loaded
+:class:`~pyrasite_gui.heap.HeapGraph`.
+
+`PROFILE_FORMATS` and `HEAP_FORMATS` map a format name to its description,
+file suffix, whether it is binary, and writer.
+"""
+
+import io
+import os
+import re
+import csv
+import gzip
+import json
+
+FRAME = re.compile(r'^(.*) \((.*):(\d+)\)$')
+
+SUMMARY_FIELDS = ('address', 'count', 'count_percent', 'size',
+                  'size_percent', 'cumulative_percent', 'largest', 'type')
+OBJECT_FIELDS = ('address', 'type', 'size', 'retained', 'referents')
+
+
+def parse_frame(frame):
+    """Split a folded frame into (function, filename, first line)"""
+    match = FRAME.match(frame)
+    if match is None:
+        return frame, '', 0
+    name, filename, line = match.groups()
+    return name, filename, int(line)
+
+
+class Interner(object):
+    """Assign consecutive ids to values as they are first seen"""
+
+    def __init__(self, first=0):
+        self.ids = {}
+        self.values = []
+        self.first = first
+
+    def __call__(self, value):
+        found = self.ids.get(value)
+        if found is None:
+            found = self.ids[value] = len(self.values) + self.first
+            self.values.append(value)
+        return found
+
+
+##
+## Profiles
+##
+
+def write_folded(profile, out, name=None):
+    """Brendan Gregg's folded stacks, as read by flamegraph.pl"""
+    for stack, count in profile['stacks'].items():
+        out.write(u'%s %d\n' % (stack, count))
+
+
+def write_speedscope(profile, out, name='profile'):
+    """A speedscope sampled profile"""
+    frames = Interner()
+    stacks = profile['stacks']
+    out.write(u'{"$schema": "https://www.speedscope.app/'
+              u'file-format-schema.json", "exporter": "pyrasite-gui", '
+              u'"name": %s, "activeProfileIndex": 0, "profiles": [{'
+              u'"type": "sampled", "name": %s, "unit": "none", '
+              u'"startValue": 0, "endValue": %d, "samples": [' % (
+                  json.dumps(name), json.dumps(name),
+                  sum(stacks.values())))
+    separator = u''
+    for stack in stacks:
+        out.write(separator + json.dumps(
+            [frames(frame) for frame in stack.split(';')]))
+        separator = u', '
+    out.write(u'], "weights": [')
+    out.write(u', '.join(u'%d' % count for count in stacks.values()))
+    out.write(u']}], "shared": {"frames": [')
+    separator = u''
+    for frame in frames.values:
+        function, filename, line = parse_frame(frame)
+        out.write(separator + json.dumps(
+            dict(name=function, file=filename, line=line)))
+        separator = u', '
+    out.write(u']}}\n')
+
+
+def write_callgrind(profile, out, name='profile'):
+    """
+    Callgrind output for KCachegrind.  Costs are attributed to each
+    function's first line, as that is all a folded stack records.
+    """
+    own = {}
+    calls = {}  # (caller, callee) -> inclusive samples
+    for stack, count in profile['stacks'].items():
+        frames = stack.split(';')
+        own[frames[-1]] = own.get(frames[-1], 0) + count
+        # Recursion must not count a sample twice for the same edge
+        for edge in set(zip(frames, frames[1:])):
+            calls[edge] = calls.get(edge, 0) + count
+    callees = {}
+    for (caller, callee), count in calls.items():
+        callees.setdefault(caller, []).append((callee, count))
+
+    files = Interner(1)
+    functions = Interner(1)
+
+    def compressed(interner, value):
+        if value in interner.ids:
+            return u'(%d)' % interner(value)
+        return u'(%d) %s' % (interner(value), value)
+
+    out.write(u'# callgrind format\nversion: 1\ncreator: pyrasite-gui\n'
+              u'cmd: %s\npositions: line\nevents: Samples\nsummary: %d\n' % (
+                  name, profile['samples']))
+    for frame in set(own) | set(callees):
+        function, filename, line = parse_frame(frame)
+        out.write(u'\nfl=%s\nfn=%s\n%d %d\n' % (
+            compressed(files, filename), compressed(functions, frame), line,
+            own.get(frame, 0)))
+        for callee, count in callees.get(frame, ()):
+            callee_name, callee_file, callee_line = parse_frame(callee)
+            out.write(u'cfi=%s\ncfn=%s\ncalls=%d %d\n%d %d\n' % (
+                compressed(files, callee_file), compressed(functions, callee),
+                count, callee_line, line, count))
+
+
+def varint(value):
+    """Encode an unsigned protobuf varint"""
+    encoded = bytearray()
+    while value > 0x7f:
+        encoded.append(value & 0x7f | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def field(number, payload):
+    """A length-delimited protobuf field"""
+    return varint(number << 3 | 2) + varint(len(payload)) + payload
+
+
+def number(field_number, value):
+    """A varint protobuf field"""
+    return varint(field_number << 3) + varint(value)
+
+
+def write_pprof(profile, out, name=None):
+    """
+    A gzipped pprof protobuf, as read by `go tool pprof`.  Messages are
+    written as they are produced; protobuf allows repeated fields to be
+    interleaved, so the locations, functions and string table follow the
+    samples.
+    """
+    strings = Interner()
+    strings(u'')
+    locations = Interner(1)  # one location, and function, per frame
+    stream = gzip.GzipFile(fileobj=out, mode='wb')
+    try:
+        stream.write(field(1, number(1, strings(u'samples')) +
+                           number(2, strings(u'count'))))
+        for stack, count in profile['stacks'].items():
+            ids = b''.join(varint(locations(frame))
+                           for frame in reversed(stack.split(';')))
+            stream.write(field(2, field(1, ids) + field(2, varint(count))))
+        for frame in locations.values:
+            location = locations.ids[frame]
+            function, filename, line = parse_frame(frame)
+            stream.write(field(4, number(1, location) + field(
+                4, number(1, location) + number(2, line))))
+            stream.write(field(5, number(1, location) +
+                               number(2, strings(function)) +
+                               number(3, strings(frame)) +
+                               number(4, strings(filename)) +
+                               number(5, line)))
+        for value in strings.values:
+            stream.write(field(6, value.encode('utf-8')))
+    finally:
+        stream.close()
+
+
+PROFILE_FORMATS = (
+    ('speedscope', 'Speedscope JSON', '.speedscope.json', False,
+     write_speedscope),
+    ('pprof', 'pprof protobuf', '.pb.gz', True, write_pprof),
+    ('callgrind', 'Callgrind', '.callgrind', False, write_callgrind),
+    ('folded', 'Folded stacks', '.folded', False, write_folded),
+)
+
+
+##
+## Heap snapshots
+##
+
+def write_summary_csv(rows, out):
+    """Per-type summary rows, as stored with a snapshot"""
+    writer = csv.writer(out)
+    writer.writerow(SUMMARY_FIELDS)
+    for row in rows:
+        writer.writerow(row)
+
+
+def write_summary_jsonl(rows, out):
+    for row in rows:
+        out.write(u'%s\n' % json.dumps(dict(zip(SUMMARY_FIELDS, row))))
+
+
+def objects(graph, dominators=None):
+    """Yield an (address, type, size, retained, referents) row per object"""
+    addresses = graph.addresses
+    for i in range(len(graph)):
+        yield (addresses[i], graph.type_name(i), graph.sizes[i],
+               dominators.retained[i] if dominators is not None else -1,
+               [addresses[j] for j in graph.referents(i)])
+
+
+def write_objects_csv(graph, out, dominators=None):
+    """Every object, with referents as space separated addresses"""
+    writer = csv.writer(out)
+    writer.writerow(OBJECT_FIELDS)
+    for row in objects(graph, dominators):
+        writer.writerow(row[:-1] + (' '.join('%d' % address
+                                             for address in row[-1]),))
+
+
+def write_objects_jsonl(graph, out, dominators=None):
+    for row in objects(graph, dominators):
+        out.write(u'%s\n' % json.dumps(dict(zip(OBJECT_FIELDS, row))))
+
+
+HEAP_FORMATS = (
+    ('summary-csv', 'Type summary CSV', '.summary.csv', False,
+     write_summary_csv),
+    ('summary-jsonl', 'Type summary JSON lines', '.summary.jsonl', False,
+     write_summary_jsonl),
+    ('objects-csv', 'All objects CSV', '.objects.csv', False,
+     write_objects_csv),
+    ('objects-jsonl', 'All objects JSON lines', '.objects.jsonl', False,
+     write_objects_jsonl),
+)
+
+
+def export(path, binary, writer, *args, **kw):
+    """
+    Call `writer(*args, out, **kw)` on a temporary file next to `path`,
+    renaming it into place only once the export is complete.
+    """
+    partial = path + '.part'
+    if binary:
+        out = open(partial, 'wb')
+    else:
+        out = io.open(partial, 'w', encoding='utf-8', newline='')
+    try:
+        with out:
+            writer(*(args + (out,)), **kw)
+        os.rename(partial, path)
+    except Exception:
+        if os.path.exists(partial):
+            os.unlink(partial)
+        raise
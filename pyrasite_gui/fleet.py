@@ -0,0 +1,139 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+"""
+Fan analysis operations out to many processes and merge what comes back.
+"""
+
+from __future__ import division
+
+import re
+import logging
+import threading
+from collections import defaultdict
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+log = logging.getLogger('pyrasite')
+
+WORKERS = 8
+
+THREAD_HEADER = re.compile(r'^Thread (0x[0-9a-f]+|\d+)', re.M)
+
+
+class FanOut(object):
+    """
+    Run `func(item)` for every item on a bounded pool of worker threads.
+
+    Poll :attr:`done` from the GUI thread while the workers run; once
+    :meth:`finished` is true, :attr:`results` maps each item to its return
+    value and :attr:`errors` maps failed items to their exception.
+    """
+
+    def __init__(self, func, items, workers=WORKERS):
+        self.func = func
+        self.items = list(items)
+        self.results = {}
+        self.errors = {}
+        self.done = 0
+        self.lock = threading.Lock()
+        self.pending = queue.Queue()
+        for item in self.items:
+            self.pending.put(item)
+        self.threads = [threading.Thread(target=self.work)
+                        for i in range(min(workers, len(self.items)))]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def work(self):
+        while True:
+            try:
+                item = self.pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                result = self.func(item)
+                with self.lock:
+                    self.results[item] = result
+            except Exception as e:
+                log.debug('Fan out to %r failed: %s' % (item, e))
+                with self.lock:
+                    self.errors[item] = e
+            with self.lock:
+                self.done += 1
+
+    def finished(self):
+        return self.done == len(self.items)
+
+    @property
+    def progress(self):
+        if not self.items:
+            return 1.0
+        return self.done / len(self.items)
+
+
+def split_stacks(dump):
+    """Split `dump_stacks` output into a list of per-thread stacks"""
+    headers = list(THREAD_HEADER.finditer(dump))
+    stacks = []
+    for i, header in enumerate(headers):
+        end = i + 1 < len(headers) and headers[i + 1].start() or len(dump)
+        stack = dump[header.end():end].strip('\n')
+        stacks.append(stack)
+    return stacks
+
+
+def merge_stacks(dumps):
+    """
+    Deduplicate thread stacks across processes.
+
+    `dumps` maps a process id to its `dump_stacks` output.  Returns a list
+    of (stack, thread count, sorted pids) tuples, most common first.
+    """
+    threads = defaultdict(int)
+    pids = defaultdict(set)
+    for pid, dump in dumps.items():
+        for stack in split_stacks(dump):
+            threads[stack] += 1
+            pids[stack].add(pid)
+    return sorted(((stack, count, sorted(pids[stack]))
+                   for stack, count in threads.items()),
+                  key=lambda merged: (-merged[1], merged[0]))
+
+
+def merge_summaries(summaries):
+    """
+    Union per-process object summaries.
+
+    `summaries` maps a process id to a {type: [count, size]} dict.  Returns
+    a list of (type, count, size, {pid: (count, size)}) tuples, largest
+    first.
+    """
+    merged = {}
+    for pid, summary in summaries.items():
+        for kind, (count, size) in summary.items():
+            totals = merged.setdefault(kind, [0, 0, {}])
+            totals[0] += count
+            totals[1] += size
+            totals[2][pid] = (count, size)
+    return sorted(((kind, count, size, breakdown)
+                   for kind, (count, size, breakdown) in merged.items()),
+                  key=lambda merged: -merged[2])
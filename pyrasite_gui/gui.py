@@ -23,45 +23,111 @@
 from __future__ import division
 
 import os
+import re
 import sys
 import site
 import time
 import json
 import socket
-import psutil
 import logging
+import bisect
 import keyword
-import platform
 import tempfile
+import textwrap
 import tokenize
 import threading
 import subprocess
 from functools import partial
+from collections import Counter, deque
 from os.path import join, abspath, dirname
 from random import randrange
+
+
+class StartupTimer(object):
+    """Records how long each phase of startup takes"""
+
+    def __init__(self):
+        self.enabled = '--startup-times' in sys.argv
+        self.start = self.last = time.time()
+        self.marks = []
+
+    def mark(self, name):
+        now = time.time()
+        self.marks.append((name, now - self.last))
+        self.last = now
+
+    def report(self):
+        if self.enabled:
+            for name, elapsed in self.marks:
+                print('%-30s %7.3fs' % (name, elapsed))
+            print('%-30s %7.3fs' % ('total', self.last - self.start))
+
+startup = StartupTimer()
+
+import psutil
+startup.mark('import psutil')
 try:
-    import meliae
-    from meliae import loader
-except:
-    meliae, loader = None, None
-    print("Unable to import meliae. Object memory analysis disabled.")
-try:
-    from gi.repository import GLib, GObject, Pango, Gtk, WebKit
+    from gi.repository import GLib, GObject, Pango, Gdk, Gtk
 except ImportError:
     print("Unable to find pygobject3. Please install the 'pygobject3' ")
     print("package on Fedora, or 'python-gobject-dev' on Ubuntu.")
     sys.exit(1)
+startup.mark('import gtk')
 
 import pyrasite
 
+from pyrasite_gui.heap import HeapGraph, DominatorTree
+from pyrasite_gui.timing import Histogram, timings, timed
+from pyrasite_gui import agent, captures, exporters, fleet, heap_index, \
+    memory, profiles, remote_sampler, triggers
+from pyrasite_gui.ipc import PayloadMixin, PayloadError, is_python_process
+startup.mark('import pyrasite')
+
 log = logging.getLogger('pyrasite')
 
+# Loaded on first use by import_webkit() and import_loader()
+WebKit = None
+loader = None
+graphviz = None  # path to `dot`, or False if unavailable
+
 POLL_INTERVAL = 1.0
 INTERVALS = 200
+THREAD_REFRESH = 5.0  # seconds between fetching thread names & frames
+FILES_INTERVAL = 5.0  # default seconds between open file scans
+CONNECTIONS_INTERVAL = 5.0  # default seconds between connection scans
+ROLLUP_INTERVAL = 5.0  # seconds between PSS/USS totals from smaps_rollup
+SMAPS_INTERVAL = 60.0  # seconds between full smaps breakdowns
+GROWTH_INTERVAL = 10.0  # seconds between fleet memory growth samples
+BULK_UPDATE = 1000  # detach list views when applying larger diffs
+INSTANCE_LIMIT = 100
+
+HEAP_DUMP_BUDGET = dict(cpu_budget=30.0, wall_budget=600.0, duty_cycle=0.25)
+BLOAT_BUDGET = dict(cpu_budget=20.0, wall_budget=300.0, duty_cycle=0.25)
+SATURATION_THRESHOLD = 95.0  # target CPU % treated as saturated
+SATURATION_SAMPLES = 3  # consecutive saturated samples before aborting
+IO_PROFILE_DURATION = 300.0  # the target unpatches itself after this long
+IO_PROFILE_REFRESH = 1.0
+TASKS_INTERVAL = 2.0  # default seconds between asyncio task snapshots
+LOCK_PROFILE_DURATION = 300.0  # the target unpatches itself after this long
+REMOTE_SAMPLE_INTERVAL = 0.002  # seconds between out of process samples
+MALLOC_INTERVAL = 10.0  # seconds between allocator statistics
+JOB_INTERVAL = 0.25  # seconds between polls of a job running in the target
+INSPECT_PAGE = 100  # children fetched each time a browser row is expanded
+INSPECT_ROOTS = 20  # shell results kept alive in the target for browsing
+TRIGGER_PROFILE_DURATION = 2.0  # seconds sampled when a trigger fires
+TRIGGER_BUDGET = dict(cpu_budget=1.0, wall_budget=15.0, duty_cycle=0.25)
+# (metric, enabled, threshold, seconds) defaults for the Triggers list
+TRIGGER_DEFAULTS = (('cpu', True, 90, 60), ('rss_growth', False, 1024, 120),
+                    ('threads', False, 200, 30),
+                    ('connections', False, 1000, 30))
+HEAT_LEVELS = (1.0, 5.0, 15.0, 40.0)  # % of the function's time per tag
+STACK_LINE = re.compile(r'File "(.+)", line (\d+), in (\S+)')
 cpu_intervals = []
 cpu_details = ''
 mem_intervals = []
 mem_details = ''
+frag_intervals = []  # pymalloc fragmentation %, while watching the allocator
+frag_details = ''
 write_intervals = []
 read_intervals = []
 read_count = read_bytes = write_count = write_bytes = 0
@@ -71,12 +137,38 @@ process_status = ''
 thread_intervals = {}
 thread_colors = {}
 thread_totals = {}
-
-open_connections = []
-open_files = []
-
-
-class Process(pyrasite.PyrasiteIPC, GObject.GObject):
+live_threads = set()
+thread_names = {}  # native thread id -> dict(ident, name, frame)
+
+# Incremental (added rows, removed keys) batches from ResourceUsagePoller,
+# with None meaning everything before it belonged to the previous process
+connection_changes = deque()
+file_changes = deque()
+
+# Cached smaps readings, shared by ResourceUsagePoller and the fleet view
+rollups = memory.MemoryCache(memory.read_rollup, ROLLUP_INTERVAL)
+breakdowns = memory.MemoryCache(memory.read_smaps, SMAPS_INTERVAL)
+mem_rollup = {}  # rss, pss, uss, shared and swap of the selected process
+mem_breakdown = {}  # the same, per memory.CATEGORIES
+
+# Recent metrics of the selected process, for triggers to look back over
+metric_history = triggers.MetricHistory(interval=POLL_INTERVAL)
+
+
+# Lists the target's threads as [ident, native_id, name, top frame] JSON.
+THREAD_INFO_CMD = '\n'.join([
+    'import sys, json, threading',
+    'frames = sys._current_frames()',
+    'threads = []',
+    'for t in threading.enumerate():',
+    '    f = frames.get(t.ident)',
+    '    top = f and "%s:%d in %s" % (f.f_code.co_filename, f.f_lineno,',
+    '                                 f.f_code.co_name) or ""',
+    '    threads.append([t.ident, getattr(t, "native_id", None), t.name, top])',
+    'print(json.dumps(threads))'])
+
+
+class Process(PayloadMixin, pyrasite.PyrasiteIPC, GObject.GObject):
     """
     A :class:`GObject.GObject` subclass that represents a Process, for use in
     the :class:`ProcessTreeStore`
@@ -86,36 +178,25 @@ class Process(pyrasite.PyrasiteIPC, GObject.GObject):
 class ProcessListStore(Gtk.ListStore):
     """This TreeStore finds all running python processes."""
 
-    def __init__(self, *args):
+    def __init__(self, *args, **kw):
         Gtk.ListStore.__init__(self, str, Process, Pango.Style)
+        if not kw.get('incremental'):
+            for found in self.discover():
+                pass
+
+    def discover(self):
+        """Add python processes to the store, yielding after each one"""
         for process in psutil.process_iter():
             pid = process.pid
             if pid != os.getpid():  # ignore self
                 try:
-                    if 'python' in process.name().lower() or self._check_for_python_lib(process, pid):
+                    if is_python_process(process):
                         proc = Process(pid)
                         self.append(("%s: %s" % (pid, proc.title.strip()), proc, Pango.Style.NORMAL))
 
-                except psutil.AccessDenied:
+                except (psutil.AccessDenied, psutil.NoSuchProcess):
                     pass
-
-    def _check_for_python_lib(self, process, pid):
-        if platform.system() == 'Windows':
-            # psutils.open_files often doesn't show loaded system libraries on windows
-            try:
-                import win32api, win32con, win32process
-                handle = win32api.OpenProcess(win32con.PROCESS_ALL_ACCESS, False, pid)
-                for fhandle in win32process.EnumProcessModules(handle):
-                    if 'python' in win32process.GetModuleFileNameEx(handle, fhandle).lower():
-                        return True
-            except:  # Can't inspect process, ignore
-                pass
-        else:
-            open_files = process.open_files()
-            if any(('python' in lib.path.lower() for lib in open_files)):
-                return True
-
-        return False
+            yield process
 
 
 class PyrasiteWindow(Gtk.Window):
@@ -126,6 +207,26 @@ class PyrasiteWindow(Gtk.Window):
         self.processes = {}
         self.pid = None  # Currently selected pid
         self.resource_thread = None
+        self.thread_names_fetched = 0
+        self.thread_names_seen = set()  # tids looked up, with a name or not
+        self.listing_threads = False
+        self.heap_graph = None
+        self.dominators = None
+        self.dominators_building = None  # heap graph being analyzed
+        self.snapshot_path = None  # heap_index snapshot of heap_graph
+        # Only read the targets' memory, never run code in them
+        self.no_inject = '--no-inject' in sys.argv
+        self.remote_samplers = {}  # pid -> RemoteSampler
+        self.lazy_pages = {}  # placeholder page -> function building it
+        # Profilers and analyses of the pages that are built when first shown
+        self.io_watch = None  # (process,) for the running refresh timer
+        self.tasks_watch = None  # (process,) for the running refresh timer
+        self.locks_proc = None  # The process with the lock profiler running
+        self.lines_watch = None
+        self.bloat_watch = None
+        self.modules_watch = None
+        self.profile_choices_stale = True  # listed when the tab is shown
+        self.profile_paths = []
 
         self.set_title('Pyrasite v%s' % pyrasite.__version__)
         self.set_default_size(1024, 600)
@@ -142,37 +243,125 @@ class PyrasiteWindow(Gtk.Window):
         main_vbox.pack_start(notebook, True, True, 0)
         self.progress = Gtk.ProgressBar()
         main_vbox.pack_end(self.progress, False, False, 0)
+        self.overhead_label = Gtk.Label()
+        self.overhead_label.set_alignment(0, 0.5)
+        main_vbox.pack_end(self.overhead_label, False, False, 0)
         hbox.pack_start(main_vbox, True, True, 0)
 
+        # The WebKit views are created by create_web_views() on first use
         self.info_html = ''
-        self.info_view = WebKit.WebView()
-        self.info_view.load_string(self.info_html, "text/html", "utf-8", '#')
+        self.info_view = None
+        self.jquery_js = None
 
-        info_window = Gtk.ScrolledWindow(hadjustment=None, vadjustment=None)
+        self.info_window = info_window = Gtk.ScrolledWindow(hadjustment=None,
+                                                            vadjustment=None)
         info_window.set_policy(Gtk.PolicyType.AUTOMATIC,
                                Gtk.PolicyType.AUTOMATIC)
-        info_window.add(self.info_view)
-        notebook.append_page(info_window,
+
+        # Per-thread CPU usage, joined with the target's thread names
+        self.thread_tree = thread_tree = Gtk.TreeView()
+        self.thread_store = thread_store = Gtk.ListStore(int, str, float,
+                                                         str, str, str)
+        thread_tree.set_model(thread_store)
+        thread_tree.get_selection().set_mode(Gtk.SelectionMode.BROWSE)
+        swatch = Gtk.TreeViewColumn(title='',
+                                    cell_renderer=Gtk.CellRendererText(),
+                                    background=4)
+        thread_tree.append_column(swatch)
+        for i, title in ((0, 'TID'), (1, 'Name'), (2, 'CPU %'),
+                         (3, 'Current frame')):
+            column = Gtk.TreeViewColumn(title=title,
+                                        cell_renderer=Gtk.CellRendererText(),
+                                        text=i)
+            column.set_sort_column_id(i)
+            thread_tree.append_column(column)
+        thread_store.set_sort_column_id(2, Gtk.SortType.DESCENDING)
+        thread_tree.connect('row_activated', self.thread_row_activated_cb,
+                            thread_store)
+
+        thread_window = Gtk.ScrolledWindow(hadjustment=None, vadjustment=None)
+        thread_window.set_policy(Gtk.PolicyType.AUTOMATIC,
+                                 Gtk.PolicyType.AUTOMATIC)
+        thread_window.add(thread_tree)
+
+        resource_lists = Gtk.Notebook()
+        resource_lists.append_page(thread_window, Gtk.Label('Threads'))
+
+        (files_widget, self.files_view, self.files_store,
+         self.files_summary) = self.create_filtered_list((('Path', str, 500),
+                                                          ('FD', int, 60)))
+        resource_lists.append_page(files_widget, Gtk.Label('Open Files'))
+        self.file_rows = {}
+        self.file_dirs = Counter()
+
+        (conns_widget, self.conns_view, self.conns_store,
+         self.conns_summary) = self.create_filtered_list((('Type', str, 60),
+                                           ('Local', str, 200),
+                                           ('Remote', str, 200),
+                                           ('Status', str, 120)))
+        resource_lists.append_page(conns_widget, Gtk.Label('Connections'))
+        self.conn_rows = {}
+        self.remote_hosts = Counter()
+        self.conn_states = Counter()
+
+        # category, RSS, PSS, private (USS), shared, swap
+        self.memory_store = Gtk.ListStore(str, GObject.TYPE_INT64,
+                                          GObject.TYPE_INT64,
+                                          GObject.TYPE_INT64,
+                                          GObject.TYPE_INT64,
+                                          GObject.TYPE_INT64)
+        memory_view = Gtk.TreeView(model=self.memory_store)
+        for i, title in enumerate(('Mappings', 'RSS', 'PSS', 'Private',
+                                   'Shared', 'Swap')):
+            column = Gtk.TreeViewColumn(title=title,
+                                        cell_renderer=Gtk.CellRendererText(),
+                                        text=i)
+            column.set_sort_column_id(i)
+            memory_view.append_column(column)
+        memory_window = Gtk.ScrolledWindow(hadjustment=None, vadjustment=None)
+        memory_window.set_policy(Gtk.PolicyType.AUTOMATIC,
+                                 Gtk.PolicyType.AUTOMATIC)
+        memory_window.add(memory_view)
+        resource_lists.append_page(memory_window, Gtk.Label('Memory'))
+        self.shown_breakdown = None
+        resource_lists.append_page(self.create_allocator_panel(),
+                                   Gtk.Label('Allocator'))
+        self.triggers_page = self.create_triggers_panel()
+        resource_lists.append_page(self.triggers_page, Gtk.Label('Triggers'))
+        resource_lists.connect('switch-page', self.switch_resource_page)
+
+        cadence_box = Gtk.HBox(False, 0)
+        label = Gtk.Label("Scan files & connections every (seconds): ")
+        cadence_box.pack_start(label, False, False, 0)
+        adj = Gtk.Adjustment(FILES_INTERVAL, 1.0, 300.0, 1.0, 10.0, 0.0)
+        self.scan_spinner = Gtk.SpinButton()
+        self.scan_spinner.configure(adj, 0, 0)
+        self.scan_spinner.connect('value-changed', self.scan_interval_changed)
+        cadence_box.pack_start(self.scan_spinner, False, False, 0)
+
+        lists_box = Gtk.VBox()
+        lists_box.pack_start(cadence_box, False, False, 0)
+        lists_box.pack_start(resource_lists, True, True, 0)
+
+        resources_pane = Gtk.VPaned()
+        resources_pane.pack1(info_window, True, False)
+        resources_pane.pack2(lists_box, False, False)
+        notebook.append_page(resources_pane,
                 Gtk.Label.new_with_mnemonic('_Resources'))
 
-        (stacks_widget, source_buffer) = self.create_text(True)
+        (stacks_view, stacks_widget, source_buffer) = \
+                self.create_text(True, return_view=True)
+        self.stacks_view = stacks_view
         notebook.append_page(stacks_widget,
                 Gtk.Label.new_with_mnemonic('_Stacks'))
 
         self.source_buffer = source_buffer
-        self.source_buffer.create_tag('bold', weight=Pango.Weight.BOLD)
-        self.source_buffer.create_tag('italic', style=Pango.Style.ITALIC)
-        self.source_buffer.create_tag('comment', foreground='#c0c0c0')
-        self.source_buffer.create_tag('decorator', foreground='#7d7d7d',
-                                      style=Pango.Style.ITALIC)
-        self.source_buffer.create_tag('keyword', foreground='#0000ff')
-        self.source_buffer.create_tag('number', foreground='#800000')
-        self.source_buffer.create_tag('string', foreground='#00aa00',
-                                      style=Pango.Style.ITALIC)
+        self.create_source_tags(source_buffer)
+        stacks_view.connect('button-press-event', self.stacks_clicked_cb)
 
         self.obj_tree = obj_tree = Gtk.TreeView()
         self.obj_store = obj_store = Gtk.ListStore(str, int, int, int,
-                                                   int, int, int, str)
+                                                   int, int, int, str, int)
         obj_tree.set_model(obj_store)
         obj_selection = obj_tree.get_selection()
         obj_selection.set_mode(Gtk.SelectionMode.BROWSE)
@@ -200,6 +389,9 @@ class PyrasiteWindow(Gtk.Window):
             Gtk.TreeViewColumn(title='Kind',
                                cell_renderer=Gtk.CellRendererText(),
                                text=7, style=2),
+            Gtk.TreeViewColumn(title='Retained',
+                               cell_renderer=Gtk.CellRendererText(),
+                               text=8, style=2),
             ]
 
         first_iter = obj_store.get_iter_first()
@@ -229,9 +421,46 @@ class PyrasiteWindow(Gtk.Window):
         bar.set_message_type(Gtk.MessageType.INFO)
         self.obj_totals = Gtk.Label()
         bar.get_content_area().pack_start(self.obj_totals, False, False, 0)
+        self.retained_button = Gtk.Button('Biggest retainers')
+        self.retained_button.connect('clicked', self.show_retainers)
+        bar.get_content_area().pack_end(self.retained_button, False, False, 0)
+        dump_button = Gtk.Button('Dump again')
+        dump_button.connect('clicked', self.redump_objects)
+        bar.get_content_area().pack_end(dump_button, False, False, 0)
+        export_button = Gtk.Button('Export...')
+        export_button.connect('clicked', self.export_heap)
+        bar.get_content_area().pack_end(export_button, False, False, 0)
+        self.snapshot_paths = []
+        self.snapshot_combo = Gtk.ComboBoxText()
+        self.snapshot_combo_handler = self.snapshot_combo.connect(
+            'changed', self.snapshot_changed_cb)
+        bar.get_content_area().pack_end(self.snapshot_combo, False, False, 0)
         hbox.pack_start(bar, False, False, 0)
 
         hbox.pack_start(scrolled_window, True, True, 0)
+
+        # Instances of the activated type, largest first
+        self.instance_tree = instance_tree = Gtk.TreeView()
+        self.instance_store = instance_store = Gtk.ListStore(str, str, int,
+                                                             int)
+        instance_tree.set_model(instance_store)
+        instance_tree.get_selection().set_mode(Gtk.SelectionMode.BROWSE)
+        for i, title in enumerate(('Address', 'Kind', 'Size', 'Retained')):
+            column = Gtk.TreeViewColumn(title=title,
+                                        cell_renderer=Gtk.CellRendererText(),
+                                        text=i)
+            column.set_sort_column_id(i)
+            instance_tree.append_column(column)
+        instance_tree.connect('row_activated',
+                              self.instance_row_activated_cb, instance_store)
+
+        scrolled_window = Gtk.ScrolledWindow(hadjustment=None,
+                                             vadjustment=None)
+        scrolled_window.set_policy(Gtk.PolicyType.NEVER,
+                                   Gtk.PolicyType.AUTOMATIC)
+        scrolled_window.add(instance_tree)
+        hbox.pack_start(scrolled_window, True, True, 0)
+
         (text_widget, obj_buffer) = self.create_text(False)
         self.obj_buffer = obj_buffer
         hbox.pack_end(text_widget, True, True, 0)
@@ -244,7 +473,10 @@ class PyrasiteWindow(Gtk.Window):
         self.shell_buffer = shell_buffer
         self.shell_widget = shell_widget
         shell_hbox = Gtk.VBox()
-        shell_hbox.pack_start(shell_widget, True, True, 0)
+        shell_paned = Gtk.VPaned()
+        shell_paned.pack1(shell_widget, True, False)
+        shell_paned.pack2(self.create_inspector(), True, False)
+        shell_hbox.pack_start(shell_paned, True, True, 0)
         shell_bottom = Gtk.HBox()
 
         shell_prompt = Gtk.Entry()
@@ -260,6 +492,8 @@ class PyrasiteWindow(Gtk.Window):
         shell_label = Gtk.Label.new_with_mnemonic('_Shell')
         notebook.append_page(shell_hbox, shell_label)
 
+        # Build the page before switch_page looks at it
+        notebook.connect('switch-page', self.build_lazy_page)
         # To try and grab focus of our text input
         notebook.connect('switch-page', self.switch_page)
         self.notebook = notebook
@@ -282,6 +516,15 @@ class PyrasiteWindow(Gtk.Window):
         spinner_button.connect('clicked', self.sample_call_tree)
         graph_spinner_box.pack_start(spinner_button, False, False, 0)
 
+        capture_button = Gtk.Button('Save sampled profile')
+        capture_button.connect('clicked', self.capture_profile)
+        graph_spinner_box.pack_start(capture_button, False, False, 0)
+
+        self.remote_check = Gtk.CheckButton('Sample out of process')
+        self.remote_check.set_active(self.no_inject)
+        self.remote_check.set_sensitive(not self.no_inject)
+        graph_spinner_box.pack_start(self.remote_check, False, False, 10)
+
         scrolled_window = Gtk.ScrolledWindow(hadjustment=None,
                                              vadjustment=None)
         scrolled_window.set_policy(Gtk.PolicyType.ALWAYS,
@@ -294,23 +537,1040 @@ class PyrasiteWindow(Gtk.Window):
         notebook.append_page(graph_vbox,
                 Gtk.Label.new_with_mnemonic('_Call Graph'))
 
+        # Built when first shown, as most sessions never open them
+        self.add_lazy_page(notebook, Gtk.Label.new_with_mnemonic('_I/O'),
+                           self.create_io_panel)
+        self.add_lazy_page(notebook, Gtk.Label.new_with_mnemonic('T_asks'),
+                           self.create_tasks_panel)
+        self.add_lazy_page(notebook, Gtk.Label.new_with_mnemonic('_Locks'),
+                           self.create_locks_panel)
+        self.add_lazy_page(notebook, Gtk.Label.new_with_mnemonic('_Modules'),
+                           self.create_modules_panel)
+        self.lines_page = self.add_lazy_page(
+            notebook, Gtk.Label.new_with_mnemonic('Li_nes'),
+            self.create_lines_panel)
+        self.add_lazy_page(notebook, Gtk.Label.new_with_mnemonic('Com_pare'),
+                           self.create_compare_panel)
+        self.add_lazy_page(notebook, Gtk.Label.new_with_mnemonic('_Bloat'),
+                           self.create_bloat_panel)
+
+        # Merged results of operations fanned out to many processes
+        self.fleet_store = Gtk.TreeStore(str, GObject.TYPE_INT64, str)
+        fleet_view = Gtk.TreeView(model=self.fleet_store)
+        for i, title in enumerate(('Name', 'Count', 'Details')):
+            column = Gtk.TreeViewColumn(title=title,
+                                        cell_renderer=Gtk.CellRendererText(),
+                                        text=i)
+            column.set_resizable(True)
+            fleet_view.append_column(column)
+        scrolled_window = Gtk.ScrolledWindow(hadjustment=None,
+                                             vadjustment=None)
+        scrolled_window.set_policy(Gtk.PolicyType.AUTOMATIC,
+                                   Gtk.PolicyType.AUTOMATIC)
+        scrolled_window.add(fleet_view)
+        self.fleet_page = scrolled_window
+        notebook.append_page(scrolled_window,
+                Gtk.Label.new_with_mnemonic('_Fleet'))
+
         self.details_html = ''
-        self.details_view = WebKit.WebView()
-        self.details_view.load_string(self.details_html, "text/html",
-                                      "utf-8", '#')
+        self.details_view = None
 
-        details_window = Gtk.ScrolledWindow(hadjustment=None,
-                                            vadjustment=None)
+        self.details_window = details_window = Gtk.ScrolledWindow(
+                hadjustment=None, vadjustment=None)
         details_window.set_policy(Gtk.PolicyType.AUTOMATIC,
                                Gtk.PolicyType.AUTOMATIC)
-        details_window.add(self.details_view)
         notebook.append_page(details_window,
                 Gtk.Label.new_with_mnemonic('_Details'))
 
+        self.timings_page = self.create_timings_panel()
+        notebook.append_page(self.timings_page,
+                Gtk.Label.new_with_mnemonic('_Timings'))
+        self.connect('key-press-event', self.key_press_cb)
+
         self.show_all()
         self.progress.hide()
+        if not timings.enabled:
+            self.timings_page.hide()
+        startup.mark('build window')
+
+    def create_timings_panel(self):
+        """A hidden page showing where pyrasite-gui spends its time"""
+        self.timings_store = store = Gtk.ListStore(str, int, float, float,
+                                                   float, float, float, str)
+        view = Gtk.TreeView(model=store)
+        for i, title in enumerate(('Span', 'Count', 'Total (s)', 'Mean (ms)',
+                                   'p50 (ms)', 'p99 (ms)', 'Max (ms)',
+                                   'Histogram')):
+            column = Gtk.TreeViewColumn(title=title,
+                                        cell_renderer=Gtk.CellRendererText(),
+                                        text=i)
+            column.set_sort_column_id(i)
+            view.append_column(column)
+        store.set_sort_column_id(2, Gtk.SortType.DESCENDING)
+
+        scrolled_window = Gtk.ScrolledWindow(hadjustment=None,
+                                             vadjustment=None)
+        scrolled_window.set_policy(Gtk.PolicyType.AUTOMATIC,
+                                   Gtk.PolicyType.AUTOMATIC)
+        scrolled_window.add(view)
+
+        buttons = Gtk.HBox(False, 0)
+        for label, callback in (('Reset', lambda button: timings.reset()),
+                                ('Dump JSON', self.dump_timings)):
+            button = Gtk.Button(label)
+            button.connect('clicked', callback)
+            buttons.pack_start(button, False, False, 0)
+
+        box = Gtk.VBox()
+        box.pack_start(buttons, False, False, 0)
+        box.pack_start(scrolled_window, True, True, 0)
+        return box
+
+    def key_press_cb(self, widget, event):
+        """Ctrl+Shift+T toggles instrumentation and the timings panel"""
+        mask = Gdk.ModifierType.CONTROL_MASK | Gdk.ModifierType.SHIFT_MASK
+        if event.keyval in (Gdk.KEY_T, Gdk.KEY_t) and \
+                event.state & mask == mask:
+            timings.enabled = not timings.enabled
+            if timings.enabled:
+                self.timings_page.show()
+                GObject.timeout_add(1000, self.render_timings)
+            else:
+                self.timings_page.hide()
+            return True
+        return False
+
+    def render_timings(self):
+        self.timings_store.clear()
+        for name, stats in timings.snapshot().items():
+            histogram = ' '.join('%s:%d' % bucket for bucket in sorted(
+                stats['buckets'].items(), key=lambda b: int(b[0][1:-2])))
+            self.timings_store.append([
+                name, stats['count'], stats['total'], stats['mean'] * 1000,
+                stats['p50'] * 1000, stats['p99'] * 1000,
+                stats['max'] * 1000, histogram])
+        return timings.enabled
+
+    def dump_timings(self, widget=None):
+        path = os.path.join(tempfile.gettempdir(),
+                            'pyrasite-gui-timings-%d.json' % os.getpid())
+        timings.dump(path)
+        log.info('Wrote timings to %s' % path)
+        return path
+
+    def create_io_panel(self):
+        """Blocking call latencies and event loop lag in the target"""
+        self.io_rows = {}  # (section, name, site) -> io_store row
+        # name, calls, total, mean, p99, max, histogram
+        self.io_store = store = Gtk.TreeStore(str, GObject.TYPE_INT64, float,
+                                              float, float, float, str)
+        view = Gtk.TreeView(model=store)
+        for i, title in enumerate(('Call / call site', 'Calls', 'Total (s)',
+                                   'Mean (ms)', 'p99 (ms)', 'Max (ms)',
+                                   'Histogram')):
+            column = Gtk.TreeViewColumn(title=title,
+                                        cell_renderer=Gtk.CellRendererText(),
+                                        text=i)
+            column.set_sort_column_id(i)
+            column.set_resizable(True)
+            view.append_column(column)
+        store.set_sort_column_id(2, Gtk.SortType.DESCENDING)
+
+        scrolled_window = Gtk.ScrolledWindow(hadjustment=None,
+                                             vadjustment=None)
+        scrolled_window.set_policy(Gtk.PolicyType.AUTOMATIC,
+                                   Gtk.PolicyType.AUTOMATIC)
+        scrolled_window.add(view)
+
+        buttons = Gtk.HBox(False, 0)
+        for label, callback in (('Start', self.start_io_profile),
+                                ('Stop', self.stop_io_profile)):
+            button = Gtk.Button(label)
+            button.connect('clicked', callback)
+            buttons.pack_start(button, False, False, 0)
+        self.io_status = Gtk.Label()
+        buttons.pack_start(self.io_status, False, False, 6)
+
+        box = Gtk.VBox()
+        box.pack_start(buttons, False, False, 0)
+        box.pack_start(scrolled_window, True, True, 0)
+        return box
+
+    def start_io_profile(self, widget=None):
+        if not getattr(self, 'proc', None):
+            return
+        self.stop_io_profile()
+        self.io_store.clear()
+        self.io_rows = {}
+        try:
+            loops = self.proc.call_payload('io_profiler', 'start',
+                                           max_duration=IO_PROFILE_DURATION)
+        except PayloadError as e:
+            log.error('Unable to start the I/O profiler: %s' % e)
+            return
+        # A new tuple each time, so timers from earlier profiles stop
+        watch = self.io_watch = (self.proc,)
+        self.io_status.set_text('Profiling pid %d, %d event loop(s)' % (
+            self.proc.pid, loops))
+        GObject.timeout_add(int(IO_PROFILE_REFRESH * 1000),
+                            self.poll_io_profile, watch)
+
+    def stop_io_profile(self, widget=None):
+        watch, self.io_watch = self.io_watch, None
+        if watch is None:
+            return
+        try:
+            watch[0].call_payload('io_profiler', 'stop')
+        except (PayloadError, socket.error) as e:
+            log.debug('Unable to stop the I/O profiler: %s' % e)
+        self.io_status.set_text('Stopped')
+
+    @timed('io_profile.poll')
+    def poll_io_profile(self, watch):
+        """Refresh the I/O tab, for as long as `watch` is current"""
+        if watch is not self.io_watch:
+            return False
+        try:
+            snapshot = watch[0].call_payload('io_profiler', 'snapshot')
+        except (PayloadError, socket.error) as e:
+            log.error('Lost the I/O profiler: %s' % e)
+            self.io_watch = None
+            return False
+
+        per_call = {}
+        for name, where, count, total, longest, buckets in snapshot['calls']:
+            stats = Histogram.from_stats(count, total, longest, buckets)
+            self.io_row(('Blocking calls', name, where), stats)
+            per_call.setdefault(name, Histogram()).merge(stats)
+        for name, stats in per_call.items():
+            self.io_row(('Blocking calls', name), stats)
+        for section, rows in (('Event loop lag', snapshot['loops']),
+                              ('Slow callbacks', snapshot['slow_callbacks'])):
+            for name, count, total, longest, buckets in rows:
+                self.io_row((section, name),
+                            Histogram.from_stats(count, total, longest,
+                                                 buckets))
+
+        if not snapshot['active']:
+            self.io_status.set_text('Finished after %ds' % snapshot['elapsed'])
+            self.io_watch = None
+            return False
+        return True
+
+    def io_row(self, key, stats):
+        """Create or update the row for `key`, creating its parents"""
+        row = self.io_rows.get(key)
+        if row is None:
+            parent = None
+            if len(key) > 1:
+                parent = self.io_rows.get(key[:-1])
+                if parent is None:
+                    parent = self.io_row(key[:-1], None)
+            row = self.io_rows[key] = self.io_store.append(
+                parent, [key[-1], 0, 0.0, 0.0, 0.0, 0.0, ''])
+        if stats is not None:
+            histogram = ' '.join('<%dus:%d' % (1 << b, n)
+                                 for b, n in sorted(stats.buckets.items()))
+            self.io_store.set(row, 1, stats.count, 2, stats.total,
+                              3, stats.total / max(stats.count, 1) * 1000,
+                              4, stats.percentile(0.99) * 1000,
+                              5, stats.max * 1000, 6, histogram)
+        return row
+
+    def create_tasks_panel(self):
+        """asyncio tasks grouped by what they are awaiting"""
+        self.task_rows = {}  # stack signature -> tasks_store row
+        # outermost coroutine, tasks, change since last refresh, sample names
+        self.tasks_store = store = Gtk.TreeStore(str, GObject.TYPE_INT64,
+                                                 GObject.TYPE_INT64, str)
+        view = Gtk.TreeView(model=store)
+        for i, title in enumerate(('Coroutine', 'Tasks', 'Change',
+                                   'Example tasks')):
+            column = Gtk.TreeViewColumn(title=title,
+                                        cell_renderer=Gtk.CellRendererText(),
+                                        text=i)
+            column.set_sort_column_id(i)
+            column.set_resizable(True)
+            view.append_column(column)
+        store.set_sort_column_id(1, Gtk.SortType.DESCENDING)
+
+        scrolled_window = Gtk.ScrolledWindow(hadjustment=None,
+                                             vadjustment=None)
+        scrolled_window.set_policy(Gtk.PolicyType.AUTOMATIC,
+                                   Gtk.PolicyType.AUTOMATIC)
+        scrolled_window.add(view)
+
+        controls = Gtk.HBox(False, 0)
+        controls.pack_start(Gtk.Label('Refresh every (seconds): '),
+                            False, False, 0)
+        adj = Gtk.Adjustment(TASKS_INTERVAL, 0.5, 60.0, 0.5, 5.0, 0.0)
+        self.tasks_spinner = Gtk.SpinButton()
+        self.tasks_spinner.configure(adj, 0, 1)
+        controls.pack_start(self.tasks_spinner, False, False, 0)
+        for label, callback in (('Watch', self.watch_tasks),
+                                ('Stop', self.stop_watching_tasks)):
+            button = Gtk.Button(label)
+            button.connect('clicked', callback)
+            controls.pack_start(button, False, False, 0)
+        self.tasks_status = Gtk.Label()
+        controls.pack_start(self.tasks_status, False, False, 6)
+
+        box = Gtk.VBox()
+        box.pack_start(controls, False, False, 0)
+        box.pack_start(scrolled_window, True, True, 0)
+        return box
+
+    def watch_tasks(self, widget=None):
+        if not getattr(self, 'proc', None):
+            return
+        self.tasks_store.clear()
+        self.task_rows = {}
+        # A new tuple each time, so timers from earlier watches stop
+        watch = self.tasks_watch = (self.proc,)
+        if self.poll_tasks(watch):
+            GObject.timeout_add(
+                int(self.tasks_spinner.get_value() * 1000),
+                self.poll_tasks, watch)
+
+    def stop_watching_tasks(self, widget=None):
+        self.tasks_watch = None
+
+    @timed('tasks.poll')
+    def poll_tasks(self, watch):
+        """Refresh the Tasks tab, for as long as `watch` is current"""
+        if watch is not self.tasks_watch:
+            return False
+        try:
+            snapshot = watch[0].call_payload('asyncio_tasks', 'snapshot')
+        except (PayloadError, socket.error) as e:
+            log.error('Unable to list asyncio tasks: %s' % e)
+            self.tasks_watch = None
+            return False
+
+        seen = set()
+        for signature, count, change, names in snapshot['groups']:
+            seen.add(signature)
+            row = self.task_rows.get(signature)
+            if row is None:
+                lines = signature.splitlines()
+                row = self.task_rows[signature] = self.tasks_store.append(
+                    None, [lines and lines[0] or '(unknown)', 0, 0, ''])
+                for line in lines:
+                    self.tasks_store.append(row, [line, 0, 0, ''])
+            self.tasks_store.set(row, 1, count, 2, change,
+                                 3, ', '.join(names))
+        for signature in list(self.task_rows):
+            if signature not in seen:
+                self.tasks_store.remove(self.task_rows.pop(signature))
+
+        status = '%d tasks on %d event loop(s)' % (snapshot['tasks'],
+                                                    snapshot['loops'])
+        if snapshot['aborted']:
+            status += ', incomplete: %s' % snapshot['aborted']
+        self.tasks_status.set_text(status)
+        return True
+
+    def create_locks_panel(self):
+        """The most contended locks and queues in the target"""
+        # name, acquisitions, contended, wait total, wait p99, hold mean,
+        # hold max
+        self.locks_store = store = Gtk.TreeStore(
+            str, GObject.TYPE_INT64, GObject.TYPE_INT64, float, float, float,
+            float)
+        view = Gtk.TreeView(model=store)
+        for i, title in enumerate(('Lock / site', 'Acquired', 'Contended',
+                                   'Waited (s)', 'Wait p99 (ms)',
+                                   'Hold mean (ms)', 'Hold max (ms)')):
+            column = Gtk.TreeViewColumn(title=title,
+                                        cell_renderer=Gtk.CellRendererText(),
+                                        text=i)
+            column.set_resizable(True)
+            view.append_column(column)
+
+        scrolled_window = Gtk.ScrolledWindow(hadjustment=None,
+                                             vadjustment=None)
+        scrolled_window.set_policy(Gtk.PolicyType.AUTOMATIC,
+                                   Gtk.PolicyType.AUTOMATIC)
+        scrolled_window.add(view)
+
+        buttons = Gtk.HBox(False, 0)
+        for label, callback in (('Start', self.start_lock_profile),
+                                ('Refresh', self.show_lock_profile),
+                                ('Stop', self.stop_lock_profile)):
+            button = Gtk.Button(label)
+            button.connect('clicked', callback)
+            buttons.pack_start(button, False, False, 0)
+        self.locks_status = Gtk.Label()
+        buttons.pack_start(self.locks_status, False, False, 6)
+
+        box = Gtk.VBox()
+        box.pack_start(buttons, False, False, 0)
+        box.pack_start(scrolled_window, True, True, 0)
+        return box
+
+    def start_lock_profile(self, widget=None):
+        if not getattr(self, 'proc', None):
+            return
+        self.stop_lock_profile()
+        try:
+            self.proc.call_payload('lock_profiler', 'start',
+                                   max_duration=LOCK_PROFILE_DURATION)
+        except PayloadError as e:
+            log.error('Unable to start the lock profiler: %s' % e)
+            return
+        self.locks_proc = self.proc
+        self.locks_store.clear()
+        self.locks_status.set_text('Profiling locks created from now on '
+                                   'in pid %d' % self.proc.pid)
+
+    def stop_lock_profile(self, widget=None):
+        proc, self.locks_proc = self.locks_proc, None
+        if proc is None:
+            return
+        try:
+            proc.call_payload('lock_profiler', 'stop')
+        except (PayloadError, socket.error) as e:
+            log.debug('Unable to stop the lock profiler: %s' % e)
+        self.locks_status.set_text('Stopped')
+
+    @timed('locks.show')
+    def show_lock_profile(self, widget=None):
+        if self.locks_proc is None:
+            return
+        try:
+            snapshot = self.locks_proc.call_payload('lock_profiler',
+                                                    'snapshot')
+        except (PayloadError, socket.error) as e:
+            log.error('Unable to read the lock profile: %s' % e)
+            return
+        store = self.locks_store
+        store.clear()
+
+        def stack_rows(parent, title, stack):
+            row = store.append(parent, [title, 0, 0, 0.0, 0.0, 0.0, 0.0])
+            for line in stack:
+                store.append(row, [line, 0, 0, 0.0, 0.0, 0.0, 0.0])
+
+        for lock in snapshot['locks']:
+            wait = Histogram.from_stats(*lock['wait'])
+            hold = Histogram.from_stats(*lock['hold'])
+            row = store.append(None, [
+                '%s created at %s' % (lock['kind'], lock['site']),
+                lock['acquisitions'], lock['contended'], wait.total,
+                wait.percentile(0.99) * 1000,
+                hold.total / max(hold.count, 1) * 1000, hold.max * 1000])
+            for where, waits in sorted(lock['waiter_sites'],
+                                       key=lambda entry: -entry[1][1]):
+                waits = Histogram.from_stats(*waits)
+                store.append(row, [
+                    'waited at %s' % where, 0, waits.count, waits.total,
+                    waits.percentile(0.99) * 1000, 0.0, waits.max * 1000])
+            for where, count in lock['holder_sites']:
+                store.append(row, ['held at %s' % where, 0, count,
+                                   0.0, 0.0, 0.0, 0.0])
+            for live in lock['live']:
+                stack_rows(row, 'holding now', live['holder'])
+                for waiter in live['waiters']:
+                    stack_rows(row, 'waiting now', waiter)
+
+        if snapshot['queues']:
+            queues = store.append(None, ['Queues', 0, 0, 0.0, 0.0, 0.0, 0.0])
+            for name, where, count, total, longest, buckets in sorted(
+                    snapshot['queues'], key=lambda q: -q[3]):
+                waits = Histogram.from_stats(count, total, longest, buckets)
+                store.append(queues, [
+                    '%s at %s' % (name, where), count, 0, waits.total,
+                    waits.percentile(0.99) * 1000, 0.0, waits.max * 1000])
+
+        if not snapshot['active']:
+            self.locks_status.set_text('Finished after %ds' %
+                                       snapshot['elapsed'])
+            self.locks_proc = None
+
+    def create_lines_panel(self):
+        """A line-level profile of one function, shown on its source"""
+        controls = Gtk.HBox(False, 0)
+        self.lines_target = Gtk.Entry()
+        self.lines_target.set_placeholder_text(
+            'module:function, or double click a frame in Stacks')
+        self.lines_target.connect('activate', self.profile_lines)
+        controls.pack_start(self.lines_target, True, True, 0)
+        controls.pack_start(Gtk.Label(' for (seconds): '), False, False, 0)
+        adj = Gtk.Adjustment(5.0, 1.0, 300.0, 1.0, 10.0, 0.0)
+        self.lines_spinner = Gtk.SpinButton()
+        self.lines_spinner.configure(adj, 0, 0)
+        controls.pack_start(self.lines_spinner, False, False, 0)
+        button = Gtk.Button('Profile')
+        button.connect('clicked', self.profile_lines)
+        controls.pack_start(button, False, False, 0)
+
+        (lines_widget, self.lines_buffer) = self.create_text(True)
+        self.create_source_tags(self.lines_buffer)
+        self.lines_buffer.create_tag('annotation', foreground='#7d7d7d')
+        for level, color in enumerate(('#fff8e1', '#ffe0b2', '#ffb74d',
+                                       '#ff7043')):
+            self.lines_buffer.create_tag('heat%d' % level, background=color)
+
+        self.lines_status = Gtk.Label()
+        self.lines_status.set_alignment(0, 0.5)
+
+        box = Gtk.VBox()
+        box.pack_start(controls, False, False, 0)
+        box.pack_start(self.lines_status, False, False, 0)
+        box.pack_start(lines_widget, True, True, 0)
+        return box
+
+    def create_compare_panel(self):
+        """Per-function differences between two saved profiles"""
+        controls = Gtk.HBox(False, 0)
+        self.baseline_combo = Gtk.ComboBoxText()
+        self.comparison_combo = Gtk.ComboBoxText()
+        for label, combo in (('Baseline: ', self.baseline_combo),
+                             (' Compare with: ', self.comparison_combo)):
+            controls.pack_start(Gtk.Label(label), False, False, 0)
+            controls.pack_start(combo, True, True, 0)
+        for label, callback in (('Refresh', self.refresh_profile_choices),
+                                ('Compare', self.compare_profiles),
+                                ('Export baseline...', self.export_profile)):
+            button = Gtk.Button(label)
+            button.connect('clicked', callback)
+            controls.pack_start(button, False, False, 0)
+
+        # function, self before, self after, change, total before, total
+        # after, change; all as % of samples
+        self.compare_store = Gtk.ListStore(str, float, float, float, float,
+                                           float, float)
+        view = Gtk.TreeView(model=self.compare_store)
+        for i, title in enumerate(('Function', 'Self before %',
+                                   'Self after %', 'Self change',
+                                   'Total before %', 'Total after %',
+                                   'Total change')):
+            column = Gtk.TreeViewColumn(title=title,
+                                        cell_renderer=Gtk.CellRendererText(),
+                                        text=i)
+            column.set_sort_column_id(i)
+            column.set_resizable(True)
+            view.append_column(column)
+        scrolled_window = Gtk.ScrolledWindow(hadjustment=None,
+                                             vadjustment=None)
+        scrolled_window.set_policy(Gtk.PolicyType.AUTOMATIC,
+                                   Gtk.PolicyType.AUTOMATIC)
+        scrolled_window.add(view)
+
+        self.diff_graph = Gtk.Image()
+        graph_window = Gtk.ScrolledWindow(hadjustment=None, vadjustment=None)
+        graph_window.set_policy(Gtk.PolicyType.AUTOMATIC,
+                                Gtk.PolicyType.AUTOMATIC)
+        graph_window.add_with_viewport(self.diff_graph)
+
+        panes = Gtk.VPaned()
+        panes.pack1(scrolled_window, True, False)
+        panes.pack2(graph_window, True, False)
+
+        self.compare_status = Gtk.Label()
+        self.compare_status.set_alignment(0, 0.5)
+        box = Gtk.VBox()
+        box.pack_start(controls, False, False, 0)
+        box.pack_start(self.compare_status, False, False, 0)
+        box.pack_start(panes, True, True, 0)
+        return box
+
+    def refresh_profile_choices(self, widget=None):
+        """List saved profiles and trigger captures in the Compare tab"""
+        self.profile_choices_stale = False
+        self.profile_paths = []
+        for combo in (self.baseline_combo, self.comparison_combo):
+            combo.remove_all()
+        for kind in ('profile', 'trigger'):
+            for path, capture in captures.captures(kind):
+                if not capture.get('profile'):
+                    continue
+                self.profile_paths.append(path)
+                for combo in (self.baseline_combo, self.comparison_combo):
+                    combo.append_text(captures.describe(capture))
+        if len(self.profile_paths) > 1:
+            self.baseline_combo.set_active(1)
+            self.comparison_combo.set_active(0)
+
+    def save_profile(self, pid, title, profile, source):
+        """Keep a sampled profile so it can be compared later"""
+        try:
+            captures.save('profile', dict(
+                pid=pid, title=title, profile=profile,
+                reason='%s, %d samples' % (source, profile['samples'])))
+        except (IOError, OSError) as e:
+            log.error('Unable to save profile: %s' % e)
+            return
+        self.profile_choices_stale = True
+
+    def capture_profile(self, widget=None):
+        """Sample the selected process for the call graph's sample size"""
+        if not getattr(self, 'proc', None):
+            return
+        proc = self.proc
+        duration = self.spinner.get_value()
+        remote = self.remote_check.get_active()
+
+        def done(profile, error):
+            self.progress.hide()
+            if error is not None:
+                log.error('Unable to sample a profile: %s' % error)
+                return
+            self.save_profile(proc.pid, proc.title.strip(), profile,
+                              remote and 'sampled out of process' or 'sampled')
+
+        self.progress.show()
+        self.update_progress(None, 'Sampling for %d seconds' % duration)
+        # Sample in the background, the GUI keeps running meanwhile
+        if remote:
+            try:
+                sampler = self.remote_sampler()
+            except remote_sampler.SamplerError as e:
+                done(None, e)
+                return
+            self.run_in_background(
+                lambda: remote_sampler.profile(proc.pid, duration,
+                                               REMOTE_SAMPLE_INTERVAL,
+                                               sampler), done)
+        else:
+            self.run_job(proc, 'sampler', 'sample', done, duration=duration)
+
+    @timed('compare_profiles')
+    def compare_profiles(self, widget=None):
+        before = self.baseline_combo.get_active()
+        after = self.comparison_combo.get_active()
+        if before < 0 or after < 0:
+            return
+        try:
+            baseline, comparison = [captures.load(self.profile_paths[i])
+                                    for i in (before, after)]
+        except (IOError, ValueError) as e:
+            log.error('Unable to load profiles: %s' % e)
+            return
+        old, new = baseline['profile'], comparison['profile']
+        self.compare_store.clear()
+        for frame, old_self, new_self, old_total, new_total in \
+                profiles.diff(old, new):
+            self.compare_store.append([frame] + [
+                round(100 * value, 2) for value in (
+                    old_self, new_self, new_self - old_self, old_total,
+                    new_total, new_total - old_total)])
+        self.compare_status.set_text('%s vs %s' % (
+            captures.describe(baseline), captures.describe(comparison)))
+
+        graphviz_path = check_depends()
+        if graphviz_path:
+            image = os.path.join(tempfile.gettempdir(), 'pyrasite-diff.png')
+            dot = subprocess.Popen([graphviz_path, '-Tpng', '-o', image],
+                                   stdin=subprocess.PIPE)
+            dot.communicate(profiles.diff_to_dot(old, new).encode('utf-8'))
+            self.diff_graph.set_from_file(image)
+
+    def choose_export(self, title, formats, name):
+        """
+        Ask where to export to, offering one filter per format.  Returns
+        the path and the chosen format's entry, or None if cancelled.
+        """
+        dialog = Gtk.FileChooserDialog(title, self, Gtk.FileChooserAction.SAVE,
+                                       (Gtk.STOCK_CANCEL,
+                                        Gtk.ResponseType.CANCEL,
+                                        Gtk.STOCK_SAVE, Gtk.ResponseType.OK))
+        dialog.set_do_overwrite_confirmation(True)
+        filters = {}
+        for entry in formats:
+            file_filter = Gtk.FileFilter()
+            file_filter.set_name('%s (*%s)' % (entry[1], entry[2]))
+            file_filter.add_pattern('*' + entry[2])
+            dialog.add_filter(file_filter)
+            filters[file_filter] = entry
+        dialog.set_current_name(name + formats[0][2])
+        try:
+            if dialog.run() != Gtk.ResponseType.OK:
+                return None
+            path = dialog.get_filename()
+            entry = filters.get(dialog.get_filter(), formats[0])
+        finally:
+            dialog.destroy()
+        if not path.endswith(entry[2]):
+            path += entry[2]
+        return path, entry
+
+    def export(self, path, entry, *args, **kw):
+        self.progress.show()
+        self.update_progress(None, 'Exporting %s' % entry[1])
+        try:
+            exporters.export(path, entry[3], entry[4], *args, **kw)
+        except (IOError, OSError) as e:
+            log.error('Unable to export %s: %s' % (path, e))
+        finally:
+            self.progress.hide()
+
+    def export_profile(self, widget=None):
+        """Write the baseline profile in a format other tools read"""
+        active = self.baseline_combo.get_active()
+        if active < 0:
+            return
+        try:
+            capture = captures.load(self.profile_paths[active])
+        except (IOError, ValueError) as e:
+            log.error('Unable to load profile: %s' % e)
+            return
+        name = '%s-%d' % (capture.get('pid', 'profile'), capture['created'])
+        chosen = self.choose_export('Export profile',
+                                    exporters.PROFILE_FORMATS, name)
+        if chosen:
+            self.export(chosen[0], chosen[1], capture['profile'],
+                        name=captures.describe(capture))
+
+    def export_heap(self, widget=None):
+        """Write the open snapshot's type summary or every object"""
+        if self.heap_graph is None:
+            return
+        try:
+            metadata = heap_index.read_metadata(self.snapshot_path)
+        except heap_index.SnapshotError as e:
+            log.error(str(e))
+            return
+        name = 'heap-%s-%d' % (metadata.get('pid', ''), metadata['created'])
+        chosen = self.choose_export('Export heap', exporters.HEAP_FORMATS,
+                                    name)
+        if not chosen:
+            return
+        path, entry = chosen
+        if entry[0].startswith('summary'):
+            self.export(path, entry, metadata['summary'])
+        else:
+            self.export(path, entry, self.heap_graph,
+                        dominators=self.dominators)
+
+    def create_bloat_panel(self):
+        """In-target analyses of memory that could be saved"""
+        # name, count, size, wasted bytes, owners
+        self.bloat_store = Gtk.TreeStore(str, GObject.TYPE_INT64,
+                                         GObject.TYPE_INT64,
+                                         GObject.TYPE_INT64, str)
+        view = Gtk.TreeView(model=self.bloat_store)
+        for i, title in enumerate(('Name', 'Count', 'Size', 'Wasted',
+                                   'Owners')):
+            column = Gtk.TreeViewColumn(title=title,
+                                        cell_renderer=Gtk.CellRendererText(),
+                                        text=i)
+            column.set_resizable(True)
+            view.append_column(column)
+        scrolled_window = Gtk.ScrolledWindow(hadjustment=None,
+                                             vadjustment=None)
+        scrolled_window.set_policy(Gtk.PolicyType.AUTOMATIC,
+                                   Gtk.PolicyType.AUTOMATIC)
+        scrolled_window.add(view)
+
+        controls = Gtk.HBox(False, 0)
+        button = Gtk.Button('Containers')
+        button.connect('clicked', self.analyze_containers)
+        controls.pack_start(button, False, False, 0)
+        button = Gtk.Button('Duplicates')
+        button.connect('clicked', self.find_duplicates)
+        controls.pack_start(button, False, False, 0)
+        self.bloat_status = Gtk.Label()
+        self.bloat_status.set_alignment(0, 0.5)
+        controls.pack_start(self.bloat_status, True, True, 6)
+
+        box = Gtk.VBox()
+        box.pack_start(controls, False, False, 0)
+        box.pack_start(scrolled_window, True, True, 0)
+        return box
+
+    def analyze_bloat(self, name, text, show):
+        """Run the `analyze` function of payload `name` as a job, passing
+        its result to `show` unless another analysis started since"""
+        # A new tuple each time, so an earlier analysis's result is ignored
+        watch = self.bloat_watch = (self.proc, name)
+
+        def done(result, error):
+            if watch is not self.bloat_watch:
+                return
+            self.bloat_watch = None
+            self.progress.hide()
+            if error is not None:
+                log.error('%s failed: %s' % (text, error))
+                self.bloat_status.set_text(
+                    str(error).strip().splitlines()[-1])
+                return
+            self.show_overhead()
+            show(result)
+
+        self.progress.show()
+        self.update_progress(None, text)
+        self.run_job(self.proc, name, 'analyze', done, **BLOAT_BUDGET)
 
-        # Load up our javascript resources
+    def analyze_containers(self, widget=None):
+        if not getattr(self, 'proc', None) or self.no_inject:
+            return
+        self.analyze_bloat('containers', 'Measuring containers',
+                           self.show_containers)
+
+    @timed('containers.show')
+    def show_containers(self, result):
+        store = self.bloat_store
+        store.clear()
+        parent = store.append(None, ['By type', 0, 0, 0, ''])
+        for (kind, count, size, slack, empty, sparse, unknown,
+             lengths) in sorted(result['kinds'], key=lambda k: -k[2]):
+            details = '%d empty, %d under %d%% full' % (empty, sparse, 25)
+            if unknown:
+                details += ', %d of unknown capacity' % unknown
+            row = store.append(parent, [kind, count, size, slack, details])
+            for bucket, n in lengths:
+                store.append(row, ['len < %d' % (1 << bucket), n, 0, 0, ''])
+        parent = store.append(None, ['Most over-allocated', 0, 0, 0, ''])
+        for kind, length, capacity, size, slack, owners in \
+                result['oversized']:
+            store.append(parent, [
+                '%s of %d, capacity %d' % (kind, length, capacity), 1, size,
+                slack, ', '.join(owners)])
+        parent = store.append(None, ['Largest dict shapes', 0, 0, 0, ''])
+        for keys, count, size, owners in result['shapes']:
+            store.append(parent, [', '.join(keys), count, size, 0,
+                                  ', '.join(owners)])
+        status = 'Containers measured'
+        if result['aborted']:
+            status += ', incomplete: %s' % result['aborted']
+        self.bloat_status.set_text(status)
+
+    def find_duplicates(self, widget=None):
+        if not getattr(self, 'proc', None) or self.no_inject:
+            return
+        self.analyze_bloat('duplicates', 'Hashing strings, bytes and tuples',
+                           self.show_duplicates)
+
+    @timed('duplicates.show')
+    def show_duplicates(self, result):
+        store = self.bloat_store
+        store.clear()
+        parent = store.append(None, [
+            'Duplicated values', result['copies'], 0, result['wasted'],
+            '%d distinct values' % result['distinct']])
+        for kind, preview, copies, size, wasted, owners in result['values']:
+            store.append(parent, ['%s %s' % (kind, preview), copies,
+                                  copies * size, wasted, ', '.join(owners)])
+        status = 'Interning duplicates would save %s' % humanize_bytes(
+            result['wasted'])
+        if result['sample'] > 1:
+            status += ', estimated from 1 in %d values' % result['sample']
+        if result['aborted']:
+            status += ', incomplete: %s' % result['aborted']
+        self.bloat_status.set_text(status)
+
+    def stacks_clicked_cb(self, view, event):
+        """Double clicking a frame in the Stacks tab profiles its lines"""
+        if event.type != Gdk.EventType._2BUTTON_PRESS:
+            return False
+        x, y = view.window_to_buffer_coords(Gtk.TextWindowType.TEXT,
+                                            int(event.x), int(event.y))
+        location = view.get_iter_at_location(x, y)
+        if isinstance(location, tuple):  # GTK 3.20+ returns (found, iter)
+            location = location[1]
+        start = location.copy()
+        start.set_line_offset(0)
+        end = start.copy()
+        end.forward_to_line_end()
+        match = STACK_LINE.search(self.source_buffer.get_text(start, end,
+                                                              False))
+        if not match:
+            return False
+        # Switching first builds the page
+        self.notebook.set_current_page(
+            self.notebook.page_num(self.lines_page))
+        self.lines_target.set_text('%s:%s' % match.group(1, 2))
+        return True
+
+    def profile_lines(self, widget=None):
+        if not getattr(self, 'proc', None):
+            return
+        target = self.lines_target.get_text().strip()
+        if not target:
+            return
+        filename, _, lineno = target.rpartition(':')
+        if lineno.isdigit():
+            args = dict(filename=filename, lineno=int(lineno))
+        else:
+            args = dict(target=target)
+        duration = self.lines_spinner.get_value()
+        self.lines_status.set_text('Profiling the lines of %s for %ds...' % (
+            target, duration))
+        # A new tuple each time, so an earlier profile's result is ignored
+        watch = self.lines_watch = (self.proc, target)
+
+        def done(result, error):
+            if watch is not self.lines_watch:
+                return
+            self.lines_watch = None
+            if error is not None:
+                log.error('Line profile of %s failed: %s' % (target, error))
+                self.lines_status.set_text(
+                    str(error).strip().splitlines()[-1])
+                return
+            self.show_overhead()
+            if 'source' not in result:
+                self.lines_status.set_text('Aborted: %s' % result['aborted'])
+                return
+            self.show_line_profile(result)
+
+        self.run_job(self.proc, 'line_profiler', 'profile', done,
+                     duration=duration, **args)
+
+    def show_line_profile(self, result):
+        """Annotate the profiled function's source with its line timings"""
+        lines = dict((lineno, (hits, elapsed))
+                     for lineno, hits, elapsed in result['lines'])
+        total = sum(elapsed for hits, elapsed in lines.values()) or 1.0
+        source = textwrap.dedent(''.join(result['source']))
+
+        buffer = self.lines_buffer
+        buffer.set_text(source)
+        self.fontify(buffer)
+        for i in range(buffer.get_line_count()):
+            hits, elapsed = lines.get(result['first'] + i, (0, 0.0))
+            percent = 100 * elapsed / total
+            if hits:
+                annotation = '%9d %10.3f %5.1f%% | ' % (hits, elapsed * 1000,
+                                                       percent)
+            else:
+                annotation = '%9s %10s %6s | ' % ('', '', '')
+            tags = ['annotation']
+            level = bisect.bisect(HEAT_LEVELS, percent)
+            if level:
+                tags.append('heat%d' % (level - 1))
+            buffer.insert_with_tags_by_name(buffer.get_iter_at_line(i),
+                                            annotation, *tags)
+        buffer.insert_with_tags_by_name(
+            buffer.get_start_iter(), '%9s %10s %6s |\n' % (
+                'Hits', 'Time (ms)', '%'), 'annotation')
+
+        if result['mode'] == 'monitoring':
+            counted = '%d calls' % result['count']
+        else:
+            counted = '%d samples, hits are samples' % result['count']
+        status = '%s (%s:%d): %s, %.1fms' % (
+            result['name'], result['filename'], result['first'], counted,
+            total * 1000)
+        if result['aborted']:
+            status += ', stopped early: %s' % result['aborted']
+        self.lines_status.set_text(status)
+
+    def create_modules_panel(self):
+        """The target's modules with their disk, memory and import costs"""
+        # name, file, disk bytes, globals bytes, globals objects,
+        # import self ms, import cumulative ms
+        self.modules_store = store = Gtk.ListStore(
+            str, str, GObject.TYPE_INT64, GObject.TYPE_INT64, int, float,
+            float)
+        self.modules_view = view = Gtk.TreeView(model=store)
+        for i, title in enumerate(('Module', 'File', 'On disk', 'Globals',
+                                   'Objects', 'Import (ms)',
+                                   'Cumulative (ms)')):
+            column = Gtk.TreeViewColumn(title=title,
+                                        cell_renderer=Gtk.CellRendererText(),
+                                        text=i)
+            column.set_sort_column_id(i)
+            column.set_resizable(True)
+            view.append_column(column)
+        store.set_sort_column_id(3, Gtk.SortType.DESCENDING)
+
+        scrolled_window = Gtk.ScrolledWindow(hadjustment=None,
+                                             vadjustment=None)
+        scrolled_window.set_policy(Gtk.PolicyType.AUTOMATIC,
+                                   Gtk.PolicyType.AUTOMATIC)
+        scrolled_window.add(view)
+
+        buttons = Gtk.HBox(False, 0)
+        for label, callback in (('Refresh', self.show_modules),
+                                ('Time new imports', self.record_imports)):
+            button = Gtk.Button(label)
+            button.connect('clicked', callback)
+            buttons.pack_start(button, False, False, 0)
+        self.modules_status = Gtk.Label()
+        buttons.pack_start(self.modules_status, False, False, 6)
+
+        box = Gtk.VBox()
+        box.pack_start(buttons, False, False, 0)
+        box.pack_start(scrolled_window, True, True, 0)
+        return box
+
+    def record_imports(self, widget=None):
+        if not getattr(self, 'proc', None) or self.no_inject:
+            return
+        try:
+            recording = self.proc.call_payload('modules', 'record_imports')
+        except (PayloadError, socket.error) as e:
+            log.error('Unable to time imports: %s' % e)
+            return
+        if recording:
+            self.modules_status.set_text('Timing imports from now on')
+        else:
+            self.modules_status.set_text('Imports cannot be timed in this '
+                                         'interpreter')
+
+    def show_modules(self, widget=None):
+        """Measure the target's modules in a job, which can take seconds"""
+        if not getattr(self, 'proc', None) or self.no_inject:
+            return
+        self.modules_status.set_text('Measuring modules...')
+        # A new tuple each time, so an earlier summary's result is ignored
+        watch = self.modules_watch = (self.proc,)
+
+        def done(result, error):
+            if watch is not self.modules_watch:
+                return
+            self.modules_watch = None
+            if error is not None:
+                log.error('Unable to list modules: %s' % error)
+                self.modules_status.set_text(
+                    str(error).strip().splitlines()[-1])
+                return
+            self.show_overhead()
+            self.list_modules(result)
+
+        self.run_job(self.proc, 'modules', 'summary', done)
+
+    @timed('show_modules')
+    def list_modules(self, result):
+        store = self.modules_store
+        # Detach the model while filling it, as apply_diff does
+        self.modules_view.set_model(None)
+        store.clear()
+        disk = held = 0
+        for (name, path, disk_size, size, count, own,
+             cumulative) in result['modules']:
+            store.append([name, path or '', disk_size, size, count,
+                          (own or 0.0) * 1000, (cumulative or 0.0) * 1000])
+            disk += disk_size
+            held += size
+        self.modules_view.set_model(store)
+        status = '%d modules, %s on disk, %s in globals' % (
+            len(result['modules']), humanize_bytes(disk),
+            humanize_bytes(held))
+        if result['recording']:
+            status += ', timing imports'
+        if result['aborted']:
+            status += ', incomplete: %s' % result['aborted']
+        self.modules_status.set_text(status)
+
+    def create_web_views(self):
+        """Create the WebKit views the first time a process is analyzed"""
+        if self.info_view is not None:
+            return
+        start = time.time()
+        WebKit = import_webkit()
+        self.info_view = WebKit.WebView()
+        self.info_window.add(self.info_view)
+        self.details_view = WebKit.WebView()
+        self.details_window.add(self.details_view)
+        self.info_view.show()
+        self.details_view.show()
+        log.debug('Created WebKit views in %0.3fs' % (time.time() - start))
+
+    def load_javascript(self):
+        """Load up our javascript resources"""
         js = join(dirname(abspath(__file__)), 'js')
         if not os.path.isdir(js):
             js = '/usr/lib/javascript/'
@@ -328,13 +1588,31 @@ class PyrasiteWindow(Gtk.Window):
         name = self.notebook.get_tab_label(self.notebook.get_nth_page(pagenum))
         if name.get_text() == 'Shell':
             GObject.timeout_add(0, self.shell_prompt.grab_focus)
+        elif name.get_text() == 'Compare' and self.profile_choices_stale:
+            self.refresh_profile_choices()
 
     def run_shell_command(self, widget):
         cmd = self.shell_prompt.get_text()
         end = self.shell_buffer.get_end_iter()
         self.shell_buffer.insert(end, '\n>>> %s\n' % cmd)
         log.debug("run_shell_command(%r)" % cmd)
-        output = self.proc.cmd(cmd)
+        # Expressions are kept in the target and browsed, not printed
+        try:
+            output, result = self.proc.evaluate(cmd)
+            if result is None:
+                # Only statements, which the payload did not run, run here
+                output = self.proc.cmd(cmd)
+        except (PayloadError, socket.error) as e:
+            # Never run it again, it may have run before the error
+            log.error('Unable to run %r: %s' % (cmd, e))
+            output, result = 'Unable to run it: %s\n' % e, None
+        if result is not None:
+            if output:
+                output += '\n'
+            if 'error' in result:
+                output += result['error']
+            else:
+                output += self.add_inspector_root(cmd, result['node'])
         log.debug(repr(output))
         self.shell_buffer.insert(end, output)
         self.shell_prompt.set_text('')
@@ -343,22 +1621,260 @@ class PyrasiteWindow(Gtk.Window):
         self.shell_buffer.place_cursor(self.shell_buffer.get_end_iter())
         self.shell_view.scroll_to_mark(insert_mark, 0.0, True, 0.0, 1.0)
 
+    def create_inspector(self):
+        """An expandable tree of shell results, fetched a page at a time"""
+        # name, type, size, value, handle in the target, and for rows
+        # standing in for unfetched children, the index of the first one
+        self.inspector_store = Gtk.TreeStore(str, str, GObject.TYPE_INT64,
+                                             str, GObject.TYPE_INT64,
+                                             GObject.TYPE_INT64)
+        view = Gtk.TreeView(model=self.inspector_store)
+        for i, title in enumerate(('Name', 'Type', 'Size', 'Value')):
+            column = Gtk.TreeViewColumn(title=title,
+                                        cell_renderer=Gtk.CellRendererText(),
+                                        text=i)
+            column.set_resizable(True)
+            view.append_column(column)
+        view.connect('row-expanded', self.inspector_expanded_cb)
+        view.connect('row-collapsed', self.inspector_collapsed_cb)
+        view.connect('row-activated', self.inspector_activated_cb)
+        self.inspector_view = view
+        scrolled_window = Gtk.ScrolledWindow(hadjustment=None,
+                                             vadjustment=None)
+        scrolled_window.set_policy(Gtk.PolicyType.AUTOMATIC,
+                                   Gtk.PolicyType.AUTOMATIC)
+        scrolled_window.add(view)
+        return scrolled_window
+
+    def insert_inspector_row(self, parent, sibling, label, node):
+        handle, kind, text, size, length = node
+        row = self.inspector_store.insert_before(parent, sibling, [
+            label, kind, size, text, handle, -1])
+        if handle:
+            self.inspector_store.append(row, ['', '', 0, '', 0, 0])
+        return row
+
+    def add_inspector_root(self, cmd, node):
+        """Show a shell result in the browser, returning its summary"""
+        handle, kind, text, size, length = node
+        if not handle:
+            return '' if kind == 'NoneType' else text + '\n'
+        store = self.inspector_store
+        if store.iter_n_children(None) >= INSPECT_ROOTS:
+            self.remove_inspector_row(store.get_iter_first())
+        row = self.insert_inspector_row(None, None, cmd, node)
+        self.inspector_view.expand_row(store.get_path(row), False)
+        return '<%s with %d children, %s; browse below>\n' % (
+            kind, length, humanize_bytes(size))
+
+    def inspector_handles(self, treeiter):
+        """The handles held by a row and everything fetched beneath it"""
+        store = self.inspector_store
+        handles = []
+        if store[treeiter][4]:
+            handles.append(store[treeiter][4])
+        child = store.iter_children(treeiter)
+        while child:
+            handles.extend(self.inspector_handles(child))
+            child = store.iter_next(child)
+        return handles
+
+    def release_handles(self, handles):
+        if not handles or not getattr(self, 'proc', None):
+            return
+        try:
+            self.proc.call_payload('inspector', 'release', *handles)
+        except (PayloadError, socket.error) as e:
+            log.error('Unable to release %d objects: %s' % (len(handles), e))
+
+    def remove_inspector_row(self, treeiter):
+        self.release_handles(self.inspector_handles(treeiter))
+        self.inspector_store.remove(treeiter)
+
+    def clear_inspector(self):
+        """Let the target collect everything the browser kept alive"""
+        if not self.inspector_store.iter_n_children(None):
+            return
+        try:
+            self.proc.call_payload('inspector', 'release_all')
+        except (PayloadError, socket.error) as e:
+            log.error('Unable to release browsed objects: %s' % e)
+        self.inspector_store.clear()
+
+    def fetch_children(self, parent, more):
+        """Replace the row standing in for unfetched children with a page"""
+        store = self.inspector_store
+        start = store[more][5]
+        try:
+            result = self.proc.call_payload('inspector', 'children',
+                                            store[parent][4], start,
+                                            INSPECT_PAGE)
+        except (PayloadError, socket.error) as e:
+            log.error('Unable to fetch children: %s' % e)
+            return
+        for label, node in result['children']:
+            self.insert_inspector_row(parent, more, label, node)
+        end = start + len(result['children'])
+        if end < result['total']:
+            store[more] = ['More...', '', 0, '%d of %d shown' % (
+                end, result['total']), 0, end]
+        else:
+            store.remove(more)
+
+    def inspector_expanded_cb(self, view, treeiter, path):
+        store = self.inspector_store
+        first = store.iter_children(treeiter)
+        if first and store[first][5] == 0:
+            self.fetch_children(treeiter, first)
+
+    def inspector_collapsed_cb(self, view, treeiter, path):
+        """Release everything fetched under a row until it is reopened"""
+        store = self.inspector_store
+        handles = []
+        child = store.iter_children(treeiter)
+        while child:
+            handles.extend(self.inspector_handles(child))
+            if not store.remove(child):
+                break
+        self.release_handles(handles)
+        store.append(treeiter, ['', '', 0, '', 0, 0])
+
+    def inspector_activated_cb(self, view, path, column):
+        store = self.inspector_store
+        treeiter = store.get_iter(path)
+        if store[treeiter][5] > 0:
+            self.fetch_children(store.iter_parent(treeiter), treeiter)
+
     def obj_selection_cb(self, selection, model):
         sel = selection.get_selected()
         treeiter = sel[1]
         address = model.get_value(treeiter, 0)
-        value = pyrasite.inspect(self.pid, address)
+        with timings.span('pyrasite.inspect'):
+            value = pyrasite.inspect(self.pid, address)
         if value:
             self.obj_buffer.set_text(value)
         else:
             self.obj_buffer.set_text('Unable to inspect object. Make sure you '
                     'have the python debugging symbols installed.')
 
-    def obj_row_activated_cb(self, *args, **kw):
-        log.debug("obj_row_activated_cb(%s, %s)" % (args, kw))
+    def get_heap_graph(self):
+        return self.heap_graph
+
+    def build_dominators(self, done):
+        """
+        Build the dominator tree of the loaded dump on a worker thread the
+        first time it is needed and save it with the snapshot, then call
+        `done(dominators)`.
+        """
+        graph = self.get_heap_graph()
+        if graph is None:
+            return
+        if self.dominators is not None:
+            done(self.dominators)
+            return
+        if self.dominators_building is graph:
+            return
+        self.dominators_building = graph
+        path = self.snapshot_path
+        state = dict(fraction=0.0)
+
+        def progress(fraction):
+            state['fraction'] = fraction
+
+        def build():
+            with timings.span('dominators.build'):
+                dominators = DominatorTree(graph, progress)
+            if path:
+                try:
+                    heap_index.save_dominators(path, dominators)
+                except (IOError, OSError) as e:
+                    log.warn('Unable to save retained sizes: %s' % e)
+            return dominators
+
+        def tick():
+            self.progress.set_fraction(state['fraction'])
+
+        def built(dominators, error):
+            if self.dominators_building is graph:
+                self.dominators_building = None
+            self.progress.hide()
+            if graph is not self.heap_graph:
+                return  # Another dump was loaded meanwhile
+            if error is not None:
+                log.error('Unable to compute retained sizes: %s' % error)
+                return
+            self.dominators = dominators
+            self.show_type_retained()
+            done(dominators)
+
+        self.progress.show()
+        self.update_progress(0.0, "Computing retained sizes")
+        self.run_in_background(build, built, tick)
+
+    def show_type_retained(self):
+        type_retained = self.dominators.type_retained()
+        row = self.obj_store.get_iter_first()
+        while row is not None:
+            kind = self.obj_store.get_value(row, 7)
+            self.obj_store.set_value(row, 8, type_retained.get(kind, 0))
+            row = self.obj_store.iter_next(row)
+
+    def retained(self, i):
+        if self.dominators is None:
+            return 0
+        return self.dominators.retained[i]
+
+    def show_retainers(self, widget):
+        self.build_dominators(self.list_retainers)
+
+    def list_retainers(self, dominators):
+        graph = self.heap_graph
+        self.instance_store.clear()
+        for i in dominators.biggest(INSTANCE_LIMIT):
+            self.instance_store.append(['0x%x' % graph.addresses[i],
+                                        graph.type_name(i), graph.sizes[i],
+                                        dominators.retained[i]])
+
+    def obj_row_activated_cb(self, view, path, col, store):
+        graph = self.get_heap_graph()
+        if graph is None:
+            return
+        kind = store.get_value(store.get_iter(path), 7)
+        self.instance_store.clear()
+        for i in graph.largest(kind, INSTANCE_LIMIT):
+            self.instance_store.append(['0x%x' % graph.addresses[i],
+                                        graph.type_name(i), graph.sizes[i],
+                                        self.retained(i)])
+
+    def instance_row_activated_cb(self, view, path, col, store):
+        graph = self.get_heap_graph()
+        address = int(store.get_value(store.get_iter(path), 0), 16)
+        i = graph.index(address)
+        if i < 0:
+            return
+        lines = [graph.describe(i)]
+        if self.dominators is not None:
+            idom = self.dominators.idom[i]
+            lines.append('Retains %s' % humanize_bytes(self.retained(i)))
+            if idom != self.dominators.root:
+                lines.append('Immediate dominator: ' + graph.describe(idom))
+        lines.extend(['', 'Referrers:'])
+        referrers = graph.referrers(i)
+        for referrer in referrers[:INSTANCE_LIMIT]:
+            lines.append('    ' + graph.describe(referrer))
+        if len(referrers) > INSTANCE_LIMIT:
+            lines.append('    ... %d more' % (len(referrers) - INSTANCE_LIMIT))
+        lines.extend(['', 'Shortest path from a GC root:'])
+        path = graph.path_to_root(i)
+        if not path:
+            lines.append('    No root found')
+        for depth, node in enumerate(path):
+            lines.append('    ' + '  ' * depth + graph.describe(node))
+        self.obj_buffer.set_text('\n'.join(lines))
 
     def generate_description(self, title):
         p = psutil.Process(self.proc.pid)
+        self.create_web_views()
 
         self.info_html = """
         <html><head>
@@ -407,6 +1923,9 @@ class PyrasiteWindow(Gtk.Window):
                             </td>
                             <td>
                                 <span id="mem_graph" class="mem_graph"></span>
+                                <div>Fragmentation:
+                                    <span id="frag_details"/></div>
+                                <span id="frag_graph"></span>
                             </td>
                         </tr>
                     </tbody>
@@ -444,19 +1963,6 @@ class PyrasiteWindow(Gtk.Window):
         process_status = ""
 
         self.info_html += """
-        <div class="grid">
-            <table>
-                <thead><tr><th>Open Files</th></tr></thead>
-                <tbody id="open_files"></tbody>
-            </table>
-        </div>
-        <br/>
-        <div class="grid">
-            <table>
-                <thead><tr><th colspan="4">Connections</th></tr></thead>
-                <tbody id="open_connections"></tbody>
-            </table>
-        </div>
         </body></html>
         """
 
@@ -495,6 +2001,9 @@ class PyrasiteWindow(Gtk.Window):
 
         if not self.resource_thread:
             self.resource_thread = ResourceUsagePoller(self.proc.pid)
+            self.resource_thread.files_interval = \
+                    self.resource_thread.connections_interval = \
+                    self.scan_spinner.get_value()
             self.resource_thread.daemon = True
             self.resource_thread.info_view = self.info_view
             self.resource_thread.start()
@@ -506,16 +2015,18 @@ class PyrasiteWindow(Gtk.Window):
 
     def inject_js(self):
         log.debug("Injecting jQuery")
+        if self.jquery_js is None:
+            self.load_javascript()
         self.info_view.execute_script(self.jquery_js)
         self.info_view.execute_script(self.jquery_sparkline_js)
 
+    @timed('render_resource_usage')
     def render_resource_usage(self):
         """
         Render our resource usage using jQuery+Sparklines in our WebKit view
         """
         global cpu_intervals, mem_intervals, cpu_details, mem_details
         global read_intervals, write_intervals, read_bytes, write_bytes
-        global open_files, open_connections
         global process_title, process_status
         script = """
             jQuery('#cpu_graph').sparkline(%s, {'height': 75, 'width': 250,
@@ -536,9 +2047,14 @@ class PyrasiteWindow(Gtk.Window):
                 spotRadius: 3});
             jQuery('#read_details').text('%s');
             jQuery('#write_details').text('%s');
+            jQuery('#frag_graph').sparkline(%s, {'height': 30, 'width': 250,
+                lineColor: '#204a87', fillColor: '#729fcf',
+                chartRangeMin: 0, chartRangeMax: 100, spotRadius: 2});
+            jQuery('#frag_details').text('%s');
         """ % (cpu_intervals, mem_intervals, cpu_details, mem_details,
                read_intervals, write_intervals, humanize_bytes(read_bytes),
-               humanize_bytes(write_bytes))
+               humanize_bytes(write_bytes), frag_intervals,
+               frag_details or 'not watched')
 
         for i, thread in enumerate(thread_intervals):
             script += """
@@ -549,34 +2065,578 @@ class PyrasiteWindow(Gtk.Window):
                    or "'height': 75, 'width': 575,", thread_colors[thread],
                    thread_colors[thread])
 
-        if open_files:
-            script += """
-                jQuery('#open_files').html('%s');
-            """ % ''.join(['<tr%s><td>%s</td></tr>' %
-                           (i % 2 and ' class="alt"' or '', open_file)
-                           for i, open_file in enumerate(open_files)])
-
-        if open_connections:
-            row = '<tr%s><td>%s</td><td>%s</td><td>%s</td><td>%s</td></tr>'
-            script += """
-                jQuery('#open_connections').html('%s');
-            """ % ''.join([row % (i % 2 and ' class="alt"' or '',
-                                  conn['type'], conn['local'],
-                                  conn['remote'], conn['status'])
-                           for i, conn in enumerate(open_connections)])
-
         script += """
             jQuery('#proc_title').text('%s %s');
         """ % (str(process_title).strip(), process_status)
         self.info_view.execute_script(script)
+        self.update_thread_table()
+        self.apply_resource_changes()
+        self.update_memory_breakdown()
+        self.check_triggers()
+        return True
+
+    def update_memory_breakdown(self):
+        """Show the latest smaps breakdown, if the poller has a new one"""
+        if mem_breakdown is self.shown_breakdown:
+            return
+        self.shown_breakdown = breakdown = mem_breakdown
+        self.memory_store.clear()
+        for name in memory.CATEGORIES:
+            summary = breakdown.get(name)
+            if summary:
+                self.memory_store.append([
+                    name, summary['rss'], summary['pss'], summary['uss'],
+                    summary['shared'], summary['swap']])
+
+    def create_allocator_panel(self):
+        """pymalloc's size classes, and a toggle to chart fragmentation"""
+        # size, pools, blocks in use, free blocks, bytes in use, free bytes
+        self.malloc_store = Gtk.ListStore(*[GObject.TYPE_INT64] * 6)
+        view = Gtk.TreeView(model=self.malloc_store)
+        for i, title in enumerate(('Size class', 'Pools', 'Blocks used',
+                                   'Blocks free', 'Bytes used',
+                                   'Bytes free')):
+            column = Gtk.TreeViewColumn(title=title,
+                                        cell_renderer=Gtk.CellRendererText(),
+                                        text=i)
+            column.set_sort_column_id(i)
+            view.append_column(column)
+        scrolled_window = Gtk.ScrolledWindow(hadjustment=None,
+                                             vadjustment=None)
+        scrolled_window.set_policy(Gtk.PolicyType.AUTOMATIC,
+                                   Gtk.PolicyType.AUTOMATIC)
+        scrolled_window.add(view)
+
+        controls = Gtk.HBox(False, 0)
+        self.malloc_watch = None
+        self.malloc_button = Gtk.ToggleButton('Watch allocator')
+        self.malloc_button.connect('toggled', self.watch_allocator)
+        controls.pack_start(self.malloc_button, False, False, 0)
+        self.malloc_status = Gtk.Label()
+        self.malloc_status.set_alignment(0, 0.5)
+        controls.pack_start(self.malloc_status, True, True, 6)
+
+        box = Gtk.VBox()
+        box.pack_start(controls, False, False, 0)
+        box.pack_start(scrolled_window, True, True, 0)
+        return box
+
+    def watch_allocator(self, button):
+        """Poll the target's allocator statistics while toggled on"""
+        self.malloc_watch = None
+        if not button.get_active():
+            return
+        if not getattr(self, 'proc', None) or self.no_inject:
+            button.set_active(False)
+            return
+        # A new tuple each time, so timers from earlier watches stop
+        watch = self.malloc_watch = (self.proc,)
+        if self.poll_allocator(watch):
+            GObject.timeout_add(int(MALLOC_INTERVAL * 1000),
+                                self.poll_allocator, watch)
+
+    @timed('malloc_stats.poll')
+    def poll_allocator(self, watch):
+        global frag_details
+        if watch is not self.malloc_watch:
+            return False
+        try:
+            stats = watch[0].call_payload('malloc_stats', 'stats')
+        except (PayloadError, socket.error) as e:
+            log.error('Unable to read allocator statistics: %s' % e)
+            self.malloc_button.set_active(False)
+            return False
+
+        pymalloc, glibc = stats['pymalloc'], stats['glibc']
+        parts = []
+        self.malloc_store.clear()
+        if pymalloc:
+            for size_class in pymalloc['classes']:
+                self.malloc_store.append([
+                    size_class['size'], size_class['pools'],
+                    size_class['used'], size_class['free'],
+                    size_class['used_bytes'], size_class['free_bytes']])
+            frag_intervals.append(round(100 * pymalloc['fragmentation'], 1))
+            del frag_intervals[:-INTERVALS]
+            parts.append('pymalloc: %d arenas (peak %d), %s of %s in use, '
+                         '%d unused pools, %0.1f%% fragmented' % (
+                             pymalloc['arenas'], pymalloc['arenas_highwater'],
+                             humanize_bytes(pymalloc['allocated']),
+                             humanize_bytes(pymalloc['arena_bytes']),
+                             pymalloc['unused_pools'],
+                             100 * pymalloc['fragmentation']))
+            frag_details = '%0.1f%% of %s in arenas' % (
+                100 * pymalloc['fragmentation'],
+                humanize_bytes(pymalloc['arena_bytes']))
+        else:
+            parts.append('pymalloc not in use')
+        if glibc:
+            parts.append('glibc: %d heaps, %s free of %s, %s mmapped' % (
+                glibc['heaps'], humanize_bytes(glibc['free']),
+                humanize_bytes(glibc.get('system', 0)),
+                humanize_bytes(glibc.get('mmap', 0))))
+        self.malloc_status.set_text('; '.join(parts))
+        return True
+
+    def create_triggers_panel(self):
+        """Thresholds that capture the selected process when exceeded"""
+        grid = Gtk.Grid()
+        grid.set_column_spacing(6)
+        self.trigger_widgets = []
+        for row, (name, enabled, threshold, seconds) in enumerate(
+                TRIGGER_DEFAULTS):
+            description, unit = [(description, unit) for metric, description,
+                                 unit in triggers.METRICS if metric == name][0]
+            check = Gtk.CheckButton(description)
+            check.set_active(enabled)
+            limit = Gtk.SpinButton()
+            limit.configure(Gtk.Adjustment(threshold, 0, 1e9, 1, 10, 0), 0, 0)
+            duration = Gtk.SpinButton()
+            duration.configure(Gtk.Adjustment(seconds, 1, triggers.HISTORY,
+                                              1, 10, 0), 0, 0)
+            for column, widget in enumerate((check, limit, Gtk.Label(unit),
+                                             Gtk.Label('for (seconds)'),
+                                             duration)):
+                grid.attach(widget, column, row, 1, 1)
+            self.trigger_widgets.append((name, check, limit, duration))
+
+        limits = Gtk.HBox(False, 0)
+        limits.pack_start(Gtk.Label('Capture at most once every (minutes): '),
+                          False, False, 0)
+        self.trigger_interval = Gtk.SpinButton()
+        self.trigger_interval.configure(Gtk.Adjustment(5, 1, 1440, 1, 10, 0),
+                                        0, 0)
+        limits.pack_start(self.trigger_interval, False, False, 0)
+        limits.pack_start(Gtk.Label(' and per hour: '), False, False, 0)
+        self.trigger_hourly = Gtk.SpinButton()
+        self.trigger_hourly.configure(Gtk.Adjustment(4, 1, 60, 1, 5, 0), 0, 0)
+        limits.pack_start(self.trigger_hourly, False, False, 0)
+        self.trigger_limiter = triggers.RateLimiter()
+        self.capturing = False
+
+        # when, pid, reason, path
+        self.captures_store = Gtk.ListStore(str, str, str, str)
+        view = Gtk.TreeView(model=self.captures_store)
+        for i, title in enumerate(('Captured', 'PID', 'Reason')):
+            column = Gtk.TreeViewColumn(title=title,
+                                        cell_renderer=Gtk.CellRendererText(),
+                                        text=i)
+            column.set_resizable(True)
+            view.append_column(column)
+        view.connect('row_activated', self.capture_activated_cb)
+        self.captures_listed = False
+        scrolled_window = Gtk.ScrolledWindow(hadjustment=None,
+                                             vadjustment=None)
+        scrolled_window.set_policy(Gtk.PolicyType.AUTOMATIC,
+                                   Gtk.PolicyType.AUTOMATIC)
+        scrolled_window.add(view)
+
+        box = Gtk.VBox()
+        box.pack_start(grid, False, False, 0)
+        box.pack_start(limits, False, False, 6)
+        box.pack_start(scrolled_window, True, True, 0)
+        return box
+
+    def switch_resource_page(self, notebook, page, pagenum):
+        if page == self.triggers_page and not self.captures_listed:
+            self.list_captures()
+
+    def list_captures(self):
+        """Add the trigger captures saved by earlier sessions"""
+        self.captures_listed = True
+        for path in captures.paths('trigger'):
+            kind, pid, created = os.path.basename(path)[:-5].rsplit('-', 2)
+            self.captures_store.append([
+                time.ctime(int(created) / 1000), pid, '', path])
+
+    def check_triggers(self):
+        """Capture the selected process if any enabled trigger fires"""
+        if not getattr(self, 'proc', None) or self.capturing:
+            return
+        for name, check, limit, duration in self.trigger_widgets:
+            if not check.get_active():
+                continue
+            trigger = triggers.Trigger(name, limit.get_value(),
+                                       duration.get_value())
+            value = trigger.value(metric_history)
+            if value is None or value <= trigger.threshold:
+                continue
+            self.trigger_limiter.interval = \
+                self.trigger_interval.get_value() * 60
+            self.trigger_limiter.limit = self.trigger_hourly.get_value()
+            if self.trigger_limiter.allow():
+                self.capture(trigger.describe(value))
+            else:
+                log.debug('Trigger rate limited: %s' % trigger.describe(value))
+            return
+
+    @timed('trigger.capture')
+    def capture(self, reason):
+        """Save stacks, a short profile and a heap summary of the selected
+        process with the metrics that led up to `reason`, collected on a
+        worker thread"""
+        proc = self.proc
+        no_inject = self.no_inject
+        log.warn('Capturing %s: %s' % (proc.title.strip(), reason))
+        capture = dict(pid=proc.pid, title=proc.title.strip(), reason=reason,
+                       history=metric_history.to_list())
+
+        def collect():
+            try:
+                if no_inject:
+                    sampler = remote_sampler.RemoteSampler(proc.pid)
+                    capture['stacks'] = remote_sampler.format_stacks(
+                        sampler.sample())
+                    capture['profile'] = remote_sampler.profile(
+                        proc.pid, TRIGGER_PROFILE_DURATION,
+                        REMOTE_SAMPLE_INTERVAL, sampler)
+                else:
+                    capture['stacks'] = proc.dump_stacks()
+                    capture['profile'] = proc.wait_payload(
+                        'sampler', 'sample', duration=TRIGGER_PROFILE_DURATION,
+                        **TRIGGER_BUDGET)
+                    capture['heap'] = proc.wait_payload(
+                        'type_summary', 'summary', **TRIGGER_BUDGET)
+            except (PayloadError, remote_sampler.SamplerError,
+                    socket.error) as e:
+                log.error('Capture incomplete: %s' % e)
+                capture['error'] = str(e)
+            return captures.save('trigger', capture)
+
+        def saved(path, error):
+            self.capturing = False
+            if error is not None:
+                log.error('Unable to save capture: %s' % error)
+                return
+            if self.captures_listed:
+                self.captures_store.prepend([time.ctime(), str(proc.pid),
+                                             reason, path])
+            if capture.get('profile'):
+                self.profile_choices_stale = True
+
+        self.capturing = True
+        self.run_in_background(collect, saved)
+
+    def capture_activated_cb(self, view, path, col):
+        store = view.get_model()
+        row = store.get_iter(path)
+        try:
+            capture = captures.load(store.get_value(row, 3))
+        except (IOError, ValueError) as e:
+            log.error('Unable to open capture: %s' % e)
+            return
+        store.set_value(row, 2, capture.get('reason', ''))
+        self.show_capture(capture)
+
+    def show_capture(self, capture):
+        """Show a trigger capture's stacks in the Stacks tab, and the rest
+        in the Fleet tab"""
+        self.source_buffer.set_text(capture.get('stacks') or
+                                    capture.get('error', ''))
+        self.fontify()
+        self.fleet_store.clear()
+        row = self.fleet_store.append(None, [
+            'Metrics before: %s' % capture.get('reason', ''),
+            len(capture['history']), time.ctime(capture['created'])])
+        for when, metrics in capture['history']:
+            self.fleet_store.append(row, [
+                time.strftime('%H:%M:%S', time.localtime(when)),
+                int(metrics.get('cpu', 0)), 'RSS %s, %s threads, %s '
+                'connections' % (humanize_bytes(metrics.get('rss', 0)),
+                                 metrics.get('threads'),
+                                 metrics.get('connections'))])
+        if capture.get('profile'):
+            row = self.fleet_store.append(None, [
+                'Profile', capture['profile']['samples'], 'samples'])
+            self.show_call_tree(capture['profile'], row)
+        if capture.get('heap'):
+            row = self.fleet_store.append(None, ['Heap summary', 0, ''])
+            self.show_merged_summaries(
+                fleet.merge_summaries({capture['pid']: capture['heap']}), row)
+        self.notebook.set_current_page(self.notebook.page_num(self.fleet_page))
+
+    def create_filtered_list(self, columns):
+        """
+        Build a sortable, filterable list view over a new ListStore.
+
+        `columns` is a sequence of (title, type, width) tuples.  Returns the
+        containing widget, the view, the backing store and a label for
+        summaries.
+        """
+        store = Gtk.ListStore(*[column[1] for column in columns])
+        store_filter = store.filter_new()
+        entry = Gtk.Entry()
+        entry.set_placeholder_text('Filter')
+
+        def visible(model, row, data):
+            text = entry.get_text().lower()
+            if not text:
+                return True
+            return any(text in str(value).lower() for value in model[row])
+
+        store_filter.set_visible_func(visible)
+        entry.connect('changed', lambda entry: store_filter.refilter())
+
+        view = Gtk.TreeView(model=Gtk.TreeModelSort(model=store_filter))
+        for i, (title, type, width) in enumerate(columns):
+            column = Gtk.TreeViewColumn(title=title,
+                                        cell_renderer=Gtk.CellRendererText(),
+                                        text=i)
+            column.set_sort_column_id(i)
+            column.set_resizable(True)
+            column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
+            column.set_fixed_width(width)
+            view.append_column(column)
+        # Only rows scrolled into view are measured and rendered
+        view.set_fixed_height_mode(True)
+
+        scrolled_window = Gtk.ScrolledWindow(hadjustment=None,
+                                             vadjustment=None)
+        scrolled_window.set_policy(Gtk.PolicyType.AUTOMATIC,
+                                   Gtk.PolicyType.AUTOMATIC)
+        scrolled_window.add(view)
+
+        summary = Gtk.Label()
+        summary.set_alignment(0, 0.5)
+        summary.set_line_wrap(True)
+        top = Gtk.HBox(False, 0)
+        top.pack_start(entry, False, False, 0)
+        top.pack_start(summary, True, True, 5)
+
+        box = Gtk.VBox()
+        box.pack_start(top, False, False, 0)
+        box.pack_start(scrolled_window, True, True, 0)
+        return box, view, store, summary
+
+    def apply_diff(self, changes, store, rows, view, on_add, on_remove,
+                   counters):
+        """Apply queued (added, removed) batches to a ListStore"""
+        batches = []
+        while changes:
+            batches.append(changes.popleft())
+        if not batches:
+            return False
+        size = sum(len(batch[0]) + len(batch[1]) for batch in batches
+                   if batch is not None)
+        model = None
+        if size > BULK_UPDATE:
+            model = view.get_model()
+            view.set_model(None)
+        for batch in batches:
+            if batch is None:
+                # The poller was reset, start over
+                store.clear()
+                rows.clear()
+                for counter in counters:
+                    counter.clear()
+                continue
+            added, removed = batch
+            for key in removed:
+                row = rows.pop(key, None)
+                if row is not None:
+                    store.remove(row)
+                    on_remove(key)
+            for key, values in added:
+                if key not in rows:
+                    rows[key] = store.append(values)
+                    on_add(key)
+        if model is not None:
+            view.set_model(model)
         return True
 
+    def apply_resource_changes(self):
+        def file_added(key):
+            self.file_dirs.update([os.path.dirname(key[0])])
+
+        def file_removed(key):
+            discount(self.file_dirs, os.path.dirname(key[0]))
+
+        if self.apply_diff(file_changes, self.files_store, self.file_rows,
+                           self.files_view, file_added, file_removed,
+                           (self.file_dirs,)):
+            self.files_summary.set_text('%d open files.  %s' % (
+                len(self.file_rows), summarize_counts(self.file_dirs)))
+
+        def host_of(key):
+            return key[2].rsplit(':', 1)[0]
+
+        def conn_added(key):
+            self.remote_hosts.update([host_of(key)])
+            self.conn_states.update([key[3]])
+
+        def conn_removed(key):
+            discount(self.remote_hosts, host_of(key))
+            discount(self.conn_states, key[3])
+
+        if self.apply_diff(connection_changes, self.conns_store,
+                           self.conn_rows, self.conns_view,
+                           conn_added, conn_removed,
+                           (self.remote_hosts, self.conn_states)):
+            self.conns_summary.set_text('%d connections.  %s.  Remote: %s' % (
+                len(self.conn_rows), summarize_counts(self.conn_states),
+                summarize_counts(self.remote_hosts)))
+
+    def clear_resource_lists(self):
+        connection_changes.clear()
+        file_changes.clear()
+        for store, rows, counters in (
+                (self.files_store, self.file_rows, (self.file_dirs,)),
+                (self.conns_store, self.conn_rows, (self.remote_hosts,
+                                                    self.conn_states))):
+            store.clear()
+            rows.clear()
+            for counter in counters:
+                counter.clear()
+        self.files_summary.set_text('')
+        self.conns_summary.set_text('')
+
+    def scan_interval_changed(self, spinner):
+        if self.resource_thread:
+            self.resource_thread.files_interval = spinner.get_value()
+            self.resource_thread.connections_interval = spinner.get_value()
+
+    def refresh_thread_names(self, tids):
+        """
+        Map native thread ids to the target's Python thread names, listing
+        the threads on a worker thread
+        """
+        self.thread_names_fetched = time.time()
+        # Native threads have no Python name, so only look each tid up once
+        # until THREAD_REFRESH passes
+        self.thread_names_seen = set(tids)
+        if self.no_inject or self.listing_threads:
+            return
+        proc = self.proc
+
+        def listed(output, error):
+            self.listing_threads = False
+            if proc is not self.proc:
+                return
+            if error is not None:
+                log.debug('Unable to list threads: %s' % error)
+                return
+            try:
+                threads = json.loads(output)
+            except ValueError:
+                log.debug('Unable to list threads: %r' % output)
+                return
+            names = {}
+            for ident, native_id, name, frame in threads:
+                if native_id is None and name == 'MainThread':
+                    native_id = proc.pid  # Python < 3.8
+                if native_id is not None:
+                    names[native_id] = dict(ident=ident, name=name,
+                                            frame=frame)
+            thread_names.clear()
+            thread_names.update(names)
+
+        self.listing_threads = True
+        self.run_in_background(lambda: proc.cmd(THREAD_INFO_CMD), listed)
+
+    def update_thread_table(self):
+        tids = set(live_threads)
+        if not tids:
+            return
+        if (not tids.issubset(self.thread_names_seen) or
+                time.time() - self.thread_names_fetched > THREAD_REFRESH):
+            self.refresh_thread_names(tids)
+
+        rows = {}
+        row = self.thread_store.get_iter_first()
+        while row is not None:
+            tid = self.thread_store.get_value(row, 0)
+            if tid in tids:
+                rows[tid] = row
+                row = self.thread_store.iter_next(row)
+            elif not self.thread_store.remove(row):
+                row = None
+
+        for tid in tids:
+            intervals = thread_intervals.get(tid)
+            cpu = intervals and intervals[-1] * 100 / POLL_INTERVAL or 0.0
+            info = thread_names.get(tid, {})
+            ident = info.get('ident')
+            values = [tid, info.get('name', ''), round(cpu, 2),
+                      info.get('frame', ''),
+                      '#' + thread_colors.get(tid, 'ffffff'),
+                      ident is not None and '0x%x' % ident or '']
+            if tid in rows:
+                self.thread_store.set(rows[tid], list(range(len(values))),
+                                      values)
+            else:
+                self.thread_store.append(values)
+
+    def thread_row_activated_cb(self, view, path, col, store):
+        """Jump to the stack of the activated thread"""
+        ident = store.get_value(store.get_iter(path), 5)
+        if self.no_inject:
+            # Sampled stacks are headed by native thread ids
+            ident = store.get_value(store.get_iter(path), 0)
+        if not ident:
+            return
+        self.progress.show()
+        if self.no_inject:
+            self.sample_remote_stacks(self.section_progress(0.0, 1.0))
+        else:
+            self.dump_stacks(self.section_progress(0.0, 1.0))
+        self.fontify()
+        self.progress.hide()
+        self.notebook.set_current_page(1)
+
+        start = self.source_buffer.get_start_iter()
+        match = start.forward_search('Thread %s' % ident, 0, None)
+        if match:
+            self.source_buffer.place_cursor(match[0])
+            self.stacks_view.scroll_to_iter(match[0], 0.0, True, 0.0, 0.0)
+
     def _section_progress(self, start, end, fraction, text=None):
         self.update_progress(start + ((end - start) * fraction), text)
 
     def section_progress(self, start, end):
         return partial(self._section_progress, start, end)
 
+    def run_job(self, proc, name, func, done, *args, **kw):
+        """
+        Run a payload function on a thread of its own in `proc`, polling it
+        from a timer so the GUI keeps running.  `done(result, error)` is
+        called once it finishes or fails.
+        """
+        try:
+            job = proc.spawn_payload(name, func, *args, **kw)
+        except (PayloadError, socket.error) as e:
+            done(None, e)
+            return
+
+        def poll():
+            try:
+                finished, result = proc.poll_payload(job)
+            except (PayloadError, socket.error) as e:
+                done(None, e)
+                return False
+            if finished:
+                done(result, None)
+            return not finished
+
+        GObject.timeout_add(int(JOB_INTERVAL * 1000), poll)
+
+    def run_in_background(self, func, done, tick=None):
+        """
+        Call `func()` on a worker thread, then `done(result, error)` from a
+        timer on the GTK thread.  `func` must not touch GTK, `tick()` is
+        called from the timer while it runs.
+        """
+        pool = fleet.FanOut(lambda item: func(), [None])
+
+        def poll():
+            if not pool.finished():
+                if tick is not None:
+                    tick()
+                return True
+            done(pool.results.get(None), pool.errors.get(None))
+            return False
+
+        GObject.timeout_add(int(JOB_INTERVAL * 1000), poll)
+
     def update_progress(self, fraction, text=None):
         if text:
             self.progress.set_text(text + '...')
@@ -599,14 +2659,16 @@ class PyrasiteWindow(Gtk.Window):
         treeiter = sel[1]
         title = model.get_value(treeiter, 0)
         proc = model.get_value(treeiter, 1)  # type: Process
+        if getattr(self, 'proc', None) is not proc:
+            self.clear_inspector()
         self.proc = proc
 
         if self.pid and proc.pid != self.pid:
             global cpu_intervals, mem_intervals, write_intervals, \
                    read_intervals, cpu_details, mem_details, read_count, \
                    read_bytes, thread_totals, write_count, write_bytes, \
-                   thread_intervals, thread_colors, open_files, \
-                   open_connections
+                   thread_intervals, thread_colors, live_threads, \
+                   mem_rollup, mem_breakdown, frag_intervals, frag_details
             cpu_intervals = [0.0]
             mem_intervals = []
             write_intervals = []
@@ -616,17 +2678,41 @@ class PyrasiteWindow(Gtk.Window):
             thread_intervals = {}
             thread_colors = {}
             thread_totals = {}
-            open_connections = []
-            open_files = []
+            live_threads = set()
+            mem_rollup = {}
+            mem_breakdown = {}
+            frag_intervals = []
+            frag_details = ''
+            metric_history.clear()
+            thread_names.clear()
+            self.thread_names_seen = set()
+            self.thread_store.clear()
+            if self.resource_thread:
+                self.resource_thread.reset()
+            self.clear_resource_lists()
+            self.stop_io_profile()
+            self.stop_watching_tasks()
+            self.stop_lock_profile()
+            self.lines_watch = self.bloat_watch = self.modules_watch = None
+            self.malloc_button.set_active(False)
 
         self.pid = proc.pid
 
         # Analyze the process
         self.generate_description(title)
 
-        # Inject a reverse subshell
+        if self.no_inject:
+            self.sample_remote_stacks(self.section_progress(0.2, 0.3))
+            self.generate_callgraph(1, self.section_progress(0.3, 0.9))
+            self.fontify()
+            self.update_progress(1.0)
+            self.progress.hide()
+            self.update_progress(0.0)
+            return
+
+        # Inject a reverse subshell, again if a timeout dropped the last one
         self.update_progress(0.2, "Injecting reverse connection")
-        if proc.title not in self.processes:
+        if proc.title not in self.processes or proc.sock is None:
             proc.connect()
             self.processes[proc.title] = proc
 
@@ -640,11 +2726,14 @@ class PyrasiteWindow(Gtk.Window):
         ## Call Stack
         self.generate_callgraph(1, self.section_progress(0.45, 0.6))
 
-        # Dump objects and load them into our store
-        try:
-            self.dump_objects(self.section_progress(0.65, 0.85))
-        except socket.timeout:
-            log.info('dump_objects() timed out')
+        # Reopen this process's last heap snapshot, or dump a new one
+        snapshot = self.latest_snapshot()
+        if not snapshot or not self.open_snapshot(snapshot):
+            try:
+                self.dump_objects(self.section_progress(0.65, 0.85))
+            except socket.timeout:
+                log.info('dump_objects() timed out')
+        self.refresh_snapshots()
 
         # Shell
         self.update_progress(0.9, "Determining Python version")
@@ -656,7 +2745,360 @@ class PyrasiteWindow(Gtk.Window):
         self.progress.hide()
         self.update_progress(0.0)
 
-    def add_paths(self):
+    def create_fleet_selector(self, tree_store):
+        """A multi-select view of the processes to fan operations out to"""
+        view = Gtk.TreeView(model=tree_store)
+        view.get_selection().set_mode(Gtk.SelectionMode.MULTIPLE)
+        view.append_column(Gtk.TreeViewColumn(
+            title='Processes', cell_renderer=Gtk.CellRendererText(), text=0))
+        view.set_headers_visible(False)
+        self.fleet_selection = view.get_selection()
+
+        scrolled_window = Gtk.ScrolledWindow(hadjustment=None,
+                                             vadjustment=None)
+        scrolled_window.set_policy(Gtk.PolicyType.AUTOMATIC,
+                                   Gtk.PolicyType.AUTOMATIC)
+        scrolled_window.add(view)
+
+        workers_box = Gtk.HBox(False, 0)
+        workers_box.pack_start(Gtk.Label('Workers: '), False, False, 0)
+        adj = Gtk.Adjustment(fleet.WORKERS, 1.0, 64.0, 1.0, 4.0, 0.0)
+        self.fleet_workers = Gtk.SpinButton()
+        self.fleet_workers.configure(adj, 0, 0)
+        workers_box.pack_start(self.fleet_workers, False, False, 0)
+
+        buttons = Gtk.HBox(True, 0)
+        for label, operation in (('Stacks', self.fleet_stacks),
+                                 ('Profile', self.fleet_profile),
+                                 ('Objects', self.fleet_objects)):
+            button = Gtk.Button(label)
+            button.connect('clicked', lambda button, op: self.fan_out(op),
+                           operation)
+            buttons.pack_start(button, True, True, 0)
+
+        self.growth_watch = None
+        self.growth_reading = None  # the watch whose reading is running
+        growth_button = Gtk.ToggleButton('Watch memory growth')
+        growth_button.connect('toggled', self.watch_fleet_memory)
+
+        box = Gtk.VBox()
+        box.pack_start(scrolled_window, True, True, 0)
+        box.pack_start(workers_box, False, False, 0)
+        box.pack_start(buttons, False, False, 0)
+        box.pack_start(growth_button, False, False, 0)
+        return box
+
+    def watch_fleet_memory(self, button):
+        """Track how fast the selected workers' private memory grows"""
+        self.growth_watch = None
+        if not button.get_active():
+            return
+        model, paths = self.fleet_selection.get_selected_rows()
+        procs = [model.get_value(model.get_iter(path), 1) for path in paths]
+        if not procs:
+            button.set_active(False)
+            return
+        # A new tuple each time, so timers from earlier watches stop
+        watch = self.growth_watch = (procs, memory.Growth())
+        self.sample_fleet_memory(watch)
+        self.notebook.set_current_page(self.notebook.page_num(self.fleet_page))
+        GObject.timeout_add(int(GROWTH_INTERVAL * 1000),
+                            self.sample_fleet_memory, watch)
+
+    def sample_fleet_memory(self, watch):
+        """Read the workers' memory on worker threads, for as long as
+        `watch` is current"""
+        if watch is not self.growth_watch:
+            return False
+        if self.growth_reading is watch:
+            return True  # Still reading, skip this round
+        procs, growth = watch
+        workers = self.fleet_workers.get_value_as_int()
+
+        def read(proc):
+            return (rollups.get(proc.pid),
+                    psutil.Process(proc.pid).create_time())
+
+        def read_all():
+            pool = fleet.FanOut(read, procs, workers=workers)
+            while not pool.finished():
+                time.sleep(0.01)
+            return time.time(), pool.results, pool.errors
+
+        def done(result, error):
+            if self.growth_reading is watch:
+                self.growth_reading = None
+            if watch is not self.growth_watch:
+                return
+            if error is not None:
+                log.error('Unable to read fleet memory: %s' % error)
+                return
+            self.show_fleet_memory(growth, *result)
+
+        self.growth_reading = watch
+        self.run_in_background(read_all, done)
+        return True
+
+    @timed('fleet.memory')
+    def show_fleet_memory(self, growth, now, results, errors):
+        for proc, (summary, started) in results.items():
+            growth.add(proc.pid, summary, now)
+
+        self.fleet_store.clear()
+        for proc in sorted(results, key=lambda proc: -growth.rate(proc.pid)):
+            summary, started = results[proc]
+            age = max(now - started, 1.0)
+            self.fleet_store.append(None, [
+                'pid %d: %s' % (proc.pid, proc.title.strip()),
+                summary['uss'],
+                'private %s, PSS %s, shared %s; private growing %s/min now, '
+                '%s/min since start' % (
+                    humanize_bytes(summary['uss']),
+                    humanize_bytes(summary['pss']),
+                    humanize_bytes(summary['shared']),
+                    humanize_bytes(growth.rate(proc.pid) * 60),
+                    humanize_bytes(summary['uss'] / age * 60))])
+        for proc, error in errors.items():
+            self.fleet_store.append(None, ['pid %d' % proc.pid, 0,
+                                           str(error)])
+
+    def fan_out(self, operation):
+        """Run `operation(proc)` on every selected process concurrently"""
+        model, paths = self.fleet_selection.get_selected_rows()
+        procs = [model.get_value(model.get_iter(path), 1) for path in paths]
+        if not procs:
+            return
+        name = operation.__name__
+        # Workers must not touch GTK, so read any settings up front
+        self.sample_size = self.spinner.get_value()
+
+        def run(proc):
+            if proc.title not in self.processes or proc.sock is None:
+                proc.connect()
+                self.add_paths(proc)
+            return operation(proc)
+
+        self.progress.show()
+        self.update_progress(0.0, "Running %s on %d processes" % (
+            name, len(procs)))
+        with timings.span(name):
+            pool = fleet.FanOut(run, procs,
+                                workers=self.fleet_workers.get_value_as_int())
+            while not pool.finished():
+                self.update_progress(max(pool.progress, 0.01))
+                time.sleep(0.05)
+        for proc in pool.results:
+            self.processes.setdefault(proc.title, proc)
+        for proc, error in pool.errors.items():
+            log.error('%s failed on %s: %s' % (name, proc.title.strip(), error))
+
+        results = dict((proc.pid, result)
+                       for proc, result in pool.results.items())
+        self.fleet_store.clear()
+        getattr(self, 'render_' + name)(results)
+        self.notebook.set_current_page(self.notebook.page_num(self.fleet_page))
+        self.progress.hide()
+
+    def fleet_stacks(self, proc):
+        return proc.dump_stacks()
+
+    def render_fleet_stacks(self, dumps):
+        self.show_merged_stacks(fleet.merge_stacks(dumps))
+
+    def show_merged_stacks(self, merged):
+        for stack, count, pids in merged:
+            lines = stack.splitlines()
+            title = lines and lines[-1].strip() or '(empty)'
+            row = self.fleet_store.append(None, [
+                title, count, '%d processes: %s' % (
+                    len(pids), ', '.join(map(str, pids)))])
+            for line in lines:
+                self.fleet_store.append(row, [line, 0, ''])
+
+    def fleet_profile(self, proc):
+        return proc.wait_payload('sampler', 'sample',
+                                 duration=self.sample_size)
+
+    def render_fleet_profile(self, results):
+        titles = dict((proc.pid, proc.title.strip())
+                      for proc in self.processes.values())
+        for pid, profile in results.items():
+            self.save_profile(pid, titles.get(pid, ''), profile,
+                              'fleet profile')
+        self.show_call_tree(profiles.merge(results.values()))
+
+    def show_call_tree(self, profile, parent=None):
+        root = profiles.call_tree(profile)
+        total = max(root.total, 1)
+
+        def add(parent, node):
+            row = self.fleet_store.append(parent, [
+                node.name, node.total, '%0.1f%% total, %0.1f%% self' % (
+                    100 * node.total / total, 100 * node.self / total)])
+            for child in node.sorted_children():
+                add(row, child)
+
+        for child in root.sorted_children():
+            add(parent, child)
+
+    def fleet_objects(self, proc):
+        return proc.wait_payload('type_summary', 'summary')
+
+    def render_fleet_objects(self, summaries):
+        self.show_merged_summaries(fleet.merge_summaries(summaries))
+
+    def show_merged_summaries(self, merged, parent=None):
+        for kind, count, size, breakdown in merged:
+            row = self.fleet_store.append(parent, [
+                kind, count, humanize_bytes(size)])
+            # pids arrive as strings when the summary came from an agent
+            for pid, (pid_count, pid_size) in sorted(
+                    breakdown.items(), key=lambda item: int(item[0])):
+                self.fleet_store.append(row, [
+                    'pid %s' % pid, pid_count, humanize_bytes(pid_size)])
+
+    def create_agent_browser(self):
+        """Connect to remote agents and run fleet operations through them"""
+        self.agent = None
+        self.agent_rows = {}  # remote pid -> agent_store row
+
+        address_box = Gtk.HBox(False, 0)
+        self.agent_address = Gtk.Entry()
+        self.agent_address.set_text('tcp:localhost:%d' % agent.DEFAULT_PORT)
+        self.agent_address.connect('activate', self.connect_agent)
+        address_box.pack_start(self.agent_address, True, True, 0)
+        button = Gtk.Button('Connect')
+        button.connect('clicked', self.connect_agent)
+        address_box.pack_start(button, False, False, 0)
+
+        # pid, title, cpu, rss, threads
+        self.agent_store = Gtk.ListStore(int, str, float, str, int)
+        view = Gtk.TreeView(model=self.agent_store)
+        view.get_selection().set_mode(Gtk.SelectionMode.MULTIPLE)
+        for i, title in enumerate(('PID', 'Process', 'CPU %', 'RSS',
+                                   'Threads')):
+            column = Gtk.TreeViewColumn(title, Gtk.CellRendererText(), text=i)
+            column.set_sort_column_id(i)
+            view.append_column(column)
+        self.agent_selection = view.get_selection()
+
+        scrolled_window = Gtk.ScrolledWindow(hadjustment=None,
+                                             vadjustment=None)
+        scrolled_window.set_policy(Gtk.PolicyType.AUTOMATIC,
+                                   Gtk.PolicyType.AUTOMATIC)
+        scrolled_window.add(view)
+
+        buttons = Gtk.HBox(True, 0)
+        for label, op in (('Stacks', 'stacks'), ('Profile', 'profile'),
+                          ('Objects', 'heap_summary')):
+            button = Gtk.Button(label)
+            button.connect('clicked', lambda button, op: self.agent_request(op),
+                           op)
+            buttons.pack_start(button, True, True, 0)
+
+        box = Gtk.VBox()
+        box.pack_start(address_box, False, False, 0)
+        box.pack_start(scrolled_window, True, True, 0)
+        box.pack_start(buttons, False, False, 0)
+        return box
+
+    def connect_agent(self, widget):
+        address = self.agent_address.get_text().strip()
+        self.disconnect_agent()
+        try:
+            self.agent = agent.AgentClient(address)
+            remote = self.agent.request('processes')
+        except (socket.error, agent.AgentError) as e:
+            log.error('Unable to reach agent at %s: %s' % (address, e))
+            self.agent = None
+            return
+        self.agent_store.clear()
+        self.agent_rows = {}
+        for process in remote:
+            self.agent_rows[process['pid']] = self.agent_store.append([
+                process['pid'], process['title'], 0.0, '', 0])
+        pids = sorted(self.agent_rows)
+        watch = threading.Thread(target=self.watch_agent,
+                                 args=(self.agent, pids))
+        watch.daemon = True
+        watch.start()
+
+    def watch_agent(self, client, pids):
+        """Feed streamed metrics to the GUI thread until disconnected"""
+        try:
+            for metrics in client.watch(pids):
+                if client is not self.agent:
+                    return
+                GLib.idle_add(self.update_agent_metrics, client, metrics)
+        except (socket.error, EOFError, agent.AgentError) as e:
+            log.debug('Agent watch ended: %s' % e)
+
+    def update_agent_metrics(self, client, metrics):
+        if client is not self.agent:
+            return False
+        with timings.span('agent.update_metrics'):
+            for pid, values in metrics.items():
+                row = self.agent_rows.get(int(pid))
+                if row is None or 'error' in values:
+                    continue
+                self.agent_store.set(row, 2, values['cpu'],
+                                     3, humanize_bytes(values['rss']),
+                                     4, values['threads'])
+        return False
+
+    def disconnect_agent(self):
+        if self.agent is not None:
+            self.agent.close()
+            self.agent = None
+
+    def agent_request(self, op):
+        """Run a fleet operation on the agent for the selected processes"""
+        if self.agent is None:
+            return
+        model, paths = self.agent_selection.get_selected_rows()
+        pids = [model.get_value(model.get_iter(path), 0) for path in paths]
+        if not pids:
+            return
+        args = {}
+        if op == 'profile':
+            args['duration'] = self.spinner.get_value()
+
+        response = {}
+
+        def run():
+            try:
+                response['result'] = self.agent.request(op, pids=pids, **args)
+            except Exception as e:
+                response['error'] = e
+
+        self.progress.show()
+        self.update_progress(0.0, "Running %s on %d remote processes" % (
+            op, len(pids)))
+        with timings.span('agent.' + op):
+            thread = threading.Thread(target=run)
+            thread.daemon = True
+            thread.start()
+            while thread.is_alive():
+                self.update_progress(None)
+                time.sleep(0.05)
+        self.progress.hide()
+        if 'error' in response:
+            log.error('Agent %s failed: %s' % (op, response['error']))
+            return
+        result = response['result']
+        for pid, error in result.get('errors', {}).items():
+            log.error('%s failed on remote pid %s: %s' % (op, pid, error))
+
+        self.fleet_store.clear()
+        if op == 'stacks':
+            self.show_merged_stacks(result['stacks'])
+        elif op == 'profile':
+            self.show_call_tree(result)
+        else:
+            self.show_merged_summaries(result['summary'])
+        self.notebook.set_current_page(self.notebook.page_num(self.fleet_page))
+
+    def add_paths(self, proc=None):
         env_paths = []
         for app in ['dot', 'gdb']:
             app_path = which(app)
@@ -676,23 +3118,29 @@ class PyrasiteWindow(Gtk.Window):
             'sys.path.extend(%s)' % py_paths_str
         ])
 
-        output = self.proc.cmd(cmd)
+        output = (proc or self.proc).cmd(cmd)
         if output:
             log.debug(output)
 
     def dump_objects(self, update_progress):
         update_progress(0, "Dumping all objects")
-        cmd = '\n'.join(["import os, shutil, tempfile, threading",
-                         "from meliae import scanner",
-                         "tmp = os.path.join(tempfile.gettempdir(), str(os.getpid()))",
-                         "def background_dump():",
-                         "    scanner.dump_all_objects(tmp + '.json')",
-                         "    shutil.move(tmp + '.json', tmp + '.objects')",
-                         "threading.Thread(target=background_dump).start()"])
-        output = self.proc.cmd(cmd)
-        if 'No module named meliae' in output:
-            log.error('Error: %s is unable to import `meliae`' %
-                      self.proc.title.strip())
+        tmp = os.path.join(tempfile.gettempdir(), str(self.proc.pid))
+        objects_file = tmp + '.objects'
+        aborted_file = tmp + '.aborted'
+        for stale in (objects_file, aborted_file):
+            if os.path.exists(stale):
+                os.unlink(stale)
+
+        try:
+            with timings.span('dump_objects.inject'):
+                self.proc.call_payload('heap_dump', 'dump', tmp,
+                                       **HEAP_DUMP_BUDGET)
+        except PayloadError as e:
+            if 'meliae' in str(e):
+                log.error('Error: %s is unable to import `meliae`' %
+                          self.proc.title.strip())
+            else:
+                log.error('Unable to dump objects: %s' % e)
             return
         update_progress(0.25)
 
@@ -700,68 +3148,163 @@ class PyrasiteWindow(Gtk.Window):
         self.obj_store.clear()
         update_progress(0.5, "Loading object dump")
 
-        tmp = os.path.join(tempfile.gettempdir(), str(self.proc.pid))
-        temp_file = tmp + '.json'
-        objects_file = tmp + '.objects'
         now = time.time()
-        if os.path.exists(temp_file):
-            while time.time() - now < 10*60:  # 10 minute timeout
-                if not os.path.exists(objects_file):
-                    time.sleep(3)
-                else:
+        while time.time() - now < 10*60:  # 10 minute timeout
+            if os.path.exists(aborted_file):
+                with open(aborted_file) as f:
+                    reason = f.read()
+                os.unlink(aborted_file)
+                log.warn('Object dump aborted: %s' % reason)
+                self.obj_totals.set_text('Object dump aborted: %s' %
+                                         reason)
+                break
+            elif not os.path.exists(objects_file):
+                self.govern()
+                time.sleep(1)
+            else:
+                loader = import_loader()
+                if loader is None:
+                    log.debug("Meliae not available, continuing...")
+                    return
+                with timings.span('dump_objects.load'):
                     try:
-                        objects = loader.load(objects_file, show_prog=False)
-                    except NameError:
-                        log.debug("Meliae not available, continuing...")
-                        return
+                        objects = loader.load(objects_file,
+                                              show_prog=False)
                     except:
-                        log.debug("Falling back to slower meliae object dump loader")
-                        objects = loader.load(objects_file, show_prog=False, using_json=False)
-
-                    objects.compute_referrers()
-                    update_progress(0.75)
-                    summary = objects.summarize()
-                    update_progress(0.9)
-
-                    def intify(x):
-                        try:
-                            return int(x)
-                        except:
-                            return x
-
-                    for i, line in enumerate(str(summary).split('\n')):
-                        if i == 0:
-                            self.obj_totals.set_text(line)
-                        elif i == 1:
-                            continue  # column headers
-                        else:
-                            obj = summary.summaries[i - 2]
-                            self.obj_store.append([str(obj.max_address)] +
-                                                   map(intify, line.split()[1:]))
-                    os.unlink(objects_file)
-                    break
-            update_progress(1)
+                        log.debug("Falling back to slower meliae object "
+                                  "dump loader")
+                        objects = loader.load(objects_file,
+                                              show_prog=False,
+                                              using_json=False)
+
+                update_progress(0.7, "Indexing object graph")
+                with timings.span('heap_graph.build'):
+                    graph = HeapGraph.from_meliae(objects)
+                del objects
+                os.unlink(objects_file)
+                update_progress(0.85, "Saving heap snapshot")
+                try:
+                    with timings.span('dump_objects.save'):
+                        path, metadata = heap_index.save(
+                            graph, pid=self.proc.pid,
+                            title=self.proc.title.strip(),
+                            create_time=psutil.Process(
+                                self.proc.pid).create_time())
+                except (IOError, OSError) as e:
+                    log.warn('Unable to save heap snapshot: %s' % e)
+                    path = None
+                    metadata = dict(zip(('totals', 'summary'),
+                                        heap_index.summarize(graph)),
+                                    created=time.time())
+                self.show_heap(graph, None, path, metadata)
+                self.refresh_snapshots()
+                break
+        self.show_overhead()
+        update_progress(1)
+
+    def show_heap(self, graph, dominators, path, metadata):
+        """Make a loaded heap graph the one the Objects tab explores"""
+        self.heap_graph = graph
+        self.dominators = dominators
+        self.snapshot_path = path
+        self.obj_store.clear()
+        self.instance_store.clear()
+        with timings.span('dump_objects.store'):
+            for row in metadata['summary']:
+                self.obj_store.append([str(row[0])] + list(row[1:]) + [0])
+        self.obj_totals.set_text('%s, dumped %s' % (
+            metadata['totals'], time.ctime(metadata['created'])))
+        if dominators is not None:
+            self.show_type_retained()
+
+    def open_snapshot(self, path):
+        try:
+            with timings.span('heap_index.load'):
+                graph, dominators, metadata = heap_index.load(path)
+        except heap_index.SnapshotError as e:
+            log.warn(str(e))
+            return False
+        self.show_heap(graph, dominators, path, metadata)
+        return True
+
+    def latest_snapshot(self):
+        """Return the newest snapshot of the selected process, if any"""
+        try:
+            create_time = psutil.Process(self.proc.pid).create_time()
+        except psutil.Error:
+            return None
+        found = heap_index.snapshots(pid=self.proc.pid,
+                                     create_time=create_time)
+        return found and found[0][0] or None
+
+    def refresh_snapshots(self):
+        """List every saved snapshot in the Objects tab's chooser"""
+        self.snapshot_combo.handler_block(self.snapshot_combo_handler)
+        self.snapshot_combo.remove_all()
+        self.snapshot_paths = []
+        for path, metadata in heap_index.snapshots():
+            self.snapshot_paths.append(path)
+            self.snapshot_combo.append_text('%s (%s) %s, %d objects' % (
+                metadata.get('title', '?'), metadata.get('pid', '?'),
+                time.strftime('%Y-%m-%d %H:%M',
+                              time.localtime(metadata['created'])),
+                metadata['objects']))
+            if path == self.snapshot_path:
+                self.snapshot_combo.set_active(len(self.snapshot_paths) - 1)
+        self.snapshot_combo.handler_unblock(self.snapshot_combo_handler)
+
+    def snapshot_changed_cb(self, combo):
+        active = combo.get_active()
+        if 0 <= active < len(self.snapshot_paths):
+            self.open_snapshot(self.snapshot_paths[active])
+
+    def redump_objects(self, widget):
+        if not getattr(self, 'proc', None) or self.no_inject:
+            return
+        self.progress.show()
+        try:
+            self.dump_objects(self.section_progress(0.0, 1.0))
+        except socket.timeout:
+            log.info('dump_objects() timed out')
+        self.progress.hide()
+        self.update_progress(0.0)
 
+    @timed('dump_stacks')
     def dump_stacks(self, update_progress):
         update_progress(0, "Dumping stacks")
         payloads = os.path.join(os.path.abspath(os.path.dirname(
             pyrasite.__file__)), 'payloads')
         dump_stacks = os.path.join(payloads, 'dump_stacks.py')
-        code = self.proc.cmd(open(dump_stacks).read())
+        self.proc.install_payload('governor')
+        code = self.proc.cmd('\n'.join(
+            ['import sys',
+             '_op = sys.modules["_pyrasite_gui_governor"].begin("dump_stacks")',
+             'try:'] +
+            ['    ' + line for line in open(dump_stacks).read().splitlines()] +
+            ['finally:',
+             '    _op.finish()']))
         update_progress(1)
+        self.show_overhead()
 
         self.source_buffer.set_text('')
         start = self.source_buffer.get_iter_at_offset(0)
         end = start.copy()
         self.source_buffer.insert(end, code)
 
+    @timed('generate_callgraph')
     def generate_callgraph(self, sample_size=1, update_progress=None):
         if update_progress:
             update_progress(0, "Tracing call stack for %d seconds" % sample_size)
 
-        graphviz_path = which('dot')
+        graphviz_path = check_depends()
+        if not graphviz_path:
+            return
 
         image = os.path.join(tempfile.gettempdir(), "%d-callgraph.png" % self.proc.pid)
+        if self.remote_check.get_active():
+            self.generate_remote_callgraph(graphviz_path, image, sample_size,
+                                           update_progress)
+            return
 
         out = self.proc.cmd(';'.join(('import pycallgraph',
                                       'from pycallgraph.output import GraphvizOutput',
@@ -772,17 +3315,119 @@ class PyrasiteWindow(Gtk.Window):
                                       'pycallgraph._pycallgraph.start()')))
         if out:
             log.warn(out)
+        self.proc.install_payload('governor')
+        self.proc.cmd('import sys, pycallgraph; pycallgraph._pyrasite_op = '
+                      'sys.modules["_pyrasite_gui_governor"].begin("callgraph", process_cpu=True)')
 
         if update_progress:
             update_progress(0.5)
 
-        time.sleep(sample_size)
+        # Tracing can't checkpoint, so stop it early from here if need be
+        end = time.time() + sample_size
+        while time.time() < end:
+            time.sleep(min(0.25, max(end - time.time(), 0)))
+            if self.target_saturated():
+                log.warn('Target CPU saturated, stopping call graph early')
+                break
 
         if update_progress:
             update_progress(1.0, "Generating call stack graph")
 
-        self.proc.cmd('import pycallgraph; pycallgraph._pycallgraph.done()')
+        self.proc.cmd('import pycallgraph; pycallgraph._pyrasite_op.finish(); '
+                      'pycallgraph._pycallgraph.done()')
         self.call_graph.set_from_file(image)
+        self.show_overhead()
+
+    def remote_sampler(self):
+        """Return a cached out of process sampler for the current target"""
+        sampler = self.remote_samplers.get(self.proc.pid)
+        if sampler is None:
+            sampler = remote_sampler.RemoteSampler(self.proc.pid)
+            self.remote_samplers[self.proc.pid] = sampler
+        return sampler
+
+    def sample_remote_stacks(self, update_progress):
+        """Fill the Stacks tab by reading the target's memory"""
+        update_progress(0, "Reading stacks")
+        try:
+            code = remote_sampler.format_stacks(self.remote_sampler().sample())
+        except remote_sampler.SamplerError as e:
+            log.warn('Unable to sample out of process: %s' % e)
+            code = '# %s' % e
+        update_progress(1)
+        self.source_buffer.set_text('')
+        self.source_buffer.insert(self.source_buffer.get_start_iter(), code)
+
+    @timed('generate_remote_callgraph')
+    def generate_remote_callgraph(self, graphviz_path, image, sample_size,
+                                  update_progress=None):
+        """Draw the call graph from samples read out of the target"""
+        try:
+            sampler = self.remote_sampler()
+        except remote_sampler.SamplerError as e:
+            log.warn('Unable to sample out of process: %s' % e)
+            self.overhead_label.set_text(str(e))
+            return
+        # Sample on a worker thread so the window keeps repainting
+        sampling = fleet.FanOut(
+            lambda pid: remote_sampler.profile(pid, sample_size,
+                                               REMOTE_SAMPLE_INTERVAL,
+                                               sampler), [self.proc.pid])
+        start = time.time()
+        while not sampling.finished():
+            if update_progress:
+                update_progress(min((time.time() - start) / sample_size, 0.99))
+            time.sleep(0.05)
+        if sampling.errors:
+            log.warn('Out of process sampling failed: %s' %
+                     sampling.errors[self.proc.pid])
+            return
+        profile = sampling.results[self.proc.pid]
+        self.save_profile(self.proc.pid, self.proc.title.strip(), profile,
+                          'sampled out of process')
+        if update_progress:
+            update_progress(1.0, "Generating call stack graph")
+        dot = subprocess.Popen([graphviz_path, '-Tpng', '-o', image],
+                               stdin=subprocess.PIPE)
+        dot.communicate(profiles.to_dot(profile).encode('utf-8'))
+        self.call_graph.set_from_file(image)
+        self.overhead_label.set_text(
+            'Sampled out of process: %d samples at %dHz, no target overhead' %
+            (profile['samples'], 1 / REMOTE_SAMPLE_INTERVAL))
+
+    def target_saturated(self):
+        """Our latency proxy: the target's recent CPU samples"""
+        recent = cpu_intervals[-SATURATION_SAMPLES:]
+        return (len(recent) == SATURATION_SAMPLES and
+                min(recent) >= SATURATION_THRESHOLD)
+
+    def govern(self):
+        """Abort running payloads if the target looks saturated"""
+        if self.target_saturated():
+            self.proc.call_payload('governor', 'abort_all',
+                                   'target CPU saturated')
+
+    def show_overhead(self):
+        """Report the overhead of our most recent in-target operation"""
+        try:
+            operations = self.proc.call_payload('governor', 'stats')
+        except (PayloadError, socket.error) as e:
+            log.debug('Unable to fetch overhead: %s' % e)
+            return
+        if not operations:
+            return
+        op = operations[0]
+        # Tracing runs on the target's own threads, so only the CPU time of
+        # the whole process while it ran is known, not the overhead alone
+        scope = op.get('process_cpu') and 'Target CPU while running' or \
+            'Target overhead of'
+        text = ('%s %s: %0.2fs CPU over %0.2fs (%0.1f%%), '
+                'max GIL lag %dms' % (scope, op['name'], op['cpu'], op['wall'],
+                                      100 * op['cpu'] / max(op['wall'], 1e-6),
+                                      op['lag'] * 1000))
+        if op['aborted']:
+            text += ', aborted: %s' % op['aborted']
+        self.overhead_label.set_text(text)
 
     def row_activated_cb(self, view, path, col, store):
         iter = store.get_iter(path)
@@ -791,7 +3436,18 @@ class PyrasiteWindow(Gtk.Window):
             store.set_value(iter, 2, Pango.Style.NORMAL)
 
     def create_tree(self):
-        tree_store = ProcessListStore()
+        # Populate the list from the main loop so the window appears at once
+        tree_store = ProcessListStore(incremental=True)
+        discover = tree_store.discover()
+
+        def discover_step():
+            for found in discover:
+                return True
+            startup.mark('discover processes')
+            startup.report()
+            return False
+        GLib.idle_add(discover_step)
+
         tree_view = Gtk.TreeView()
         self.tree_view = tree_view
         tree_view.set_model(tree_store)
@@ -826,11 +3482,30 @@ class PyrasiteWindow(Gtk.Window):
         box = Gtk.Notebook()
         box.set_size_request(250, -1)
         box.append_page(scrolled_window, label)
+        self.add_lazy_page(box, Gtk.Label(label='Fleet'),
+                           lambda: self.create_fleet_selector(tree_store))
+        self.add_lazy_page(box, Gtk.Label(label='Agents'),
+                           self.create_agent_browser)
+        box.connect('switch-page', self.build_lazy_page)
 
         tree_view.grab_focus()
 
         return box
 
+    def add_lazy_page(self, notebook, label, create):
+        """Append a page to `notebook` that `create()` fills when shown"""
+        page = Gtk.VBox()
+        notebook.append_page(page, label)
+        self.lazy_pages[page] = create
+        return page
+
+    def build_lazy_page(self, notebook, page, pagenum):
+        create = self.lazy_pages.pop(page, None)
+        if create is not None:
+            widget = create()
+            page.pack_start(widget, True, True, 0)
+            widget.show_all()
+
     def create_text(self, is_source, return_view=False):
         scrolled_window = Gtk.ScrolledWindow(hadjustment=None,
                                              vadjustment=None)
@@ -860,12 +3535,25 @@ class PyrasiteWindow(Gtk.Window):
             return (text_view, scrolled_window, buffer)
         return(scrolled_window, buffer)
 
-    def fontify(self):
-        start_iter = self.source_buffer.get_iter_at_offset(0)
-        end_iter = self.source_buffer.get_iter_at_offset(0)
-        data = self.source_buffer.get_text(self.source_buffer.get_start_iter(),
-                                           self.source_buffer.get_end_iter(),
-                                           False)
+    def create_source_tags(self, buffer):
+        """The tags fontify() applies, see also create_lines_panel()"""
+        buffer.create_tag('bold', weight=Pango.Weight.BOLD)
+        buffer.create_tag('italic', style=Pango.Style.ITALIC)
+        buffer.create_tag('comment', foreground='#c0c0c0')
+        buffer.create_tag('decorator', foreground='#7d7d7d',
+                          style=Pango.Style.ITALIC)
+        buffer.create_tag('keyword', foreground='#0000ff')
+        buffer.create_tag('number', foreground='#800000')
+        buffer.create_tag('string', foreground='#00aa00',
+                          style=Pango.Style.ITALIC)
+
+    @timed('fontify')
+    def fontify(self, buffer=None):
+        buffer = buffer or self.source_buffer
+        start_iter = buffer.get_iter_at_offset(0)
+        end_iter = buffer.get_iter_at_offset(0)
+        data = buffer.get_text(buffer.get_start_iter(),
+                               buffer.get_end_iter(), False)
 
         if sys.version_info < (3, 0):
             data = data.decode('utf-8')
@@ -889,15 +3577,15 @@ class PyrasiteWindow(Gtk.Window):
 
                 if tok_type == tokenize.COMMENT:
                     prepare_iters()
-                    self.source_buffer.apply_tag_by_name('comment', start_iter,
-                                                         end_iter)
+                    buffer.apply_tag_by_name('comment', start_iter,
+                                             end_iter)
                 elif tok_type == tokenize.NAME:
                     if (tok_str in keyword.kwlist or
                         tok_str in builtin_constants):
                         prepare_iters()
-                        self.source_buffer.apply_tag_by_name('keyword',
-                                                             start_iter,
-                                                             end_iter)
+                        buffer.apply_tag_by_name('keyword',
+                                                 start_iter,
+                                                 end_iter)
                         if tok_str == 'def' or tok_str == 'class':
                             # Next token is going to be a
                             # function/method/class name
@@ -905,34 +3593,34 @@ class PyrasiteWindow(Gtk.Window):
                             continue
                     elif tok_str == 'self':
                         prepare_iters()
-                        self.source_buffer.apply_tag_by_name('italic',
-                                                             start_iter,
-                                                             end_iter)
+                        buffer.apply_tag_by_name('italic',
+                                                 start_iter,
+                                                 end_iter)
                     else:
                         if is_func is True:
                             prepare_iters()
-                            self.source_buffer.apply_tag_by_name('bold',
-                                                                 start_iter,
-                                                                 end_iter)
+                            buffer.apply_tag_by_name('bold',
+                                                     start_iter,
+                                                     end_iter)
                         elif is_decorator is True:
                             prepare_iters()
-                            self.source_buffer.apply_tag_by_name('decorator',
-                                                                 start_iter,
-                                                                 end_iter)
+                            buffer.apply_tag_by_name('decorator',
+                                                     start_iter,
+                                                     end_iter)
                 elif tok_type == tokenize.STRING:
                     prepare_iters()
-                    self.source_buffer.apply_tag_by_name('string', start_iter,
-                                                         end_iter)
+                    buffer.apply_tag_by_name('string', start_iter,
+                                             end_iter)
                 elif tok_type == tokenize.NUMBER:
                     prepare_iters()
-                    self.source_buffer.apply_tag_by_name('number', start_iter,
-                                                         end_iter)
+                    buffer.apply_tag_by_name('number', start_iter,
+                                             end_iter)
                 elif tok_type == tokenize.OP:
                     if tok_str == '@':
                         prepare_iters()
-                        self.source_buffer.apply_tag_by_name('decorator',
-                                                             start_iter,
-                                                             end_iter)
+                        buffer.apply_tag_by_name('decorator',
+                                                 start_iter,
+                                                 end_iter)
 
                         # next token is going to be the decorator name
                         is_decorator = True
@@ -947,9 +3635,16 @@ class PyrasiteWindow(Gtk.Window):
             pass
 
     def close(self):
+        if timings.enabled:
+            print('Timings written to %s' % self.dump_timings())
         self.progress.show()
         self.update_progress(None, "Shutting down")
         log.debug("Closing %r" % self)
+        self.disconnect_agent()
+        self.stop_io_profile()
+        self.stop_lock_profile()
+        self.malloc_watch = None
+        self.clear_inspector()
         for process in self.processes.values():
             self.update_progress(None)
             process.close()
@@ -969,17 +3664,52 @@ class ResourceUsagePoller(threading.Thread):
     def __init__(self, pid):
         super(ResourceUsagePoller, self).__init__()
         self.process = psutil.Process(pid)
+        self.files_interval = FILES_INTERVAL
+        self.connections_interval = CONNECTIONS_INTERVAL
+        self.resetting = False
+        self.forget()
+
+    def reset(self):
+        """Have the poller forget the previous process before it next polls"""
+        self.resetting = True
+
+    def forget(self):
+        """Forget what was seen of the previous process"""
+        self.connections = set()
+        self.files = set()
+        self.last_connections = self.last_files = 0
+        self.last_rollup = self.last_smaps = 0
 
     def run(self):
         while True:
             try:
+                if self.resetting:
+                    self.resetting = False
+                    self.forget()
+                    # Drop the previous process' rows, even those queued
+                    # after the GUI cleared its lists
+                    connection_changes.append(None)
+                    file_changes.append(None)
                 if self.process:
                     self.poll_cpu()
                     self.poll_mem()
                     self.poll_io()
                     self.poll_threads()
-                    self.poll_connections()
-                    self.poll_files()
+                    now = time.time()
+                    if (now - self.last_connections >=
+                            self.connections_interval):
+                        self.last_connections = now
+                        self.poll_connections()
+                    if now - self.last_files >= self.files_interval:
+                        self.last_files = now
+                        self.poll_files()
+                    if now - self.last_rollup >= ROLLUP_INTERVAL:
+                        self.last_rollup = now
+                        self.poll_rollup()
+                    if now - self.last_smaps >= SMAPS_INTERVAL:
+                        self.last_smaps = now
+                        self.poll_smaps()
+                    self.record_metrics()
                 else:
                     time.sleep(1)
             except psutil.NoSuchProcess:
@@ -987,7 +3717,12 @@ class ResourceUsagePoller(threading.Thread):
                 self.process = None
                 global process_status
                 process_status = '[Terminated]'
+            except Exception:
+                # Keep polling; the GUI has no other way to restart us
+                log.exception('Polling resource usage failed')
+                time.sleep(POLL_INTERVAL)
 
+    @timed('poll_cpu')
     def poll_cpu(self):
         global cpu_intervals, cpu_details
         if len(cpu_intervals) >= INTERVALS:
@@ -998,17 +3733,48 @@ class ResourceUsagePoller(threading.Thread):
         cpu_details = '%0.2f%% (%s user, %s system)' % (
                 cpu_intervals[-1], cputimes.user, cputimes.system)
 
+    @timed('poll_mem')
     def poll_mem(self):
         global mem_intervals, mem_details
         if len(mem_intervals) >= INTERVALS:
             mem_intervals = mem_intervals[1:]
-        mem_intervals.append(float(self.process.memory_info().rss))
         meminfo = self.process.memory_info()
+        mem_intervals.append(float(meminfo.rss))
         mem_details = '%0.2f%% (%s RSS, %s VMS)' % (
                 self.process.memory_percent(),
                 humanize_bytes(meminfo.rss),
                 humanize_bytes(meminfo.vms))
+        if mem_rollup:
+            mem_details += ' %s PSS, %s USS, %s shared' % (
+                humanize_bytes(mem_rollup['pss']),
+                humanize_bytes(mem_rollup['uss']),
+                humanize_bytes(mem_rollup['shared']))
+
+    def record_metrics(self):
+        # Slices, as selection_cb may have just emptied the intervals
+        cpu, rss = cpu_intervals[-1:], mem_intervals[-1:]
+        if cpu and rss:
+            metric_history.add(cpu=cpu[0], rss=rss[0],
+                               threads=len(live_threads),
+                               connections=len(self.connections))
+
+    @timed('poll_rollup')
+    def poll_rollup(self):
+        global mem_rollup
+        try:
+            mem_rollup = rollups.get(self.process.pid)
+        except (EnvironmentError, psutil.AccessDenied) as e:
+            log.debug('Unable to read PSS/USS: %s' % e)
+
+    @timed('poll_smaps')
+    def poll_smaps(self):
+        global mem_breakdown
+        try:
+            mem_breakdown = breakdowns.get(self.process.pid)
+        except EnvironmentError as e:
+            log.debug('Unable to read smaps: %s' % e)
 
+    @timed('poll_io')
     def poll_io(self):
         global read_count, read_bytes, write_count, write_bytes
         global read_intervals, write_intervals
@@ -1025,9 +3791,12 @@ class ResourceUsagePoller(threading.Thread):
         write_count = io.write_count
         write_bytes = io.write_bytes
 
+    @timed('poll_threads')
     def poll_threads(self):
-        global thread_intervals
-        for thread in self.process.threads():
+        global thread_intervals, live_threads
+        threads = self.process.threads()
+        live_threads = set(thread.id for thread in threads)
+        for thread in threads:
             if thread.id not in thread_intervals:
                 thread_intervals[thread.id] = []
                 thread_colors[thread.id] = get_color()
@@ -1045,10 +3814,10 @@ class ResourceUsagePoller(threading.Thread):
                     float('%.2f' % amount_since))
             thread_totals[thread.id] = total
 
+    @timed('poll_connections')
     def poll_connections(self):
-        global open_connections
-        connections = []
-        for i, conn in enumerate(self.process.connections()):
+        connections = set()
+        for conn in self.process.connections():
             if conn.type == socket.SOCK_STREAM:
                 type = 'TCP'
             elif conn.type == socket.SOCK_DGRAM:
@@ -1060,20 +3829,23 @@ class ResourceUsagePoller(threading.Thread):
                 rip = rport = '*'
             else:
                 rip, rport = conn.raddr
-            connections.append({
-                'type': type,
-                'status': conn.status,
-                'local': '%s:%s' % (lip, lport),
-                'remote': '%s:%s' % (rip, rport),
-                })
-        open_connections = connections
-
+            connections.add((type, '%s:%s' % (lip, lport),
+                             '%s:%s' % (rip, rport), conn.status))
+        added = [(key, list(key)) for key in connections - self.connections]
+        removed = list(self.connections - connections)
+        self.connections = connections
+        if added or removed:
+            connection_changes.append((added, removed))
+
+    @timed('poll_files')
     def poll_files(self):
-        global open_files
-        files = []
-        for open_file in self.process.open_files():
-            files.append(open_file.path.replace('\\', '\\\\'))
-        open_files = files
+        files = set((open_file.path, getattr(open_file, 'fd', -1))
+                    for open_file in self.process.open_files())
+        added = [(key, list(key)) for key in files - self.files]
+        removed = list(self.files - files)
+        self.files = files
+        if added or removed:
+            file_changes.append((added, removed))
 
 
 ##
@@ -1113,6 +3885,19 @@ def get_color():
     return "".join([hex(randrange(0, 255))[2:] for i in range(3)])
 
 
+def summarize_counts(counter, limit=5):
+    """Describe the most common entries of a :class:`Counter`"""
+    return ', '.join('%s: %d' % (key, count) for key, count
+                     in counter.most_common(limit) if count > 0)
+
+
+def discount(counter, key):
+    """Decrement a :class:`Counter` entry, deleting it once it reaches 0"""
+    counter[key] -= 1
+    if counter[key] <= 0:
+        del counter[key]
+
+
 def humanize_bytes(bytes, precision=1):
     """Return a humanized string representation of a number of bytes.
     http://code.activestate.com/recipes/577081-humanized-representation-of-a-number-of-bytes/
@@ -1164,15 +3949,44 @@ def setup_logger(verbose=False):
     return log
 
 
+def import_webkit():
+    global WebKit
+    if WebKit is None:
+        start = time.time()
+        from gi.repository import WebKit
+        log.debug('Imported WebKit in %0.3fs' % (time.time() - start))
+    return WebKit
+
+
+def import_loader():
+    """Return the meliae loader module, or None if it is unavailable"""
+    global loader
+    if loader is None:
+        try:
+            from meliae import loader
+        except ImportError:
+            loader = False
+            print("Unable to import meliae. "
+                  "Object memory analysis disabled.")
+    return loader or None
+
+
 def check_depends():
-    try:
-        # call dot command with null input file.
-        # throws exception if command "dot" not found
-        subprocess.call(['dot', '-V'], shell=False)
-        assert which('dot')
-    except OSError:
-        print('WARNING: graphviz dot command not found. ' +
-              'Call graph will not be available')
+    """Probe for graphviz once, returning the path to `dot` or None"""
+    global graphviz
+    if graphviz is None:
+        graphviz = False
+        try:
+            # call dot command with null input file.
+            # throws exception if command "dot" not found
+            subprocess.call(['dot', '-V'], shell=False)
+            graphviz = which('dot') or False
+        except OSError:
+            pass
+        if not graphviz:
+            print('WARNING: graphviz dot command not found. ' +
+                  'Call graph will not be available')
+    return graphviz or None
 
 
 def which(cmd, mode=os.F_OK | os.X_OK, path=None):
@@ -1239,13 +4053,15 @@ def which(cmd, mode=os.F_OK | os.X_OK, path=None):
 
 
 def main():
-    check_depends()
-
+    timings.enabled = '--timings' in sys.argv
     GObject.threads_init()
     mainloop = GLib.MainLoop()
 
     window = PyrasiteWindow()
     window.show()
+    GLib.idle_add(startup.mark, 'first frame')
+    if timings.enabled:
+        GObject.timeout_add(1000, window.render_timings)
 
     def quit(widget, event, mainloop):
         window.close()
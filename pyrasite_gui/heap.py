@@ -0,0 +1,441 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+"""
+Compact, array-backed object graphs built from meliae heap dumps.
+
+Every object in a dump is identified by its position in the address-sorted
+`addresses` array.  Outgoing references are stored in CSR form (an offsets
+array and a flat array of target indexes), and the reverse (referrer) index
+is only built the first time it is needed.
+"""
+
+from __future__ import division
+
+import heapq
+import logging
+from array import array
+from bisect import bisect_left
+from collections import deque
+from itertools import repeat
+
+log = logging.getLogger('pyrasite')
+
+# Objects of these types are treated as GC roots when walking referrers
+ROOT_TYPES = ('module', 'frame')
+
+# Upper bound on the number of objects visited by a single path query
+MAX_VISITED = 2000000
+
+# DominatorTree reports its progress every this many objects
+PROGRESS_MASK = (1 << 16) - 1
+
+
+class HeapGraph(object):
+    """An indexed, address-sorted view of an object dump"""
+
+    def __init__(self, addresses, type_ids, sizes, type_names,
+                 ref_offsets, refs):
+        self.addresses = addresses      # array('Q'), sorted
+        self.type_ids = type_ids        # array('i')
+        self.sizes = sizes              # array('q')
+        self.type_names = type_names    # list of str, indexed by type id
+        self.ref_offsets = ref_offsets  # array('q'), len(addresses) + 1
+        self.refs = refs                # array('i')
+        self.type_index = dict((name, i) for i, name in enumerate(type_names))
+        self._referrer_offsets = None
+        self._referrers = None
+        self._by_type = None
+        self._largest = {}
+
+    def __len__(self):
+        return len(self.addresses)
+
+    @classmethod
+    def from_meliae(cls, objects):
+        """Build a graph from a loaded meliae `ObjManager`"""
+        objs = objects.objs
+        values = getattr(objs, 'itervalues', objs.values)
+        return cls.from_records((obj.address, obj.type_str, obj.size,
+                                 obj.children) for obj in values())
+
+    @classmethod
+    def from_records(cls, records):
+        """Build a graph from (address, type, size, child addresses) tuples"""
+        # Stream the records straight into flat arrays, so the dump is never
+        # held twice, and sort a permutation of it afterwards
+        raw_addresses = array('Q')
+        raw_type_ids = array('i')
+        raw_sizes = array('q')
+        child_offsets = array('q', [0])
+        children = array('Q')
+        type_names = []
+        type_index = {}
+        for address, type_str, size, object_children in records:
+            type_id = type_index.get(type_str)
+            if type_id is None:
+                type_id = type_index[type_str] = len(type_names)
+                type_names.append(type_str)
+            raw_addresses.append(address)
+            raw_type_ids.append(type_id)
+            raw_sizes.append(size)
+            children.extend(object_children)
+            child_offsets.append(len(children))
+        order = sorted(range(len(raw_addresses)),
+                       key=raw_addresses.__getitem__)
+        addresses = array('Q', map(raw_addresses.__getitem__, order))
+        del raw_addresses
+        type_ids = array('i', map(raw_type_ids.__getitem__, order))
+        del raw_type_ids
+        sizes = array('q', map(raw_sizes.__getitem__, order))
+        del raw_sizes
+        # Resolve every child address to an index in one pass, with -1 for
+        # references that point outside of the dump
+        position = dict(zip(addresses, range(len(addresses))))
+        resolved = array('i', map(position.get, children,
+                                  repeat(-1, len(children))))
+        del position, children
+        ref_offsets = array('q', [0])
+        refs = array('i')
+        for j in order:
+            targets = resolved[child_offsets[j]:child_offsets[j + 1]]
+            if -1 in targets:
+                targets = array('i', [i for i in targets if i != -1])
+            refs.extend(targets)
+            ref_offsets.append(len(refs))
+        return cls(addresses, type_ids, sizes, type_names, ref_offsets, refs)
+
+    def index(self, address):
+        """Return the index of the object at `address`, or -1"""
+        i = bisect_left(self.addresses, address)
+        if i < len(self.addresses) and self.addresses[i] == address:
+            return i
+        return -1
+
+    def type_name(self, i):
+        return self.type_names[self.type_ids[i]]
+
+    def referents(self, i):
+        return self.refs[self.ref_offsets[i]:self.ref_offsets[i + 1]]
+
+    def referrers(self, i):
+        if self._referrers is None:
+            self._build_referrers()
+        offsets = self._referrer_offsets
+        return self._referrers[offsets[i]:offsets[i + 1]]
+
+    def _build_referrers(self):
+        """Invert the reference arrays with a two-pass counting sort"""
+        n = len(self.addresses)
+        counts = array('q', [0]) * (n + 1)
+        for target in self.refs:
+            counts[target + 1] += 1
+        for i in range(n):
+            counts[i + 1] += counts[i]
+        fill = array('q', counts)
+        referrers = array('i', [0]) * len(self.refs)
+        offsets = self.ref_offsets
+        refs = self.refs
+        for source in range(n):
+            for j in range(offsets[source], offsets[source + 1]):
+                target = refs[j]
+                referrers[fill[target]] = source
+                fill[target] += 1
+        self._referrer_offsets = counts
+        self._referrers = referrers
+
+    def is_root(self, i):
+        if self.type_name(i) in ROOT_TYPES:
+            return True
+        return len(self.referrers(i)) == 0
+
+    def _type_buckets(self):
+        """Group object indexes by type id"""
+        if self._by_type is None:
+            ntypes = len(self.type_names)
+            offsets = array('q', [0]) * (ntypes + 1)
+            for type_id in self.type_ids:
+                offsets[type_id + 1] += 1
+            for t in range(ntypes):
+                offsets[t + 1] += offsets[t]
+            fill = array('q', offsets)
+            members = array('i', [0]) * len(self.type_ids)
+            for i, type_id in enumerate(self.type_ids):
+                members[fill[type_id]] = i
+                fill[type_id] += 1
+            self._by_type = (offsets, members)
+        return self._by_type
+
+    def instances(self, type_str):
+        """Return the indexes of every object of the given type"""
+        type_id = self.type_index.get(type_str)
+        if type_id is None:
+            return array('i')
+        offsets, members = self._type_buckets()
+        return members[offsets[type_id]:offsets[type_id + 1]]
+
+    def largest(self, type_str, limit=100):
+        """Return the indexes of the `limit` largest objects of a type"""
+        key = (type_str, limit)
+        if key not in self._largest:
+            self._largest[key] = heapq.nlargest(
+                limit, self.instances(type_str), key=self.sizes.__getitem__)
+        return self._largest[key]
+
+    def path_to_root(self, i, max_visited=MAX_VISITED):
+        """
+        Return the shortest chain of indexes from a GC root down to object
+        `i`, found with a breadth-first search over referrers.
+        """
+        parents = {i: -1}
+        queue = deque([i])
+        while queue and len(parents) < max_visited:
+            current = queue.popleft()
+            if self.is_root(current):
+                path = []
+                while current != -1:
+                    path.append(current)
+                    current = parents[current]
+                return path
+            for referrer in self.referrers(current):
+                if referrer not in parents:
+                    parents[referrer] = current
+                    queue.append(referrer)
+        log.debug('No root found for %x after visiting %d objects' %
+                  (self.addresses[i], len(parents)))
+        return []
+
+    def describe(self, i):
+        return '%s 0x%x (%d bytes)' % (self.type_name(i), self.addresses[i],
+                                       self.sizes[i])
+
+
+class DominatorTree(object):
+    """
+    The dominator tree of a :class:`HeapGraph`, computed with the
+    Lengauer-Tarjan algorithm (path compression, simple linking).
+
+    A synthetic root with index ``len(graph)`` is attached to every GC root,
+    and to any cycle that is not reachable from one, so every object ends up
+    with an immediate dominator.  Only `idom`, `order` and `retained` are
+    kept once the tree has been built.
+
+    `progress`, if given, is called with the fraction done (0.0 to 1.0) as
+    the tree is built, from the building thread.
+    """
+
+    def __init__(self, graph, progress=None):
+        self.graph = graph
+        self.root = len(graph)
+        self.progress = progress
+        self.idom, self.order = self._compute(graph)
+        self.retained = self._retained_sizes()
+        self.progress = None
+        self._type_retained = None
+
+    def _report(self, start, end, done, total):
+        if self.progress is not None:
+            self.progress(start + (end - start) * done / max(total, 1))
+
+    @classmethod
+    def from_arrays(cls, graph, idom, order, retained):
+        """Rebuild a tree saved by :func:`pyrasite_gui.heap_index.save`"""
+        tree = cls.__new__(cls)
+        tree.graph = graph
+        tree.root = len(graph)
+        tree.idom = idom
+        tree.order = order
+        tree.retained = retained
+        tree.progress = None
+        tree._type_retained = None
+        return tree
+
+    def _compute(self, graph):
+        n = len(graph)
+        root = n
+        UNSEEN = -1
+
+        # Depth-first preorder numbering from the synthetic root
+        dfnum = array('i', [UNSEEN]) * (n + 1)
+        vertex = array('i', [0]) * (n + 1)
+        parent = array('i', [UNSEEN]) * (n + 1)
+        dfnum[root] = 0
+        vertex[0] = root
+        count = 1
+        offsets, refs = graph.ref_offsets, graph.refs
+        report = self._report
+
+        def walk(start):
+            # Iterative DFS below `start`, which is already numbered
+            stack = [(start, offsets[start], offsets[start + 1])]
+            number = count
+            while stack:
+                v, j, end = stack[-1]
+                if j == end:
+                    stack.pop()
+                    continue
+                stack[-1] = (v, j + 1, end)
+                w = refs[j]
+                if dfnum[w] == UNSEEN:
+                    dfnum[w] = number
+                    vertex[number] = w
+                    parent[w] = v
+                    number += 1
+                    if not number & PROGRESS_MASK:
+                        report(0.0, 0.3, number, n)
+                    stack.append((w, offsets[w], offsets[w + 1]))
+            return number
+
+        # Nodes with an edge from the synthetic root: GC roots first, then
+        # anything left over that only cycles reach
+        seeded = bytearray(n)
+        for v in range(n):
+            if graph.is_root(v):
+                seeded[v] = 1
+        for seeding in (True, False):
+            for v in range(n):
+                if dfnum[v] != UNSEEN or seeding and not seeded[v]:
+                    continue
+                seeded[v] = 1
+                dfnum[v] = count
+                vertex[count] = v
+                parent[v] = root
+                count += 1
+                count = walk(v)
+
+        semi = array('i', dfnum)
+        label = array('i', range(n + 1))
+        ancestor = array('i', [UNSEEN]) * (n + 1)
+        idom = array('i', [root]) * (n + 1)
+        bucket_head = array('i', [UNSEEN]) * (n + 1)
+        bucket_next = array('i', [UNSEEN]) * (n + 1)
+
+        def evaluate(v):
+            if ancestor[v] == UNSEEN:
+                return v
+            path = []
+            u = v
+            while ancestor[ancestor[u]] != UNSEEN:
+                path.append(u)
+                u = ancestor[u]
+            while path:
+                u = path.pop()
+                a = ancestor[u]
+                if semi[label[a]] < semi[label[u]]:
+                    label[u] = label[a]
+                ancestor[u] = ancestor[a]
+            return label[v]
+
+        referrer_offsets = graph._referrer_offsets
+        referrers = graph._referrers
+        for k in range(count - 1, 0, -1):
+            if not k & PROGRESS_MASK:
+                report(0.3, 0.8, count - k, count)
+            w = vertex[k]
+            if seeded[w]:
+                # The synthetic root is a predecessor with the lowest number
+                semi[w] = 0
+            else:
+                for j in range(referrer_offsets[w], referrer_offsets[w + 1]):
+                    u = evaluate(referrers[j])
+                    if semi[u] < semi[w]:
+                        semi[w] = semi[u]
+            s = vertex[semi[w]]
+            bucket_next[w] = bucket_head[s]
+            bucket_head[s] = w
+            p = parent[w]
+            ancestor[w] = p
+            v = bucket_head[p]
+            while v != UNSEEN:
+                u = evaluate(v)
+                idom[v] = u if semi[u] < semi[v] else p
+                v = bucket_next[v]
+            bucket_head[p] = UNSEEN
+
+        for k in range(1, count):
+            if not k & PROGRESS_MASK:
+                report(0.8, 0.9, k, count)
+            w = vertex[k]
+            if idom[w] != vertex[semi[w]]:
+                idom[w] = idom[idom[w]]
+        idom[root] = root
+        return idom, vertex
+
+    def _retained_sizes(self):
+        """Fold shallow sizes up the tree in reverse preorder"""
+        sizes = self.graph.sizes
+        retained = array('q', sizes)
+        retained.append(0)
+        idom = self.idom
+        order = self.order
+        for k in range(len(order) - 1, 0, -1):
+            if not k & PROGRESS_MASK:
+                self._report(0.9, 1.0, len(order) - k, len(order))
+            w = order[k]
+            retained[idom[w]] += retained[w]
+        return retained
+
+    def biggest(self, limit=100):
+        """Return the indexes of the objects retaining the most memory"""
+        return heapq.nlargest(limit, range(self.root),
+                              key=self.retained.__getitem__)
+
+    def children(self):
+        """Return the dominator tree as (offsets, members) CSR arrays"""
+        n = self.root + 1
+        offsets = array('q', [0]) * (n + 1)
+        idom = self.idom
+        for w in range(self.root):
+            offsets[idom[w] + 1] += 1
+        for i in range(n):
+            offsets[i + 1] += offsets[i]
+        fill = array('q', offsets)
+        members = array('i', [0]) * self.root
+        for w in range(self.root):
+            members[fill[idom[w]]] = w
+            fill[idom[w]] += 1
+        return offsets, members
+
+    def type_retained(self):
+        """
+        Return a dict of type name to the memory retained by objects of that
+        type, counting each object only under its outermost dominator of the
+        same type so nested containers are not counted twice.
+        """
+        if self._type_retained is None:
+            graph = self.graph
+            type_ids = graph.type_ids
+            totals = array('q', [0]) * len(graph.type_names)
+            active = array('i', [0]) * len(graph.type_names)
+            offsets, members = self.children()
+            stack = [(self.root, offsets[self.root])]
+            while stack:
+                v, j = stack[-1]
+                if j == offsets[v + 1]:
+                    stack.pop()
+                    if v != self.root:
+                        active[type_ids[v]] -= 1
+                    continue
+                stack[-1] = (v, j + 1)
+                w = members[j]
+                t = type_ids[w]
+                if not active[t]:
+                    totals[t] += self.retained[w]
+                active[t] += 1
+                stack.append((w, offsets[w]))
+            self._type_retained = dict(zip(graph.type_names, totals))
+        return self._type_retained
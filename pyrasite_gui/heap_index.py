@@ -0,0 +1,216 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+"""
+Persistent, memory-mapped indexes of heap dumps.
+
+A snapshot is a directory holding one flat native-endian file per
+:class:`~pyrasite_gui.heap.HeapGraph` array, including the referrer index,
+and a ``meta.json`` with the type table, a per-type summary and details of
+the process it came from.  Reopening a snapshot maps the arrays rather than
+reading them, so only the pages a query touches are loaded.  Dominator
+arrays are added to a snapshot once they have been computed.
+"""
+
+from __future__ import division
+
+import os
+import sys
+import json
+import mmap
+import time
+import shutil
+import logging
+from array import array
+
+from pyrasite_gui.heap import HeapGraph, DominatorTree
+
+log = logging.getLogger('pyrasite')
+
+FORMAT = 1
+
+CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+    'pyrasite-gui')
+SNAPSHOT_DIR = os.path.join(CACHE_DIR, 'heaps')
+
+GRAPH_ARRAYS = (('addresses', 'Q'), ('type_ids', 'i'), ('sizes', 'q'),
+                ('ref_offsets', 'q'), ('refs', 'i'),
+                ('referrer_offsets', 'q'), ('referrers', 'i'))
+DOMINATOR_ARRAYS = (('idom', 'i'), ('order', 'i'), ('retained', 'q'))
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def write_array(path, values, typecode):
+    if not isinstance(values, array):
+        values = array(typecode, values)
+    with open(path, 'wb') as f:
+        values.tofile(f)
+
+
+def map_array(path, typecode):
+    """Return a read-only, memory-mapped sequence over an array file"""
+    size = os.path.getsize(path)
+    if not size:
+        return array(typecode)  # empty files can't be mapped
+    with open(path, 'rb') as f:
+        if not hasattr(memoryview, 'cast'):  # Python 2
+            values = array(typecode)
+            values.fromfile(f, size // values.itemsize)
+            return values
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mapped).cast(typecode)
+
+
+def summarize(graph):
+    """
+    Summarize a graph by type like meliae's `ObjManager.summarize`.
+
+    Returns a totals line and a list of rows of (address of the largest
+    instance, count, count %, size, size %, cumulative size %, largest
+    size, type), largest types first.
+    """
+    ntypes = len(graph.type_names)
+    counts = [0] * ntypes
+    totals = [0] * ntypes
+    largest = [-1] * ntypes
+    sizes = graph.sizes
+    for i, type_id in enumerate(graph.type_ids):
+        counts[type_id] += 1
+        totals[type_id] += sizes[i]
+        if largest[type_id] < 0 or sizes[i] > sizes[largest[type_id]]:
+            largest[type_id] = i
+    count = len(graph)
+    size = sum(totals)
+    rows = []
+    cumulative = 0
+    for type_id in sorted(range(ntypes), key=lambda t: -totals[t]):
+        cumulative += totals[type_id]
+        rows.append((graph.addresses[largest[type_id]], counts[type_id],
+                     100 * counts[type_id] // max(count, 1),
+                     totals[type_id], 100 * totals[type_id] // max(size, 1),
+                     100 * cumulative // max(size, 1),
+                     sizes[largest[type_id]], graph.type_names[type_id]))
+    line = 'Total %d objects, %d types, Total size = %.1fMiB (%d bytes)' % (
+        count, ntypes, size / 1024 / 1024, size)
+    return line, rows
+
+
+def save(graph, directory=SNAPSHOT_DIR, **metadata):
+    """
+    Write `graph` to a new snapshot under `directory`, returning its path
+    and metadata.  `metadata` is stored as is and should describe the
+    process, e.g. its pid, title and create_time.
+    """
+    created = time.time()
+    path = os.path.join(directory, '%s-%d' % (metadata.get('pid', 'heap'),
+                                              created * 1000))
+    partial = path + '.partial'
+    os.makedirs(partial)
+    try:
+        if graph._referrers is None:
+            graph._build_referrers()
+        for name, typecode in GRAPH_ARRAYS:
+            source = name.startswith('referrer') and '_' + name or name
+            write_array(os.path.join(partial, name), getattr(graph, source),
+                        typecode)
+        totals, rows = summarize(graph)
+        metadata.update(format=FORMAT, created=created, objects=len(graph),
+                        type_names=graph.type_names, totals=totals,
+                        summary=rows, byteorder=sys.byteorder)
+        with open(os.path.join(partial, 'meta.json'), 'w') as f:
+            json.dump(metadata, f)
+        os.rename(partial, path)
+    except:
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+    return path, metadata
+
+
+def save_dominators(path, dominators):
+    """Add a computed dominator tree to the snapshot at `path`"""
+    for name, typecode in DOMINATOR_ARRAYS:
+        write_array(os.path.join(path, name + '.tmp'),
+                    getattr(dominators, name), typecode)
+    for name, typecode in DOMINATOR_ARRAYS:
+        os.rename(os.path.join(path, name + '.tmp'), os.path.join(path, name))
+
+
+def read_metadata(path):
+    try:
+        with open(os.path.join(path, 'meta.json')) as f:
+            metadata = json.load(f)
+    except (IOError, ValueError) as e:
+        raise SnapshotError('Unreadable snapshot %s: %s' % (path, e))
+    if metadata.get('format') != FORMAT:
+        raise SnapshotError('Unsupported snapshot format in %s' % path)
+    if metadata.get('byteorder') != sys.byteorder:
+        raise SnapshotError('%s was written on a %s-endian machine' % (
+            path, metadata.get('byteorder')))
+    return metadata
+
+
+def load(path):
+    """
+    Open the snapshot at `path`, returning a (graph, dominators or None,
+    metadata) tuple backed by mapped files.
+    """
+    metadata = read_metadata(path)
+    arrays = dict((name, map_array(os.path.join(path, name), typecode))
+                  for name, typecode in GRAPH_ARRAYS)
+    graph = HeapGraph(arrays['addresses'], arrays['type_ids'],
+                      arrays['sizes'], metadata['type_names'],
+                      arrays['ref_offsets'], arrays['refs'])
+    graph._referrer_offsets = arrays['referrer_offsets']
+    graph._referrers = arrays['referrers']
+    dominators = None
+    if all(os.path.exists(os.path.join(path, name))
+           for name, typecode in DOMINATOR_ARRAYS):
+        dominators = DominatorTree.from_arrays(graph, *[
+            map_array(os.path.join(path, name), typecode)
+            for name, typecode in DOMINATOR_ARRAYS])
+    return graph, dominators, metadata
+
+
+def snapshots(directory=SNAPSHOT_DIR, **match):
+    """
+    Return (path, metadata) for every readable snapshot in `directory`
+    whose metadata matches the given values, newest first.
+    """
+    found = []
+    if not os.path.isdir(directory):
+        return found
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.endswith('.partial') or not os.path.isdir(path):
+            continue
+        try:
+            metadata = read_metadata(path)
+        except SnapshotError as e:
+            log.debug(str(e))
+            continue
+        if all(metadata.get(key) == value for key, value in match.items()):
+            found.append((path, metadata))
+    return sorted(found, key=lambda snapshot: -snapshot[1]['created'])
+
+
+def remove(path):
+    shutil.rmtree(path, ignore_errors=True)
+
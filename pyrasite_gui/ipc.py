@@ -0,0 +1,182 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+"""
+Talking to injected processes without any GUI dependencies, shared by the
+GUI and the remote agent.
+"""
+
+import json
+import time
+import socket
+import platform
+import threading
+from os.path import join, abspath, dirname
+
+import pyrasite
+
+from pyrasite_gui.timing import timed
+
+# Injected payloads run under a governor in the target, see payloads/governor.py
+PAYLOADS = join(dirname(abspath(__file__)), 'payloads')
+PAYLOAD_DEPENDS = {'heap_dump': ['governor'], 'sampler': ['governor'],
+                   'type_summary': ['governor'], 'io_profiler': ['governor', 'hooks'],
+                   'asyncio_tasks': ['governor', 'hooks'],
+                   'lock_profiler': ['hooks'],
+                   'line_profiler': ['governor'],
+                   'modules': ['governor', 'hooks'],
+                   'containers': ['governor', 'referrers'],
+                   'duplicates': ['governor', 'referrers']}
+JOB_POLL = 0.1  # seconds between polls of a job by wait_payload()
+
+
+class PayloadError(Exception):
+    """An injected payload failed, carrying the target's traceback"""
+
+
+class PayloadMixin(object):
+    """Installs and calls our payloads in a :class:`pyrasite.PyrasiteIPC`"""
+
+    def __init__(self, *args, **kw):
+        super(PayloadMixin, self).__init__(*args, **kw)
+        # Threads take turns on the connection, one command and reply each
+        self.ipc_lock = threading.Lock()
+
+    @timed('ipc.cmd')
+    def cmd(self, cmd):
+        with self.ipc_lock:
+            if self.sock is None:
+                raise socket.error('Not connected to %d' % self.pid)
+            try:
+                return pyrasite.PyrasiteIPC.cmd(self, cmd)
+            except socket.error:
+                # A late reply would be read as the answer to the next
+                # command, so give up on the connection.
+                self.close()
+                raise
+
+    def close(self):
+        pyrasite.PyrasiteIPC.close(self)
+        self.sock = self.server_sock = None
+
+    def install_payload(self, name):
+        """Load one of our payloads into the target as a module"""
+        installed = self.__dict__.setdefault('installed_payloads', set())
+        if name in installed:
+            return
+        for dependency in PAYLOAD_DEPENDS.get(name, []):
+            self.install_payload(dependency)
+        with open(join(PAYLOADS, name + '.py')) as f:
+            source = f.read()
+        module = '_pyrasite_gui_' + name
+        output = self.cmd('\n'.join([
+            'import sys, types',
+            '_module = types.ModuleType(%r)' % module,
+            'exec(compile(%r, %r, "exec"), _module.__dict__)' % (
+                source, '<pyrasite-gui %s>' % name),
+            'sys.modules[%r] = _module' % module]))
+        if output:
+            raise PayloadError(output)
+        installed.add(name)
+
+    def call_payload(self, name, func, *args, **kw):
+        """Call a payload function in the target, returning its result"""
+        self.install_payload(name)
+        output = self.cmd('\n'.join([
+            'import sys, json',
+            'print(json.dumps(sys.modules[%r].%s(*%r, **%r)))' % (
+                '_pyrasite_gui_' + name, func, args, kw)]))
+        try:
+            return json.loads(output)
+        except ValueError:
+            raise PayloadError(output)
+
+    def spawn_payload(self, name, func, *args, **kw):
+        """
+        Start a payload function on its own thread in the target, returning
+        a job id for :meth:`poll_payload`.  Use this for anything that may
+        take longer than the IPC timeout.
+        """
+        self.install_payload(name)
+        return self.call_payload('governor', 'spawn', name, func, *args, **kw)
+
+    def poll_payload(self, job):
+        """Return whether a job is done and its result"""
+        state = self.call_payload('governor', 'poll', job)
+        if state.get('error'):
+            raise PayloadError(state['error'])
+        return state['done'], state.get('result')
+
+    def wait_payload(self, name, func, *args, **kw):
+        """Run a payload function as a job, blocking until it is done"""
+        job = self.spawn_payload(name, func, *args, **kw)
+        while True:
+            done, result = self.poll_payload(job)
+            if done:
+                return result
+            time.sleep(JOB_POLL)
+
+    def evaluate(self, source):
+        """
+        Evaluate an expression in the shell's namespace, keeping its value
+        in the target for the inspector payload to page through.  Returns
+        whatever the expression printed and the payload's result, which is
+        None for statements.
+        """
+        self.install_payload('inspector')
+        output = self.cmd('\n'.join([
+            'import sys, json',
+            'print(json.dumps(sys.modules[%r].evaluate(%r, globals(), '
+            'locals())))' % ('_pyrasite_gui_inspector', source)]))
+        printed, _, result = output.rstrip('\n').rpartition('\n')
+        try:
+            return printed, json.loads(result)
+        except ValueError:
+            raise PayloadError(output)
+
+    def dump_stacks(self):
+        """Return the output of pyrasite's `dump_stacks` payload"""
+        payloads = join(abspath(dirname(pyrasite.__file__)), 'payloads')
+        with open(join(payloads, 'dump_stacks.py')) as f:
+            return self.cmd(f.read())
+
+
+class TargetProcess(PayloadMixin, pyrasite.PyrasiteIPC):
+    """A process we inject into, outside of the GUI"""
+
+
+def is_python_process(process):
+    """Whether a :class:`psutil.Process` is running python"""
+    if 'python' in process.name().lower():
+        return True
+    if platform.system() == 'Windows':
+        # psutils.open_files often doesn't show loaded system libraries on windows
+        try:
+            import win32api, win32con, win32process
+            handle = win32api.OpenProcess(win32con.PROCESS_ALL_ACCESS, False,
+                                          process.pid)
+            for fhandle in win32process.EnumProcessModules(handle):
+                if 'python' in win32process.GetModuleFileNameEx(handle, fhandle).lower():
+                    return True
+        except:  # Can't inspect process, ignore
+            pass
+    else:
+        open_files = process.open_files()
+        if any(('python' in lib.path.lower() for lib in open_files)):
+            return True
+
+    return False
@@ -0,0 +1,169 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+
+"""
+Proportional and unique memory from /proc/<pid>/smaps, for servers whose
+workers share most of their pages with the process they were forked from.
+
+`smaps_rollup` gives the totals cheaply; the full `smaps` walk is what
+breaks memory down by kind of mapping, and is much more expensive on large
+processes, so callers should cache it with :class:`MemoryCache`.
+"""
+
+from __future__ import division
+
+import re
+import time
+import logging
+
+log = logging.getLogger('pyrasite')
+
+MAPPING = re.compile(r'^[0-9a-f]+-[0-9a-f]+ ')
+FIELDS = ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty', 'Shared_Clean',
+          'Shared_Dirty', 'Swap')
+
+CATEGORIES = ('Python heap (brk)', 'Anonymous (arenas, mmap)', 'Libraries',
+              'Mapped files', 'Stacks', 'Other')
+
+
+def category(path):
+    """Which kind of memory a mapping with this path holds"""
+    if not path:
+        return 'Anonymous (arenas, mmap)'
+    if path == '[heap]':
+        return 'Python heap (brk)'
+    if path.startswith('[stack'):
+        return 'Stacks'
+    if path.startswith('['):
+        return 'Other'
+    if path.endswith('.so') or '.so.' in path:
+        return 'Libraries'
+    return 'Mapped files'
+
+
+def parse_field(line, fields):
+    key, _, value = line.partition(':')
+    if key in FIELDS:
+        fields[key] = fields.get(key, 0) + int(value.split()[0]) * 1024
+
+
+def summarize(fields):
+    """Turn raw smaps fields (in bytes) into rss, pss, uss, shared, swap"""
+    get = fields.get
+    return dict(rss=get('Rss', 0), pss=get('Pss', 0),
+                uss=get('Private_Clean', 0) + get('Private_Dirty', 0),
+                shared=get('Shared_Clean', 0) + get('Shared_Dirty', 0),
+                swap=get('Swap', 0))
+
+
+def parse_smaps(lines):
+    """Return {category: summary} for the mappings in `smaps` lines"""
+    fields = {}
+    current = None
+    for line in lines:
+        if MAPPING.match(line):
+            parts = line.split(None, 5)
+            path = len(parts) > 5 and parts[5].strip() or ''
+            current = fields.setdefault(category(path), {})
+        elif current is not None:
+            parse_field(line, current)
+    return dict((name, summarize(values)) for name, values in fields.items())
+
+
+def parse_rollup(lines):
+    """Return the totals summary in `smaps_rollup` lines"""
+    fields = {}
+    for line in lines:
+        if not MAPPING.match(line):
+            parse_field(line, fields)
+    return summarize(fields)
+
+
+def read_smaps(pid):
+    """Return {category: summary} for every kind of mapping in `pid`"""
+    with open('/proc/%d/smaps' % pid) as smaps:
+        return parse_smaps(smaps)
+
+
+def read_rollup(pid):
+    """Return the totals summary for `pid`"""
+    try:
+        with open('/proc/%d/smaps_rollup' % pid) as rollup:
+            return parse_rollup(rollup)
+    except IOError:
+        # Kernels before 4.14 have no rollup, and others have no /proc
+        try:
+            categories = read_smaps(pid)
+        except IOError:
+            return psutil_summary(pid)
+        totals = {}
+        for summary in categories.values():
+            for key, value in summary.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+
+def psutil_summary(pid):
+    import psutil
+    info = psutil.Process(pid).memory_full_info()
+    return dict(rss=info.rss, pss=getattr(info, 'pss', info.uss),
+                uss=info.uss, shared=info.rss - info.uss,
+                swap=getattr(info, 'swap', 0))
+
+
+class MemoryCache(object):
+    """Results of an expensive per-pid reader, reused for `max_age` seconds"""
+
+    def __init__(self, reader, max_age):
+        self.reader = reader
+        self.max_age = max_age
+        self.entries = {}  # pid -> (time, result)
+
+    def get(self, pid):
+        now = time.time()
+        entry = self.entries.get(pid)
+        if entry is None or now - entry[0] >= self.max_age:
+            entry = self.entries[pid] = (now, self.reader(pid))
+        return entry[1]
+
+    def forget(self, pid):
+        self.entries.pop(pid, None)
+
+
+class Growth(object):
+    """How fast each worker's private memory grows, e.g. through
+    copy-on-write of pages shared with the process it forked from"""
+
+    def __init__(self, history=60):
+        self.history = history
+        self.samples = {}  # pid -> [(time, summary)]
+
+    def add(self, pid, summary, when=None):
+        samples = self.samples.setdefault(pid, [])
+        samples.append((when or time.time(), summary))
+        del samples[:-self.history]
+
+    def rate(self, pid, key='uss'):
+        """Bytes per second over the samples we have"""
+        samples = self.samples.get(pid, [])
+        if len(samples) < 2:
+            return 0.0
+        (start, first), (end, last) = samples[0], samples[-1]
+        if end <= start:
+            return 0.0
+        return (last[key] - first[key]) / (end - start)
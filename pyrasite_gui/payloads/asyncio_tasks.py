@@ -0,0 +1,118 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+"""
+What every asyncio task in the target is waiting on.
+
+Each task's stack is read by following the `cr_await` chain from its
+coroutine, which is far cheaper than `Task.get_stack()`.  Tasks with the same
+stack are grouped together, and each group remembers its size at the
+previous snapshot so growing groups stand out.
+"""
+
+import sys
+
+governor = sys.modules['_pyrasite_gui_governor']
+hooks = sys.modules['_pyrasite_gui_hooks']
+
+MAX_DEPTH = 64
+SAMPLE_NAMES = 3
+
+previous = {}  # signature -> task count at the last snapshot
+
+
+def all_tasks(loop):
+    asyncio = sys.modules['asyncio']
+    if hasattr(asyncio, 'all_tasks'):
+        return asyncio.all_tasks(loop)
+    return set(task for task in asyncio.Task.all_tasks(loop)
+               if not task.done())
+
+
+def frame_name(code, lineno):
+    return '%s (%s:%d)' % (code.co_name, code.co_filename, lineno)
+
+
+def coroutine_stack(coro):
+    """Frames from the task's coroutine down to what it is awaiting"""
+    stack = []
+    while coro is not None and len(stack) < MAX_DEPTH:
+        frame = getattr(coro, 'cr_frame', None) or getattr(coro, 'gi_frame',
+                                                           None)
+        code = getattr(coro, 'cr_code', None) or getattr(coro, 'gi_code',
+                                                         None)
+        if code is None:
+            # Something that is not a coroutine, usually a Future
+            stack.append('<%s>' % type(coro).__name__)
+            break
+        stack.append(frame_name(code, frame is not None and frame.f_lineno
+                                or code.co_firstlineno))
+        awaiting = getattr(coro, 'cr_await', None)
+        if awaiting is None:
+            awaiting = getattr(coro, 'gi_yieldfrom', None)
+        coro = awaiting
+    return stack
+
+
+def task_name(task):
+    get_name = getattr(task, 'get_name', None)
+    if get_name is not None:
+        return get_name()
+    return 'Task 0x%x' % id(task)
+
+
+def snapshot(**budget):
+    """
+    Group every pending task by stack.  Returns the number of loops and
+    tasks, and a list of [stack, count, change, sample names], largest first.
+    """
+    op = governor.begin('asyncio_tasks', **budget)
+    groups = {}
+    loops = hooks.running_loops()
+    tasks = 0
+    try:
+        for loop in loops:
+            for task in all_tasks(loop):
+                coro = getattr(task, 'get_coro', None)
+                coro = coro and coro() or getattr(task, '_coro', None)
+                signature = '\n'.join(coroutine_stack(coro))
+                group = groups.get(signature)
+                if group is None:
+                    group = groups[signature] = [0, []]
+                group[0] += 1
+                if len(group[1]) < SAMPLE_NAMES:
+                    group[1].append(task_name(task))
+                tasks += 1
+                op.checkpoint()
+    except governor.BudgetExceeded:
+        pass
+    finally:
+        op.finish()
+
+    result = []
+    for signature, (count, names) in groups.items():
+        result.append([signature, count,
+                       count - previous.get(signature, 0), names])
+    for signature in previous:
+        if signature not in groups:
+            result.append([signature, 0, -previous[signature], []])
+    previous.clear()
+    previous.update((signature, group[0])
+                    for signature, group in groups.items())
+    result.sort(key=lambda group: -group[1])
+    return dict(loops=len(loops), tasks=tasks, groups=result,
+                aborted=op.aborted)
@@ -0,0 +1,198 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+"""
+Container bloat: how the dicts, lists and sets the garbage collector tracks
+are sized, how much of their allocated capacity is unused, the key shapes
+of the largest groups of dicts, and who owns the worst of them.
+
+Capacity is derived from `sys.getsizeof`.  For dicts it is looked up in
+tables built by growing reference dicts one key at a time, so dicts whose
+size matches neither table, such as split instance dicts or very large
+ones, are reported with an unknown capacity and no slack.  Dicts holding
+only atomic values are not tracked by the garbage collector, so this is a
+lower bound like the type summary.
+"""
+
+import gc
+import sys
+import heapq
+import struct
+from bisect import bisect_left
+
+governor = sys.modules['_pyrasite_gui_governor']
+referrers = sys.modules['_pyrasite_gui_referrers']
+
+POINTER = struct.calcsize('P')
+LIST_BASE = sys.getsizeof([])
+SET_BASE = sys.getsizeof(set())
+SET_ENTRY = 2 * POINTER  # hash and key
+SET_MINSIZE = 8
+MAX_DICT = 1 << 16  # largest reference dict built
+MAX_SHAPE_KEYS = 32
+SAMPLES = 3  # dicts per shape searched for owners
+SPARSE = 4  # containers using less than 1/SPARSE of their capacity
+
+dict_tables = None  # [(sorted sizes, usable lengths at each size)]
+
+
+def build_dict_tables():
+    """Record the size of a dict after each resize, for str and other keys"""
+    tables = []
+    for make_key in (str, float):
+        sizes = []
+        usable = []
+        d = {}
+        last = sys.getsizeof(d)
+        for n in range(1, MAX_DICT + 1):
+            d[make_key(n)] = None
+            size = sys.getsizeof(d)
+            if size != last:
+                sizes.append(last)
+                usable.append(n - 1)
+                last = size
+        tables.append((sizes, usable))
+    return tables
+
+
+def dict_capacity(size, length):
+    """Return (capacity, smallest size that would hold `length`) or None"""
+    for sizes, usable in dict_tables:
+        i = bisect_left(sizes, size)
+        if i < len(sizes) and sizes[i] == size and usable[i] >= length:
+            ideal = bisect_left(usable, length)
+            return usable[i], sizes[ideal]
+    return None
+
+
+def set_capacity(size):
+    if size <= SET_BASE:
+        return SET_MINSIZE
+    return (size - SET_BASE) // SET_ENTRY
+
+
+def set_ideal(length):
+    """Table slots a freshly built set of `length` items gets"""
+    slots = SET_MINSIZE
+    while length * 5 >= slots * 3:
+        slots <<= 1
+    return slots
+
+
+def measure(obj, kind, size):
+    """Return (length, capacity, slack bytes); capacity is -1 if unknown"""
+    length = len(obj)
+    if kind is list:
+        capacity = (size - LIST_BASE) // POINTER
+        return length, capacity, (capacity - length) * POINTER
+    if kind is dict:
+        known = dict_capacity(size, length)
+        if known is None:
+            return length, -1, 0
+        return length, known[0], max(size - known[1], 0)
+    capacity = set_capacity(size)
+    ideal = set_ideal(length)
+    return length, capacity, max(capacity - ideal, 0) * SET_ENTRY
+
+
+def analyze(limit=20, **budget):
+    """Measure every tracked dict, list, set and frozenset"""
+    global dict_tables
+    if dict_tables is None:
+        dict_tables = build_dict_tables()
+    op = governor.begin('containers', **budget)
+    kinds = dict((kind, dict(count=0, size=0, slack=0, empty=0, sparse=0,
+                             unknown=0, lengths={}))
+                 for kind in (dict, list, set, frozenset))
+    oversized = []  # heap of (slack, id, kind name, length, capacity, size)
+    shapes = {}  # sorted keys -> [count, size, sample ids]
+    own = set(id(obj) for obj in [kinds, oversized, shapes] +
+              list(kinds.values()) +
+              [stats['lengths'] for stats in kinds.values()])
+    getsizeof = sys.getsizeof
+    try:
+        for obj in gc.get_objects():
+            kind = type(obj)
+            stats = kinds.get(kind)
+            if stats is None or id(obj) in own:
+                continue
+            size = getsizeof(obj)
+            length, capacity, slack = measure(obj, kind, size)
+            stats['count'] += 1
+            stats['size'] += size
+            stats['slack'] += slack
+            if not length:
+                stats['empty'] += 1
+            elif capacity < 0:
+                stats['unknown'] += 1
+            elif length * SPARSE < capacity:
+                stats['sparse'] += 1
+            bucket = length.bit_length()
+            stats['lengths'][bucket] = stats['lengths'].get(bucket, 0) + 1
+            if slack:
+                entry = (slack, id(obj), kind.__name__, length, capacity,
+                         size)
+                if len(oversized) < limit:
+                    heapq.heappush(oversized, entry)
+                elif entry > oversized[0]:
+                    heapq.heapreplace(oversized, entry)
+            if kind is dict and 0 < length <= MAX_SHAPE_KEYS:
+                keys = list(obj)
+                if all(isinstance(key, str) for key in keys):
+                    shape = tuple(sorted(keys))
+                    group = shapes.get(shape)
+                    if group is None:
+                        group = shapes[shape] = [0, 0, []]
+                    group[0] += 1
+                    group[1] += size
+                    if len(group[2]) < SAMPLES:
+                        group[2].append(id(obj))
+            op.checkpoint()
+        largest = heapq.nlargest(limit, shapes.items(),
+                                 key=lambda item: item[1][1])
+        oversized.sort(reverse=True)
+        wanted = set(entry[1] for entry in oversized)
+        for shape, (count, size, samples) in largest:
+            wanted.update(samples)
+        hints = referrers.owners(wanted, op)
+    except governor.BudgetExceeded:
+        largest = heapq.nlargest(limit, shapes.items(),
+                                 key=lambda item: item[1][1])
+        oversized.sort(reverse=True)
+        hints = {}
+    finally:
+        op.finish()
+
+    def shape_hints(samples):
+        found = []
+        for sample in samples:
+            for hint in hints.get(sample, ()):
+                if hint not in found:
+                    found.append(hint)
+        return found
+
+    return dict(
+        kinds=[[kind.__name__, stats['count'], stats['size'],
+                stats['slack'], stats['empty'], stats['sparse'],
+                stats['unknown'], sorted(stats['lengths'].items())]
+               for kind, stats in kinds.items() if stats['count']],
+        oversized=[[name, length, capacity, size, slack,
+                    hints.get(key, [])]
+                   for slack, key, name, length, capacity, size in oversized],
+        shapes=[[list(shape), count, size, shape_hints(samples)]
+                for shape, (count, size, samples) in largest],
+        aborted=op.aborted)
@@ -0,0 +1,211 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+"""
+Duplicated immutable values: strs, bytes and tuples of those that are
+equal but stored as separate objects, for example the values produced by
+decoding the same JSON many times, and the memory interning them would
+save.
+
+Values are found among the referents of every object the garbage
+collector tracks.  Memory is bounded by adaptive sampling on the value's
+hash: when too many instances are being tracked, only values whose hash
+has one more low bit clear are kept, and totals are scaled up to match.
+Every copy of a kept value is still counted, so the values reported are
+exact apart from the copies of very common values, which are estimated
+the same way from a sample of their ids.
+"""
+
+import gc
+import sys
+import heapq
+
+governor = sys.modules['_pyrasite_gui_governor']
+referrers = sys.modules['_pyrasite_gui_referrers']
+
+try:
+    PLAIN = frozenset([str, bytes, unicode, int, long, float, bool,
+                       type(None)])
+    VALUES = frozenset([str, unicode, tuple])
+except NameError:  # Python 3
+    PLAIN = frozenset([str, bytes, int, float, bool, type(None)])
+    VALUES = frozenset([str, bytes, tuple])
+
+MAX_TRACKED = 1 << 18  # instance ids held across all values
+MAX_IDS = 1 << 10  # instance ids held for one value
+MAX_PREVIEW = 60
+SAMPLES = 3  # copies per value searched for owners
+
+
+def plain(value):
+    """Whether a tuple holds only atomic values, so hashing runs no code"""
+    for item in value:
+        kind = type(item)
+        if kind is tuple:
+            if not plain(item):
+                return False
+        elif kind not in PLAIN:
+            return False
+    return True
+
+
+def id_hash(address):
+    """Spread an object address over 32 bits"""
+    return ((address >> 4) * 0x9E3779B1) & 0xffffffff
+
+
+class Value(object):
+    """One distinct value and the ids of its copies"""
+
+    __slots__ = ('value', 'kind', 'preview', 'size', 'ids', 'level')
+
+    def __init__(self, value, size, address):
+        self.value = value
+        self.kind = type(value)
+        self.preview = None
+        self.size = size
+        self.ids = address  # a lone id until a second copy is seen
+        self.level = 0  # copies are sampled at 1 in 2 ** level
+
+    def add(self, address):
+        """Record a copy, returning how many more ids are now held"""
+        ids = self.ids
+        if not isinstance(ids, set):
+            if ids == address:
+                return 0
+            ids = self.ids = set([ids])
+        if self.level and id_hash(address) >> (32 - self.level):
+            return 0
+        if address in ids:
+            return 0
+        ids.add(address)
+        if len(ids) <= MAX_IDS:
+            return 1
+        self.level += 1
+        dropped = [i for i in ids if id_hash(i) >> (32 - self.level)]
+        ids.difference_update(dropped)
+        return 1 - len(dropped)
+
+    @property
+    def copies(self):
+        if not isinstance(self.ids, set):
+            return 1
+        return len(self.ids) << self.level
+
+    @property
+    def tracked(self):
+        return isinstance(self.ids, set) and len(self.ids) or 1
+
+    @property
+    def wasted(self):
+        return (self.copies - 1) * self.size
+
+    def some_ids(self, limit):
+        if not isinstance(self.ids, set):
+            return [self.ids]
+        return list(self.ids)[:limit]
+
+    def release(self):
+        """Drop the reference to the value so it is not found as an owner"""
+        if self.value is not None:
+            self.preview = repr(self.value[:MAX_PREVIEW])[:MAX_PREVIEW]
+            self.value = None
+
+
+def analyze(limit=20, **budget):
+    """
+    Return the `limit` values whose duplicates waste the most memory, with
+    owner hints, and estimates of the totals over the whole heap.
+    """
+    op = governor.begin('duplicates', **budget)
+    table = {}  # (type, hash) -> Value
+    tracked = 0
+    level = 0  # distinct values are sampled at 1 in 2 ** level
+    mask = 0
+    references = 0
+    getsizeof = sys.getsizeof
+    is_tracked = gc.is_tracked
+    me = sys._getframe()
+    try:
+        for obj in gc.get_objects():
+            if obj is me:
+                continue
+            op.checkpoint()
+            pending = gc.get_referents(obj)
+            while pending:
+                ref = pending.pop()
+                kind = type(ref)
+                if kind is dict and not is_tracked(ref):
+                    # Dicts of atomic values, such as most decoded JSON
+                    # objects, are only reachable through their owners
+                    pending.extend(gc.get_referents(ref))
+                    continue
+                if kind not in VALUES or kind is tuple and not plain(ref):
+                    continue
+                references += 1
+                digest = hash(ref)
+                if digest & mask:
+                    continue
+                key = (kind, digest)
+                entry = table.get(key)
+                if entry is None:
+                    table[key] = Value(ref, getsizeof(ref), id(ref))
+                    tracked += 1
+                elif entry.value == ref:
+                    tracked += entry.add(id(ref))
+                while tracked > MAX_TRACKED:
+                    level += 1
+                    mask = (1 << level) - 1
+                    for dropped in [k for k in table if k[1] & mask]:
+                        tracked -= table.pop(dropped).tracked
+        duplicated = [entry for entry in table.values() if entry.copies > 1]
+        largest = heapq.nlargest(limit, duplicated,
+                                 key=lambda entry: entry.wasted)
+        wanted = set()
+        for entry in largest:
+            wanted.update(entry.some_ids(SAMPLES))
+            entry.release()
+        hints = referrers.owners(wanted, op)
+    except governor.BudgetExceeded:
+        duplicated = [entry for entry in table.values() if entry.copies > 1]
+        largest = heapq.nlargest(limit, duplicated,
+                                 key=lambda entry: entry.wasted)
+        hints = {}
+        for entry in largest:
+            entry.release()
+    finally:
+        op.finish()
+
+    def value_hints(entry):
+        found = []
+        for address in entry.some_ids(SAMPLES):
+            for hint in hints.get(address, ()):
+                if hint not in found:
+                    found.append(hint)
+        return found
+
+    scale = 1 << level
+    return dict(
+        values=[[entry.kind.__name__, entry.preview, entry.copies, entry.size,
+                 entry.wasted, value_hints(entry)]
+                for entry in largest],
+        references=references,
+        distinct=len(table) * scale,
+        copies=sum(entry.copies - 1 for entry in duplicated) * scale,
+        wasted=sum(entry.wasted for entry in duplicated) * scale,
+        sample=scale,
+        aborted=op.aborted)
@@ -0,0 +1,240 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+"""
+Bounds the overhead pyrasite-gui imposes on the process it is injected into.
+
+Long running work calls :meth:`Governor.checkpoint` as it goes.  Every few
+milliseconds of work the governor sleeps to keep its duty cycle, checks the
+CPU and wall time budgets, and measures how late the sleep woke up.  Waking
+up late repeatedly means the GIL is contended, so the work is aborted.
+"""
+
+import sys
+import time
+import threading
+import traceback
+from functools import partial
+from itertools import count
+
+try:
+    from threading import get_ident
+except ImportError:  # Python 2
+    from thread import get_ident
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def rusage_time(who):
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+# CPU time of the calling thread, and of the whole process
+if hasattr(time, 'thread_time'):
+    cpu_time = time.thread_time
+elif resource is not None:
+    cpu_time = partial(rusage_time, getattr(resource, 'RUSAGE_THREAD',
+                                            resource.RUSAGE_SELF))
+else:
+    cpu_time = getattr(time, 'process_time', time.time)
+if hasattr(time, 'process_time'):
+    process_cpu_time = time.process_time
+elif resource is not None:
+    process_cpu_time = partial(rusage_time, resource.RUSAGE_SELF)
+else:
+    process_cpu_time = time.clock
+
+CHECK_EVERY = 256  # checkpoint() calls between clock reads
+HISTORY = 20  # finished operations kept for the GUI
+
+operations = {}  # name -> running Governor
+finished = []
+lock = threading.Lock()
+jobs = {}  # id -> dict(done, result or error) of spawn()ed calls
+job_ids = count(1)
+service_threads = set()  # the shell's and jobs' threads, not profiled
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class Governor(object):
+    """
+    The budget of one operation.  Its CPU time is read on the thread that
+    runs it, at checkpoints and when it finishes.  Operations that are begun
+    from the shell but do their work on the target's threads, like tracing,
+    pass `process_cpu=True` to count the whole process' CPU time instead.
+    Work done for it on other threads can be added with :meth:`charge`.
+    """
+
+    def __init__(self, name, cpu_budget=5.0, wall_budget=300.0,
+                 duty_cycle=0.25, slice=0.01, max_lag=0.05, max_late=3,
+                 process_cpu=False):
+        self.name = name
+        self.cpu_budget = cpu_budget
+        self.wall_budget = wall_budget
+        self.duty_cycle = duty_cycle
+        self.slice = slice
+        self.max_lag = max_lag
+        self.max_late = max_late
+        self.start = self.slice_start = time.time()
+        self.process_cpu = process_cpu
+        self.clock = process_cpu and process_cpu_time or cpu_time
+        self.start_cpu = self.clock()
+        self.thread = get_ident()
+        self.cpu = 0.0
+        self.charged = 0.0
+        self.calls = 0
+        self.slices = 0
+        self.slept = 0.0
+        self.lag = 0.0
+        self.late = 0
+        self.aborted = None
+        self.end = None
+        with lock:
+            operations[name] = self
+
+    def checkpoint(self, throttle=True):
+        """
+        Keep the duty cycle and enforce the budgets.  Callbacks running on
+        the target's own threads pass `throttle=False`, as the target must
+        not be slowed down, and only have the budgets checked.
+        """
+        self.calls += 1
+        if self.calls % CHECK_EVERY:
+            return
+        if self.aborted:
+            raise BudgetExceeded(self.aborted)
+        now = time.time()
+        worked = now - self.slice_start
+        if worked < self.slice:
+            return
+        if get_ident() == self.thread:
+            self.cpu = self.clock() - self.start_cpu
+        if self.cpu + self.charged > self.cpu_budget:
+            self.abort('CPU budget of %.1fs exceeded' % self.cpu_budget)
+        if now - self.start > self.wall_budget:
+            self.abort('time budget of %.1fs exceeded' % self.wall_budget)
+        if not throttle:
+            self.slice_start = now
+            return
+
+        pause = worked * (1 - self.duty_cycle) / self.duty_cycle
+        time.sleep(pause)
+        woke = time.time()
+        lag = woke - now - pause
+        self.slept += woke - now
+        self.slices += 1
+        self.lag = max(self.lag, lag)
+        if lag > self.max_lag:
+            self.late += 1
+            if self.late >= self.max_late:
+                self.abort('GIL wait of %dms exceeded' % (lag * 1000))
+        else:
+            self.late = 0
+        self.slice_start = time.time()
+
+    def charge(self, seconds):
+        """Count time spent on other threads against the CPU budget"""
+        self.charged += seconds
+
+    def abort(self, reason):
+        self.aborted = reason
+        raise BudgetExceeded(reason)
+
+    def finish(self):
+        self.cpu = self.clock() - self.start_cpu
+        self.end = time.time()
+        with lock:
+            if operations.get(self.name) is self:
+                del operations[self.name]
+            finished.append(self.stats())
+            del finished[:-HISTORY]
+
+    def stats(self):
+        """Called from any thread, so only the process clock is read here"""
+        wall = (self.end or time.time()) - self.start
+        cpu = self.cpu
+        if self.process_cpu and self.end is None:
+            cpu = self.clock() - self.start_cpu
+        cpu += self.charged
+        return dict(name=self.name, cpu=cpu, process_cpu=self.process_cpu,
+                    wall=wall, slices=self.slices, slept=self.slept,
+                    lag=self.lag, aborted=self.aborted,
+                    running=self.end is None)
+
+
+def begin(name, **budget):
+    return Governor(name, **budget)
+
+
+def abort_all(reason):
+    """Ask every running operation to stop at its next checkpoint"""
+    with lock:
+        for governor in operations.values():
+            governor.aborted = reason
+    return len(operations)
+
+
+def stats():
+    with lock:
+        return ([governor.stats() for governor in operations.values()] +
+                finished[::-1])
+
+
+def spawn(module, func, *args, **kw):
+    """
+    Call one of our payload modules' functions on a thread of its own,
+    returning an id for poll().  The shell answers other commands while
+    the call runs, so none of them waits longer than the IPC timeout.
+    """
+    target = getattr(sys.modules['_pyrasite_gui_' + module], func)
+    job = dict(done=False)
+
+    def run():
+        service_threads.add(get_ident())
+        try:
+            job['result'] = target(*args, **kw)
+        except Exception:
+            job['error'] = traceback.format_exc()
+        service_threads.discard(get_ident())
+        job['done'] = True
+
+    service_threads.add(get_ident())
+    with lock:
+        job_id = next(job_ids)
+        jobs[job_id] = job
+    thread = threading.Thread(target=run, name='pyrasite-gui job %d' % job_id)
+    thread.daemon = True
+    thread.start()
+    return job_id
+
+
+def poll(job_id):
+    """Return a job's state, forgetting it once it is done"""
+    with lock:
+        job = jobs.get(job_id)
+        if job is None:
+            return dict(done=True, error='No such job: %r' % job_id)
+        if job['done']:
+            del jobs[job_id]
+        return dict(job)
@@ -0,0 +1,85 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+"""
+A governed version of meliae's `scanner.dump_all_objects`.
+
+The heap is walked in the background from `gc.get_objects()`, writing each
+object with meliae's `_scanner.dump_object_info`, and yielding to the
+target's own threads between slices.  The dump is written to `<path>.json`
+and renamed to `<path>.objects` when complete, or `<path>.aborted` is
+written with the reason if the governor stops it.
+"""
+
+import gc
+import os
+import sys
+import shutil
+import threading
+
+from meliae import _scanner
+
+governor = sys.modules['_pyrasite_gui_governor']
+
+
+def walk(outf, governor):
+    try:
+        from meliae import _intset
+        seen = _intset.IDSet()
+    except ImportError:
+        seen = set()
+    pending = gc.get_objects()
+    seen.add(id(pending))
+    seen.add(id(outf))
+    get_referents = _scanner.get_referents
+    dump_object_info = _scanner.dump_object_info
+    checkpoint = governor.checkpoint
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        dump_object_info(outf, obj, recurse_depth=0)
+        for ref in get_referents(obj):
+            if id(ref) not in seen:
+                pending.append(ref)
+        checkpoint()
+
+
+def dump(path, **budget):
+    """Start dumping the heap in a background thread"""
+    def background_dump():
+        op = governor.begin('dump_objects', **budget)
+        try:
+            outf = open(path + '.json', 'wb')
+            try:
+                walk(outf, op)
+            finally:
+                outf.close()
+            shutil.move(path + '.json', path + '.objects')
+        except governor.BudgetExceeded as e:
+            if os.path.exists(path + '.json'):
+                os.unlink(path + '.json')
+            with open(path + '.aborted', 'w') as f:
+                f.write(str(e))
+        finally:
+            op.finish()
+
+    thread = threading.Thread(target=background_dump,
+                              name='pyrasite-gui heap dump')
+    thread.daemon = True
+    thread.start()
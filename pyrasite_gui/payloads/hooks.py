@@ -0,0 +1,121 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+"""
+Reversible monkey patching and latency statistics for the payloads that
+wrap blocking calls in the target.
+
+Every patch is recorded so :meth:`Patches.restore` can put the target back
+the way it was when the GUI disconnects or a profile runs out of time.
+"""
+
+import os
+import sys
+import time
+import threading
+
+clock = getattr(time, 'perf_counter', time.time)
+
+STDLIB = os.path.dirname(os.__file__)
+MAX_DEPTH = 16
+
+
+class Stats(object):
+    """Count, total, max and log2 microsecond buckets of some durations"""
+
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = {}
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        bucket = int(elapsed * 1e6).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def to_list(self):
+        return [self.count, self.total, self.max, self.buckets]
+
+
+class Patches(object):
+    """A stack of attributes we replaced, and what they used to be"""
+
+    def __init__(self):
+        self.applied = []
+        # Expiry timers and the GUI may both restore at once
+        self.lock = threading.Lock()
+
+    def patch(self, owner, name, make_wrapper):
+        """Replace `owner.name` with `make_wrapper(original)`"""
+        with self.lock:
+            original = getattr(owner, name, None)
+            if original is None:
+                return False
+            owned = name in vars(owner)
+            setattr(owner, name, make_wrapper(original))
+            self.applied.append((owner, name, original, owned))
+            return True
+
+    def restore(self):
+        with self.lock:
+            while self.applied:
+                owner, name, original, owned = self.applied.pop()
+                if owned:
+                    setattr(owner, name, original)
+                else:
+                    # The original was inherited, e.g. from a C base class
+                    delattr(owner, name)
+
+
+def is_library(filename):
+    if filename.startswith('<pyrasite-gui'):
+        return True  # our own payloads
+    return filename.startswith(STDLIB) and 'site-packages' not in filename
+
+
+def call_site(frame):
+    """Name the innermost frame outside the standard library"""
+    depth = 0
+    while (frame.f_back is not None and depth < MAX_DEPTH and
+           is_library(frame.f_code.co_filename)):
+        frame = frame.f_back
+        depth += 1
+    code = frame.f_code
+    return '%s (%s:%d)' % (code.co_name, code.co_filename, frame.f_lineno)
+
+
+def running_loops():
+    """Find asyncio event loops by their `run_forever` frames"""
+    asyncio = sys.modules.get('asyncio')
+    if asyncio is None:
+        return []
+    loops = []
+    for frame in sys._current_frames().values():
+        while frame is not None:
+            if frame.f_code.co_name == 'run_forever':
+                loop = frame.f_locals.get('self')
+                if isinstance(loop, asyncio.AbstractEventLoop):
+                    loops.append(loop)
+                    break
+            frame = frame.f_back
+    return loops
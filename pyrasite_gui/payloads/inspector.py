@@ -0,0 +1,162 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+"""
+Lazy object browsing for the shell: an expression's result is kept alive
+in the target behind a numeric handle, and its items or attributes are
+returned a page at a time with short, bounded reprs.
+"""
+
+import sys
+import itertools
+import traceback
+
+try:
+    from reprlib import Repr
+except ImportError:  # Python 2
+    from repr import Repr
+
+MAX_REPR = 80
+SEQUENCES = (list, tuple)
+SETS = (set, frozenset)
+ATOMIC = (int, float, complex, bool, type(None))
+
+
+class ShortRepr(Repr):
+    """A Repr that shows the first few items of dicts and sets unsorted"""
+
+    def repr_dict(self, x, level):
+        if not x:
+            return '{}'
+        if level <= 0:
+            return '{...}'
+        items = getattr(x, 'iteritems', x.items)()
+        pieces = ['%s: %s' % (self.repr1(key, level - 1),
+                              self.repr1(value, level - 1))
+                  for key, value in itertools.islice(items, self.maxdict)]
+        if len(x) > self.maxdict:
+            pieces.append('...')
+        return '{%s}' % ', '.join(pieces)
+
+    def repr_set(self, x, level):
+        if not x:
+            return '%s()' % type(x).__name__
+        if level <= 0:
+            return '{...}'
+        pieces = [self.repr1(item, level - 1)
+                  for item in itertools.islice(x, self.maxset)]
+        if len(x) > self.maxset:
+            pieces.append('...')
+        return '{%s}' % ', '.join(pieces)
+
+    repr_frozenset = repr_set
+
+
+short = ShortRepr()
+short.maxlevel = 2
+short.maxstring = short.maxother = short.maxlong = MAX_REPR
+
+handles = {}  # handle -> object kept alive for the browser
+counter = itertools.count(1)
+
+
+def attributes(obj):
+    """Sorted names of the attributes stored on an object"""
+    names = set(getattr(obj, '__dict__', None) or ())
+    for kind in type(obj).__mro__:
+        slots = kind.__dict__.get('__slots__', ())
+        if isinstance(slots, str):
+            slots = [slots]
+        names.update(name for name in slots
+                     if name not in ('__dict__', '__weakref__') and
+                     hasattr(obj, name))
+    return sorted(names)
+
+
+def node(obj):
+    """[handle, type, repr, size, length] for an object"""
+    if isinstance(obj, (dict,) + SEQUENCES + SETS):
+        length = len(obj)
+    elif isinstance(obj, ATOMIC) or isinstance(obj, (str, bytes)):
+        length = -1
+    else:
+        length = len(attributes(obj))
+    handle = 0
+    if length > 0:
+        handle = next(counter)
+        handles[handle] = obj
+    try:
+        text = short.repr(obj)
+    except Exception as e:
+        text = '<repr failed: %s>' % e
+    return [handle, type(obj).__name__, text[:MAX_REPR],
+            sys.getsizeof(obj, 0), length]
+
+
+def evaluate(source, namespace, local_namespace=None):
+    """
+    Evaluate `source` as an expression in the shell's namespace.  Returns
+    None if it is a statement, otherwise {'node': node} or {'error': tb}.
+    """
+    try:
+        code = compile(source, '<pyrasite-gui shell>', 'eval')
+    except SyntaxError:
+        return None
+    try:
+        value = eval(code, namespace, local_namespace)
+    except Exception:
+        return dict(error=traceback.format_exc())
+    return dict(node=node(value))
+
+
+def children(handle, start=0, count=100):
+    """Return a page of [label, node] children and the total available"""
+    obj = handles[handle]
+    page = []
+    if isinstance(obj, dict):
+        total = len(obj)
+        items = getattr(obj, 'iteritems', obj.items)()
+        # Taken in one call so other threads cannot resize it meanwhile
+        for key, value in list(itertools.islice(items, start,
+                                                start + count)):
+            page.append([short.repr(key), node(value)])
+    elif isinstance(obj, SEQUENCES):
+        total = len(obj)
+        for i, value in enumerate(obj[start:start + count]):
+            page.append(['[%d]' % (start + i), node(value)])
+    elif isinstance(obj, SETS):
+        total = len(obj)
+        for value in list(itertools.islice(obj, start, start + count)):
+            page.append(['', node(value)])
+    else:
+        names = attributes(obj)
+        total = len(names)
+        for name in names[start:start + count]:
+            page.append(['.' + name, node(getattr(obj, name, None))])
+    return dict(children=page, total=total)
+
+
+def release(*released):
+    """Forget handles so their objects can be collected"""
+    for handle in released:
+        handles.pop(handle, None)
+    return len(handles)
+
+
+def release_all():
+    handles.clear()
+    return 0
@@ -0,0 +1,245 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+"""
+Where does the target block?  Wraps socket, os.read/os.write, select,
+selectors, time.sleep and threading waits, and records a latency histogram
+per call and call site.  For asyncio programs it also measures event loop
+lag with a heartbeat callback and times every loop callback to catch slow
+ones.
+
+Calls made by the pyrasite thread serving the GUI, by the governor's job
+threads, and by our own timer, are not recorded.  Everything is unpatched by :func:`stop` or after
+`max_duration` seconds.
+"""
+
+import sys
+import time
+import select
+import socket
+import threading
+
+try:
+    from threading import get_ident
+except ImportError:  # Python 2
+    from thread import get_ident
+
+try:
+    import selectors
+except ImportError:  # Python 2
+    selectors = None
+
+governor = sys.modules['_pyrasite_gui_governor']
+hooks = sys.modules['_pyrasite_gui_hooks']
+clock = hooks.clock
+
+SOCKET_CALLS = ('recv', 'recv_into', 'recvfrom', 'send', 'sendall', 'sendto',
+                'accept', 'connect')
+
+lock = threading.Lock()
+patches = hooks.Patches()
+calls = {}  # (call, site) -> Stats
+loop_lag = {}  # loop name -> Stats
+slow_callbacks = {}  # callback name -> Stats
+state = dict(active=False, ignored=(), started=None, expiry=None,
+             slow_callback=0.1, heartbeat=0.1, loops=[])
+# Set while a thread is inside a wrapped call, so that calls made by it,
+# such as Event.wait's Condition.wait, are not counted again
+inside = threading.local()
+
+
+def record(name, elapsed, frame):
+    site = hooks.call_site(frame)
+    key = (name, site)
+    with lock:
+        stats = calls.get(key)
+        if stats is None:
+            stats = calls[key] = hooks.Stats()
+        stats.add(elapsed)
+
+
+def wrap(name, original):
+    def wrapper(*args, **kw):
+        if not state['active'] or getattr(inside, 'call', False):
+            return original(*args, **kw)
+        ident = get_ident()
+        if ident in state['ignored'] or ident in governor.service_threads:
+            return original(*args, **kw)
+        inside.call = True
+        start = clock()
+        try:
+            return original(*args, **kw)
+        finally:
+            elapsed = clock() - start
+            inside.call = False
+            record(name, elapsed, sys._getframe(1))
+    wrapper.__name__ = getattr(original, '__name__', name)
+    wrapper.__doc__ = getattr(original, '__doc__', None)
+    return wrapper
+
+
+def wrapping(name):
+    return lambda original: wrap(name, original)
+
+
+def patch_blocking_calls():
+    for call in SOCKET_CALLS:
+        patches.patch(socket.socket, call, wrapping('socket.' + call))
+    patches.patch(sys.modules['os'], 'read', wrapping('os.read'))
+    patches.patch(sys.modules['os'], 'write', wrapping('os.write'))
+    patches.patch(select, 'select', wrapping('select.select'))
+    if selectors is not None:
+        for name in dir(selectors):
+            cls = getattr(selectors, name)
+            # Skip aliases such as DefaultSelector so nothing is wrapped twice
+            if (isinstance(cls, type) and cls.__name__ == name and
+                    'select' in vars(cls)):
+                patches.patch(cls, 'select',
+                              wrapping('selectors.%s.select' % name))
+    patches.patch(time, 'sleep', wrapping('time.sleep'))
+    # On Python 2 Event and Condition are factories for these classes
+    patches.patch(getattr(threading, '_Event', threading.Event), 'wait',
+                  wrapping('threading.Event.wait'))
+    patches.patch(getattr(threading, '_Condition', threading.Condition),
+                  'wait', wrapping('threading.Condition.wait'))
+
+
+##
+## asyncio
+##
+
+def describe_callback(handle):
+    callback = handle._callback
+    task = getattr(callback, '__self__', None)
+    get_coro = getattr(task, 'get_coro', None)
+    if get_coro is not None:
+        coro = get_coro()
+        code = getattr(coro, 'cr_code', None)
+        if code is not None:
+            return 'task %s (%s:%d)' % (code.co_name, code.co_filename,
+                                         code.co_firstlineno)
+        return 'task %r' % coro
+    code = getattr(callback, '__code__', None)
+    if code is not None:
+        return '%s (%s:%d)' % (code.co_name, code.co_filename,
+                               code.co_firstlineno)
+    return repr(callback)
+
+
+def wrap_handle_run(original):
+    def _run(self):
+        if not state['active']:
+            return original(self)
+        start = clock()
+        try:
+            return original(self)
+        finally:
+            elapsed = clock() - start
+            if elapsed >= state['slow_callback']:
+                name = describe_callback(self)
+                with lock:
+                    stats = slow_callbacks.get(name)
+                    if stats is None:
+                        stats = slow_callbacks[name] = hooks.Stats()
+                    stats.add(elapsed)
+    return _run
+
+
+def start_heartbeat(loop):
+    name = '%s 0x%x' % (type(loop).__name__, id(loop))
+    interval = state['heartbeat']
+    with lock:
+        stats = loop_lag[name] = hooks.Stats()
+
+    def beat(expected):
+        if not state['active'] or loop.is_closed():
+            return
+        now = loop.time()
+        with lock:
+            stats.add(max(now - expected, 0.0))
+        loop.call_later(interval, beat, now + interval)
+
+    loop.call_soon_threadsafe(beat, loop.time())
+
+
+def patch_asyncio():
+    loops = hooks.running_loops()
+    if not loops:
+        return 0
+    events = sys.modules['asyncio'].events
+    patches.patch(events.Handle, '_run', wrap_handle_run)
+    for loop in loops:
+        start_heartbeat(loop)
+    return len(loops)
+
+
+##
+## Control
+##
+
+def start(max_duration=300.0, slow_callback=0.1, heartbeat=0.1):
+    """Start recording, returning the number of event loops found"""
+    if state['active']:
+        stop()
+    reset()
+    state.update(ignored=(get_ident(),), started=time.time(),
+                 slow_callback=slow_callback, heartbeat=heartbeat)
+    patch_blocking_calls()
+    state['active'] = True
+    loops = patch_asyncio()
+    cancelled = state['expiry'] = threading.Event()
+    thread = threading.Thread(target=expire, args=(cancelled, max_duration))
+    thread.daemon = True
+    thread.start()
+    return loops
+
+
+def expire(cancelled, max_duration):
+    # Ignored before it first waits, so its own wait is never recorded
+    state['ignored'] += (get_ident(),)
+    cancelled.wait(max_duration)
+    if not cancelled.is_set():
+        stop()
+
+
+def stop():
+    state['active'] = False
+    patches.restore()
+    if state['expiry'] is not None:
+        state['expiry'].set()
+        state['expiry'] = None
+
+
+def reset():
+    with lock:
+        calls.clear()
+        loop_lag.clear()
+        slow_callbacks.clear()
+
+
+def snapshot():
+    """Everything recorded so far, as JSON friendly lists"""
+    with lock:
+        return dict(
+            active=state['active'],
+            elapsed=state['started'] and time.time() - state['started'],
+            calls=[[name, site] + stats.to_list()
+                   for (name, site), stats in calls.items()],
+            loops=[[name] + stats.to_list()
+                   for name, stats in loop_lag.items()],
+            slow_callbacks=[[name] + stats.to_list()
+                            for name, stats in slow_callbacks.items()])
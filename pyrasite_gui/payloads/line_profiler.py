@@ -0,0 +1,247 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+"""
+Per-line hit counts and time for a single function in the target.
+
+On Python 3.12 and later `sys.monitoring` delivers LINE events for just the
+chosen code object, so every other function runs at full speed.  Older
+interpreters can only trace threads started after tracing is enabled, which
+misses the worker threads that matter, so there we sample every thread and
+attribute each sample to the line the function's frame is on instead.
+"""
+
+import gc
+import sys
+import time
+import types
+import linecache
+
+try:
+    from threading import get_ident
+except ImportError:  # Python 2
+    from thread import get_ident
+
+governor = sys.modules['_pyrasite_gui_governor']
+clock = getattr(time, 'perf_counter', time.time)
+
+MAX_EVENTS = 5000000  # stop monitoring early after this many events
+SAMPLE_INTERVAL = 0.001
+
+
+class NotFound(Exception):
+    pass
+
+
+def code_lines(code):
+    if hasattr(code, 'co_lines'):
+        return set(line for start, end, line in code.co_lines()
+                   if line is not None)
+    import dis
+    return set(line for offset, line in dis.findlinestarts(code))
+
+
+def resolve(target):
+    """Find the code object for ``module:qualified.name``"""
+    module, _, qualname = target.partition(':')
+    obj = sys.modules.get(module) or __import__(module, fromlist=['*'])
+    for part in qualname.split('.'):
+        obj = getattr(obj, part)
+    obj = getattr(obj, '__func__', obj)
+    while hasattr(obj, '__wrapped__'):
+        obj = obj.__wrapped__
+    code = getattr(obj, '__code__', None)
+    if code is None:
+        raise NotFound('%s is not a Python function' % target)
+    return code
+
+
+def find_code(filename, lineno, op):
+    """Find the innermost function defined in `filename` around `lineno`,
+    looking at running frames before searching the whole heap"""
+    candidates = set()
+    for frame in sys._current_frames().values():
+        while frame is not None:
+            if frame.f_code.co_filename == filename:
+                candidates.add(frame.f_code)
+            frame = frame.f_back
+    if not any(lineno in code_lines(code) for code in candidates):
+        for obj in gc.get_objects():
+            if (isinstance(obj, types.FunctionType) and
+                    obj.__code__.co_filename == filename):
+                candidates.add(obj.__code__)
+            op.checkpoint()
+    matches = [code for code in candidates if lineno in code_lines(code)]
+    if not matches:
+        raise NotFound('No function at %s:%d' % (filename, lineno))
+    return max(matches, key=lambda code: code.co_firstlineno)
+
+
+def monitor(code, duration, lines, op):
+    """
+    Record [hits, seconds] per line with sys.monitoring.  The callbacks run
+    on the target's threads, so they charge their time to `op` and check
+    its budgets without keeping its duty cycle.
+    """
+    monitoring = sys.monitoring
+    events = monitoring.events
+    tool = None
+    for i in range(6):
+        if monitoring.get_tool(i) is None:
+            tool = i
+            break
+    if tool is None:
+        raise RuntimeError('No free sys.monitoring tool ids')
+    frames = {}  # thread ident -> stack of [current line, since]
+    counters = dict(calls=0, events=0)
+
+    def entered(code, offset):
+        frames.setdefault(get_ident(), []).append([None, clock()])
+        counters['calls'] += 1
+
+    def line(code, lineno):
+        now = clock()
+        stack = frames.get(get_ident())
+        if not stack:
+            # Already running when monitoring started
+            stack = frames[get_ident()] = [[None, now]]
+        top = stack[-1]
+        if top[0] is not None:
+            lines[top[0]][1] += now - top[1]
+        entry = lines.get(lineno)
+        if entry is None:
+            entry = lines[lineno] = [0, 0.0]
+        entry[0] += 1
+        top[0] = lineno
+        counters['events'] += 1
+        op.charge(clock() - now)
+        try:
+            op.checkpoint(throttle=False)
+        except governor.BudgetExceeded:
+            pass  # Never raise into the target, the loop below stops
+        top[1] = clock()
+
+    def left(code, offset, value):
+        now = clock()
+        stack = frames.get(get_ident())
+        if stack:
+            lineno, since = stack.pop()
+            if lineno is not None:
+                lines[lineno][1] += now - since
+
+    # Exceptions leaving the function and generator.throw() can only be
+    # monitored globally, so these see every function and must filter
+    def unwound(called, offset, exception):
+        if called is code:
+            left(called, offset, None)
+
+    def thrown(called, offset, exception):
+        if called is code:
+            entered(called, offset)
+
+    callbacks = ((events.PY_START, entered), (events.PY_RESUME, entered),
+                 (events.LINE, line), (events.PY_RETURN, left),
+                 (events.PY_YIELD, left), (events.PY_UNWIND, unwound),
+                 (events.PY_THROW, thrown))
+    monitoring.use_tool_id(tool, 'pyrasite-gui')
+    try:
+        for event, callback in callbacks:
+            monitoring.register_callback(tool, event, callback)
+        monitoring.set_local_events(tool, code, events.PY_START |
+                                    events.PY_RESUME | events.LINE |
+                                    events.PY_RETURN | events.PY_YIELD)
+        monitoring.set_events(tool, events.PY_UNWIND | events.PY_THROW)
+        end = time.time() + duration
+        while (time.time() < end and counters['events'] < MAX_EVENTS and
+               not op.aborted):
+            time.sleep(0.05)
+    finally:
+        monitoring.set_events(tool, 0)
+        monitoring.set_local_events(tool, code, 0)
+        for event, callback in callbacks:
+            monitoring.register_callback(tool, event, None)
+        monitoring.free_tool_id(tool)
+    return counters['calls']
+
+
+def sample(code, duration, lines, op, interval=SAMPLE_INTERVAL):
+    """Attribute samples of every thread to the line `code` is on"""
+    me = get_ident()
+    end = time.time() + duration
+    samples = 0
+    last = clock()
+    while time.time() < end:
+        # Each sample stands for the time since the previous one, which the
+        # governor's pauses stretch well beyond `interval`
+        now = clock()
+        period = samples and now - last or interval
+        last = now
+        for ident, frame in sys._current_frames().items():
+            if ident == me or ident in governor.service_threads:
+                continue
+            while frame is not None:
+                if frame.f_code is code:
+                    entry = lines.get(frame.f_lineno)
+                    if entry is None:
+                        entry = lines[frame.f_lineno] = [0, 0.0]
+                    entry[0] += 1
+                    entry[1] += period
+                    break
+                frame = frame.f_back
+        samples += 1
+        op.checkpoint()
+        time.sleep(interval)
+    return samples
+
+
+def profile(target=None, filename=None, lineno=None, duration=5.0,
+            **budget):
+    """
+    Profile the function named by `target` (``module:qualname``) or the one
+    around `filename`:`lineno` for `duration` seconds.
+    """
+    op = governor.begin('line_profile', **budget)
+    lines = {}
+    mode = None
+    count = 0  # calls when monitoring, samples when sampling
+    try:
+        if target:
+            code = resolve(target)
+        else:
+            code = find_code(filename, lineno, op)
+        if hasattr(sys, 'monitoring'):
+            mode = 'monitoring'
+            count = monitor(code, duration, lines, op)
+        else:
+            mode = 'sampling'
+            count = sample(code, duration, lines, op)
+    except governor.BudgetExceeded:
+        code = None
+    finally:
+        op.finish()
+    if code is None:
+        return dict(aborted=op.aborted)
+
+    numbers = code_lines(code)
+    first = min([code.co_firstlineno] + list(numbers))
+    last = max([code.co_firstlineno] + list(numbers))
+    source = linecache.getlines(code.co_filename)[first - 1:last]
+    return dict(mode=mode, name=code.co_name, filename=code.co_filename,
+                first=first, source=source, count=count,
+                lines=[[n, hits, elapsed]
+                       for n, (hits, elapsed) in lines.items()],
+                aborted=op.aborted)
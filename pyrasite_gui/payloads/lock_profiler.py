@@ -0,0 +1,331 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+"""
+Lock contention in the target.
+
+While running, the threading.Lock and threading.RLock factories return
+profiled wrappers, so every lock created afterwards (including the ones
+inside new Conditions, Events and queue.Queues) records how long callers
+waited for it and how long it was held.  Statistics are aggregated per lock
+creation site.  Blocking queue.Queue.get and put calls are timed per call
+site too.
+
+Locks that already exist cannot be replaced, only new ones are profiled.
+Wrappers stay functional after :func:`stop`, they just stop recording.
+"""
+
+import sys
+import time
+import weakref
+import threading
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+try:
+    from threading import get_ident
+except ImportError:  # Python 2
+    from thread import get_ident
+
+hooks = sys.modules['_pyrasite_gui_hooks']
+clock = hooks.clock
+
+MAX_STACK = 32
+
+table_lock = threading.Lock()  # created before we patch anything
+patches = hooks.Patches()
+locks = {}  # (kind, creation site) -> LockStats
+queue_waits = {}  # (call, site) -> Stats
+state = dict(active=False, started=None, timer=None)
+
+
+class LockStats(object):
+    """Everything recorded about the locks created at one site"""
+
+    def __init__(self, kind, site):
+        self.kind = kind
+        self.site = site
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait = hooks.Stats()
+        self.hold = hooks.Stats()
+        self.waiter_sites = {}  # site -> Stats of waits there
+        self.holder_sites = {}  # site -> times it made someone wait
+        self.instances = weakref.WeakSet()
+
+    def acquired(self):
+        with table_lock:
+            self.acquisitions += 1
+
+    def waited(self, elapsed, site, holder_site):
+        with table_lock:
+            self.contended += 1
+            self.wait.add(elapsed)
+            stats = self.waiter_sites.get(site)
+            if stats is None:
+                stats = self.waiter_sites[site] = hooks.Stats()
+            stats.add(elapsed)
+            if holder_site is not None:
+                self.holder_sites[holder_site] = \
+                    self.holder_sites.get(holder_site, 0) + 1
+
+    def held(self, elapsed):
+        with table_lock:
+            self.hold.add(elapsed)
+
+
+def lock_stats(kind, frame):
+    key = (kind, hooks.call_site(frame))
+    with table_lock:
+        stats = locks.get(key)
+        if stats is None:
+            stats = locks[key] = LockStats(kind, key[1])
+        return stats
+
+
+class ProfiledLock(object):
+
+    def __init__(self, lock, stats):
+        self._lock = lock
+        self._stats = stats
+        self._owner = None
+        self._held_at = None
+        self._held_frame = None
+        self._waiting = set()
+        stats.instances.add(self)
+
+    def acquire(self, blocking=True, *args, **kw):
+        if not state['active']:
+            return self._lock.acquire(blocking, *args, **kw)
+        frame = sys._getframe(1)
+        if self._lock.acquire(False):
+            acquired = True
+        elif not blocking:
+            return False
+        else:
+            holder = self._held_frame
+            ident = get_ident()
+            self._waiting.add(ident)
+            start = clock()
+            try:
+                acquired = self._lock.acquire(blocking, *args, **kw)
+            finally:
+                self._waiting.discard(ident)
+            self._stats.waited(clock() - start, hooks.call_site(frame),
+                               holder is not None and
+                               hooks.call_site(holder) or None)
+        if acquired:
+            self._stats.acquired()
+            self._acquired(frame)
+        return acquired
+
+    def _acquired(self, frame):
+        self._owner = get_ident()
+        self._held_frame = frame
+        self._held_at = clock()
+
+    def release(self):
+        held_at = self._held_at
+        self._owner = self._held_at = self._held_frame = None
+        self._lock.release()
+        if held_at is not None and state['active']:
+            self._stats.held(clock() - held_at)
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    # threading.Condition checks that its lock is held by trying to take it.
+    # Probe the real lock so that check is not counted as a use.
+    def _is_owned(self):
+        if self._lock.acquire(False):
+            self._lock.release()
+            return False
+        return True
+
+    def __getattr__(self, name):
+        return getattr(self._lock, name)
+
+    def __repr__(self):
+        return '<profiled %r>' % self._lock
+
+
+class ProfiledRLock(ProfiledLock):
+    """Only the outermost acquire and release of a re-entrant lock count"""
+
+    def __init__(self, lock, stats):
+        super(ProfiledRLock, self).__init__(lock, stats)
+        self._depth = 0
+
+    def acquire(self, blocking=True, *args, **kw):
+        if self._owner == get_ident():
+            self._lock.acquire(blocking, *args, **kw)
+            self._depth += 1
+            return True
+        acquired = super(ProfiledRLock, self).acquire(blocking, *args, **kw)
+        if acquired:
+            self._depth = 1
+        return acquired
+
+    __enter__ = acquire
+
+    def release(self):
+        if self._depth > 1:
+            self._depth -= 1
+            self._lock.release()
+            return
+        self._depth = 0
+        super(ProfiledRLock, self).release()
+
+    # Used by threading.Condition.wait() to fully release a re-entrant lock
+    def _release_save(self):
+        held_at = self._held_at
+        depth = self._depth
+        self._owner = self._held_at = self._held_frame = None
+        self._depth = 0
+        saved = self._lock._release_save()
+        if held_at is not None and state['active']:
+            self._stats.held(clock() - held_at)
+        return saved, depth
+
+    def _acquire_restore(self, saved):
+        saved, depth = saved
+        self._lock._acquire_restore(saved)
+        self._depth = depth
+        self._acquired(sys._getframe(1))
+
+    def _is_owned(self):
+        return self._lock._is_owned()
+
+
+def lock_factory(kind, cls):
+    def factory(original):
+        def make_lock(*args, **kw):
+            lock = original(*args, **kw)
+            if not state['active']:
+                return lock
+            return cls(lock, lock_stats(kind, sys._getframe(1)))
+        return make_lock
+    return factory
+
+
+def wrap_queue_call(name):
+    def factory(original):
+        def wrapper(self, *args, **kw):
+            if not state['active']:
+                return original(self, *args, **kw)
+            start = clock()
+            try:
+                return original(self, *args, **kw)
+            finally:
+                elapsed = clock() - start
+                key = (name, hooks.call_site(sys._getframe(1)))
+                with table_lock:
+                    stats = queue_waits.get(key)
+                    if stats is None:
+                        stats = queue_waits[key] = hooks.Stats()
+                    stats.add(elapsed)
+        wrapper.__name__ = original.__name__
+        wrapper.__doc__ = original.__doc__
+        return wrapper
+    return factory
+
+
+def thread_stack(frames, ident):
+    frame = frames.get(ident)
+    stack = []
+    while frame is not None and len(stack) < MAX_STACK:
+        code = frame.f_code
+        if code.co_filename.startswith('<pyrasite-gui'):
+            frame = frame.f_back
+            continue
+        stack.append('%s (%s:%d)' % (code.co_name, code.co_filename,
+                                     frame.f_lineno))
+        frame = frame.f_back
+    return stack
+
+
+##
+## Control
+##
+
+def start(max_duration=300.0):
+    if state['active']:
+        stop()
+    reset()
+    # Created first so the timer's own Event is not profiled
+    timer = state['timer'] = threading.Timer(max_duration, stop)
+    timer.daemon = True
+    patches.patch(threading, 'Lock', lock_factory('Lock', ProfiledLock))
+    patches.patch(threading, 'RLock', lock_factory('RLock', ProfiledRLock))
+    patches.patch(queue.Queue, 'get', wrap_queue_call('queue.Queue.get'))
+    patches.patch(queue.Queue, 'put', wrap_queue_call('queue.Queue.put'))
+    state.update(active=True, started=time.time())
+    timer.start()
+
+
+def stop():
+    state['active'] = False
+    patches.restore()
+    if state['timer'] is not None:
+        state['timer'].cancel()
+        state['timer'] = None
+
+
+def reset():
+    with table_lock:
+        locks.clear()
+        queue_waits.clear()
+
+
+def snapshot(limit=20):
+    """The `limit` locks callers waited longest for, with the stacks of
+    any threads holding or waiting for them right now"""
+    frames = sys._current_frames()
+    with table_lock:
+        top = sorted(locks.values(), key=lambda stats: -stats.wait.total)
+        result = []
+        for stats in top[:limit]:
+            live = []
+            for lock in list(stats.instances):
+                waiting = list(lock._waiting)
+                if waiting:
+                    live.append(dict(
+                        holder=thread_stack(frames, lock._owner),
+                        waiters=[thread_stack(frames, ident)
+                                 for ident in waiting]))
+            result.append(dict(
+                kind=stats.kind, site=stats.site,
+                acquisitions=stats.acquisitions, contended=stats.contended,
+                wait=stats.wait.to_list(), hold=stats.hold.to_list(),
+                waiter_sites=[[site, waits.to_list()]
+                              for site, waits in stats.waiter_sites.items()],
+                holder_sites=sorted(stats.holder_sites.items(),
+                                    key=lambda item: -item[1]),
+                live=live))
+        queues = [[name, site] + waits.to_list()
+                  for (name, site), waits in queue_waits.items()]
+    return dict(active=state['active'],
+                elapsed=state['started'] and time.time() - state['started'],
+                locks=result, queues=queues)
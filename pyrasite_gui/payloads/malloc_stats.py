@@ -0,0 +1,157 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+"""
+Allocator statistics: pymalloc's arenas, pools and size classes from
+`sys._debugmallocstats`, and glibc's heaps from `malloc_info(3)`.  Both
+report how much of the memory they hold is actually in use, which is what
+tells fragmentation apart from live objects when RSS never shrinks.
+"""
+
+import os
+import re
+import sys
+import tempfile
+
+SIZE_CLASS = re.compile(r'^\s*(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s*$')
+TOTAL = re.compile(r'^# (.+?)\s*=\s*([\d,]+)\s*$')
+ARENAS = re.compile(r'^(\d+) arenas \* (\d+) bytes/arena\s*=\s*([\d,]+)')
+POOLS = re.compile(r'^(\d+) unused pools \* (\d+) bytes\s*=\s*([\d,]+)')
+
+
+def number(text):
+    return int(text.replace(',', ''))
+
+
+def capture_stderr(func):
+    """Return what `func` writes to file descriptor 2"""
+    sys.stderr.flush()
+    saved = os.dup(2)
+    output = tempfile.TemporaryFile()
+    try:
+        os.dup2(output.fileno(), 2)
+        try:
+            func()
+        finally:
+            os.dup2(saved, 2)
+        output.seek(0)
+        return output.read().decode('ascii', 'replace')
+    finally:
+        os.close(saved)
+        output.close()
+
+
+def parse_debugmallocstats(text):
+    """Parse the arena summary and size class table of the first pymalloc
+    section of `sys._debugmallocstats` output"""
+    classes = []
+    totals = {}
+    for line in text.splitlines():
+        match = SIZE_CLASS.match(line)
+        if match:
+            index, size, pools, used, free = map(int, match.groups())
+            classes.append(dict(size=size, pools=pools, used=used,
+                                free=free, used_bytes=used * size,
+                                free_bytes=free * size))
+            continue
+        match = TOTAL.match(line)
+        if match:
+            totals[match.group(1).replace('# ', '')] = number(match.group(2))
+            continue
+        match = ARENAS.match(line)
+        if match:
+            totals['arena size'] = int(match.group(2))
+            totals['arena bytes'] = number(match.group(3))
+            continue
+        match = POOLS.match(line)
+        if match:
+            totals['unused pools'] = int(match.group(1))
+            totals['pool size'] = int(match.group(2))
+            continue
+        if line.startswith('Total') and classes:
+            break  # the arena map and free lists follow
+    if not classes:
+        return None
+    arena_bytes = totals.get('arena bytes', 0)
+    allocated = totals.get('bytes in allocated blocks', 0)
+    return dict(classes=classes,
+                arenas=totals.get('arenas allocated current', 0),
+                arenas_highwater=totals.get('arenas highwater mark', 0),
+                arenas_reclaimed=totals.get('arenas reclaimed', 0),
+                arena_bytes=arena_bytes, allocated=allocated,
+                available=totals.get('bytes in available blocks', 0),
+                unused_pools=totals.get('unused pools', 0),
+                fragmentation=arena_bytes and
+                (arena_bytes - allocated) / float(arena_bytes) or 0.0)
+
+
+def pymalloc():
+    """Return pymalloc's statistics, or None if it is not in use"""
+    if not hasattr(sys, '_debugmallocstats'):
+        return None  # Python < 3.3
+    return parse_debugmallocstats(capture_stderr(sys._debugmallocstats))
+
+
+def parse_malloc_info(xml):
+    """Sum the totals of every glibc heap in `malloc_info` output"""
+    from xml.etree import ElementTree
+    root = ElementTree.fromstring(xml)
+    totals = dict(heaps=len(root.findall('heap')))
+    for element in root:
+        if element.tag == 'total':
+            kind = element.get('type')
+            totals[kind + '_count'] = int(element.get('count', 0))
+            totals[kind] = int(element.get('size', 0))
+        elif element.tag == 'system' and element.get('type') == 'current':
+            totals['system'] = int(element.get('size', 0))
+        elif element.tag == 'aspace' and element.get('type') == 'total':
+            totals['aspace'] = int(element.get('size', 0))
+    free = totals.get('fast', 0) + totals.get('rest', 0)
+    totals['free'] = free
+    totals['fragmentation'] = (totals.get('system') and
+                               free / float(totals['system']) or 0.0)
+    return totals
+
+
+def glibc():
+    """Return glibc malloc's statistics, or None if they are unavailable"""
+    import ctypes
+    try:
+        libc = ctypes.CDLL(None)
+        malloc_info = libc.malloc_info
+        open_memstream = libc.open_memstream
+    except (OSError, AttributeError):
+        return None  # not glibc
+    buf = ctypes.c_char_p()
+    size = ctypes.c_size_t()
+    open_memstream.restype = ctypes.c_void_p
+    stream = open_memstream(ctypes.byref(buf), ctypes.byref(size))
+    if not stream:
+        return None
+    try:
+        malloc_info(0, ctypes.c_void_p(stream))
+    finally:
+        libc.fclose(ctypes.c_void_p(stream))
+    try:
+        xml = ctypes.string_at(buf, size.value)
+    finally:
+        libc.free(buf)
+    return parse_malloc_info(xml)
+
+
+def stats():
+    return dict(pymalloc=pymalloc(), glibc=glibc())
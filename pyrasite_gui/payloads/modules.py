@@ -0,0 +1,179 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+"""
+What the target has imported: each module's size on disk, the approximate
+memory held by its globals, and how long it took to import.
+
+Globals are measured by walking everything reachable from a module's
+namespace, stopping at other modules and at functions and classes defined
+elsewhere, and counting each object once for the first module to reach it.
+
+Import times come from the ``-X importtime`` log when the target's stderr
+is a file, and from :func:`record_imports` for imports made afterwards.
+"""
+
+import gc
+import os
+import sys
+import types
+import threading
+
+try:
+    from threading import get_ident
+except ImportError:  # Python 2
+    from thread import get_ident
+
+governor = sys.modules['_pyrasite_gui_governor']
+hooks = sys.modules['_pyrasite_gui_hooks']
+clock = hooks.clock
+
+MAX_OBJECTS = 200000  # per module
+OWNED_TYPES = (type, types.FunctionType)
+
+lock = threading.Lock()
+patches = hooks.Patches()
+import_times = {}  # module name -> [self seconds, cumulative seconds]
+import_stacks = {}  # thread ident -> time spent in nested imports
+
+
+def disk_size(module):
+    size = 0
+    for attr in ('__file__', '__cached__'):
+        path = getattr(module, attr, None)
+        if isinstance(path, str):
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+    return size
+
+
+def globals_size(name, module, seen, stop, op):
+    """Shallow size and count of objects reachable from a module's globals"""
+    namespace = vars(module)
+    size = sys.getsizeof(namespace)
+    count = 0
+    pending = list(namespace.values())
+    getsizeof = sys.getsizeof
+    while pending and count < MAX_OBJECTS:
+        obj = pending.pop()
+        key = id(obj)
+        if key in seen or key in stop:
+            continue
+        if (isinstance(obj, OWNED_TYPES) and
+                getattr(obj, '__module__', name) != name):
+            continue
+        seen.add(key)
+        size += getsizeof(obj, 0)
+        count += 1
+        pending.extend(gc.get_referents(obj))
+        op.checkpoint()
+    return size, count
+
+
+def importtime_log(op):
+    """Parse ``-X importtime`` output if stderr was redirected to a file,
+    which can be long as it is the target's whole stderr"""
+    enabled = ('importtime' in getattr(sys, '_xoptions', {}) or
+               os.environ.get('PYTHONPROFILEIMPORTTIME'))
+    times = {}
+    if not enabled:
+        return times
+    try:
+        path = os.readlink('/proc/self/fd/2')
+    except OSError:
+        return times
+    if not os.path.isfile(path):
+        return times
+    with open(path) as log:
+        for line in log:
+            op.checkpoint()
+            if not line.startswith('import time:'):
+                continue
+            fields = line[len('import time:'):].split('|')
+            try:
+                own, cumulative = int(fields[0]), int(fields[1])
+            except (ValueError, IndexError):
+                continue  # the header
+            times[fields[2].strip()] = [own / 1e6, cumulative / 1e6]
+    return times
+
+
+def wrap_find_and_load(original):
+    def _find_and_load(name, *args, **kw):
+        stack = import_stacks.setdefault(get_ident(), [])
+        stack.append(0.0)
+        start = clock()
+        try:
+            return original(name, *args, **kw)
+        finally:
+            elapsed = clock() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            with lock:
+                entry = import_times.setdefault(name, [0.0, 0.0])
+                entry[0] += elapsed - nested
+                entry[1] += elapsed
+    return _find_and_load
+
+
+def record_imports():
+    """Time every import from now on, returning whether that is possible"""
+    # The import statement calls _find_and_load on the frozen copy
+    bootstrap = (sys.modules.get('_frozen_importlib') or
+                 sys.modules.get('importlib._bootstrap'))
+    if bootstrap is None or patches.applied:
+        return bool(patches.applied)
+    return patches.patch(bootstrap, '_find_and_load', wrap_find_and_load)
+
+
+def stop_recording():
+    patches.restore()
+
+
+def summary(**budget):
+    """
+    Returns a list of [name, file, disk size, globals size, globals count,
+    import self seconds, import cumulative seconds] for every module.
+    """
+    op = governor.begin('modules', **budget)
+    modules = sorted((name, module) for name, module in
+                     list(sys.modules.items())
+                     if isinstance(module, types.ModuleType))
+    stop = set()
+    for name, module in modules:
+        stop.add(id(module))
+        stop.add(id(vars(module)))
+    seen = set()
+    result = []
+    try:
+        times = importtime_log(op)
+        with lock:
+            times.update(import_times)
+        for name, module in modules:
+            size, count = globals_size(name, module, seen, stop, op)
+            own, cumulative = times.get(name, (None, None))
+            result.append([name, getattr(module, '__file__', None),
+                           disk_size(module), size, count, own, cumulative])
+    except governor.BudgetExceeded:
+        pass
+    finally:
+        op.finish()
+    return dict(modules=result, recording=bool(patches.applied),
+                aborted=op.aborted)
@@ -0,0 +1,103 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+"""
+Hints at what owns an object: the modules, classes, instances or
+attributes that refer to it, found by walking the garbage collector's
+objects.  Objects are identified by id so the search itself holds no
+references to them.
+"""
+
+import gc
+import sys
+import types
+
+MAX_HINTS = 3
+MAX_HOPS = 3  # anonymous containers looked through to find an owner
+MAX_KEY = 40
+ANONYMOUS = (dict, list, tuple, set, frozenset)
+
+
+def describe(obj):
+    if isinstance(obj, types.ModuleType):
+        return 'module %s' % obj.__name__
+    if isinstance(obj, type):
+        return 'class %s.%s' % (obj.__module__, obj.__name__)
+    if isinstance(obj, types.FrameType):
+        return 'frame of %s' % obj.f_code.co_name
+    if isinstance(obj, types.FunctionType):
+        return 'function %s' % obj.__name__
+    kind = type(obj)
+    if kind.__module__ in ('builtins', '__builtin__'):
+        return kind.__name__
+    return '%s.%s instance' % (kind.__module__, kind.__name__)
+
+
+def step(container, ref):
+    """How `ref` is reached from inside an anonymous container"""
+    if type(container) is dict:
+        for key, value in container.items():
+            if value is ref:
+                if isinstance(key, str):
+                    return '.' + key[:MAX_KEY]
+                return '[%s]' % repr(key)[:MAX_KEY]
+    return '[]'
+
+
+def owners(wanted, op, limit=MAX_HINTS, hops=MAX_HOPS):
+    """
+    Return {id: [hint]} for the ids in `wanted`.  Objects held in dicts,
+    lists, tuples and sets are described through whatever owns those, e.g.
+    ``module json.decoder.scanner`` or ``app.Cache instance.entries[]``.
+    """
+    hints = dict((key, []) for key in wanted)
+    pending = dict((key, [(key, '')]) for key in wanted)
+    me = sys._getframe()
+    for hop in range(hops):
+        found = {}  # id of an anonymous container -> [(wanted id, path)]
+        for obj in gc.get_objects():
+            if obj is me:
+                continue
+            op.checkpoint()
+            more = hop < hops - 1
+            anonymous = type(obj) in ANONYMOUS and more
+            # Every function refers to its module's globals
+            globals_only = isinstance(obj, types.FunctionType) and hop
+            for ref in gc.get_referents(obj):
+                if type(ref) is dict and more and not gc.is_tracked(ref):
+                    # Dicts of atomic values are not tracked, so search
+                    # them from whatever refers to them
+                    for inner in gc.get_referents(ref):
+                        for key, path in pending.get(id(inner), ()):
+                            paths = found.setdefault(id(ref), [])
+                            path = step(ref, inner) + path
+                            if (key, path) not in paths:
+                                paths.append((key, path))
+                for key, path in pending.get(id(ref), ()):
+                    if len(hints[key]) >= limit or globals_only:
+                        continue
+                    if anonymous:
+                        found.setdefault(id(obj), []).append(
+                            (key, step(obj, ref) + path))
+                    else:
+                        hint = describe(obj) + path
+                        if hint not in hints[key]:
+                            hints[key].append(hint)
+        if not found:
+            break
+        pending = found
+    return hints
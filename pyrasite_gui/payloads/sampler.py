@@ -0,0 +1,67 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+"""
+A sampling profiler that records every other thread's stack as folded
+stacks, see pyrasite_gui/profiles.py for the format.
+"""
+
+import sys
+import time
+
+try:
+    from threading import get_ident
+except ImportError:  # Python 2
+    from thread import get_ident
+
+governor = sys.modules['_pyrasite_gui_governor']
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return '%s (%s:%d)' % (code.co_name, code.co_filename,
+                           code.co_firstlineno)
+
+
+def sample(duration=1.0, interval=0.005, **budget):
+    """Sample all other threads for `duration` seconds"""
+    op = governor.begin('sample', **budget)
+    me = get_ident()
+    stacks = {}
+    samples = 0
+    end = time.time() + duration
+    try:
+        while time.time() < end:
+            for ident, frame in sys._current_frames().items():
+                if ident == me or ident in governor.service_threads:
+                    continue
+                names = []
+                while frame is not None:
+                    names.append(frame_name(frame))
+                    frame = frame.f_back
+                names.reverse()
+                folded = ';'.join(names)
+                stacks[folded] = stacks.get(folded, 0) + 1
+            samples += 1
+            op.checkpoint()
+            time.sleep(interval)
+    except governor.BudgetExceeded:
+        pass
+    finally:
+        op.finish()
+    return dict(samples=samples, interval=interval, stacks=stacks,
+                aborted=op.aborted)
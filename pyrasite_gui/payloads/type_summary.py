@@ -0,0 +1,47 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+"""
+A cheap in-target object summary: count and shallow size per type of every
+object the garbage collector tracks.  Atomic objects such as str and int
+are only counted when they are not tracked, so this is a lower bound.
+"""
+
+import gc
+import sys
+
+governor = sys.modules['_pyrasite_gui_governor']
+
+
+def summary(**budget):
+    op = governor.begin('type_summary', **budget)
+    types = {}
+    getsizeof = sys.getsizeof
+    try:
+        for obj in gc.get_objects():
+            kind = type(obj).__name__
+            entry = types.get(kind)
+            if entry is None:
+                entry = types[kind] = [0, 0]
+            entry[0] += 1
+            entry[1] += getsizeof(obj, 0)
+            op.checkpoint()
+    except governor.BudgetExceeded:
+        pass
+    finally:
+        op.finish()
+    return types
@@ -0,0 +1,181 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+"""
+Sampled profiles as folded stacks.
+
+A profile is a dict with the number of `samples` taken and a `stacks` dict
+mapping a folded stack (frames from the outermost inwards, joined with
+``;``) to the number of times it was seen.
+"""
+
+from __future__ import division
+
+
+def merge(profiles):
+    """Sum a sequence of profiles into one"""
+    stacks = {}
+    samples = 0
+    for profile in profiles:
+        samples += profile['samples']
+        for stack, count in profile['stacks'].items():
+            stacks[stack] = stacks.get(stack, 0) + count
+    return dict(samples=samples, stacks=stacks)
+
+
+class Node(object):
+    """A frame in a call tree, with inclusive and exclusive sample counts"""
+
+    def __init__(self, name):
+        self.name = name
+        self.total = 0
+        self.self = 0
+        self.children = {}
+
+    def child(self, name):
+        node = self.children.get(name)
+        if node is None:
+            node = self.children[name] = Node(name)
+        return node
+
+    def sorted_children(self):
+        return sorted(self.children.values(), key=lambda node: -node.total)
+
+
+def call_tree(profile):
+    """Fold a profile's stacks into a tree of :class:`Node`"""
+    root = Node('all')
+    for stack, count in profile['stacks'].items():
+        node = root
+        node.total += count
+        for frame in stack.split(';'):
+            node = node.child(frame)
+            node.total += count
+        node.self += count
+    return root
+
+
+def to_dot(profile, min_fraction=0.005):
+    """
+    Render a profile as a graphviz call graph, one node per function and
+    one edge per caller/callee pair, dropping anything seen in fewer than
+    `min_fraction` of the samples.
+    """
+    totals = {}
+    edges = {}
+    for stack, count in profile['stacks'].items():
+        frames = stack.split(';')
+        for frame in set(frames):
+            totals[frame] = totals.get(frame, 0) + count
+        for edge in set(zip(frames, frames[1:])):
+            edges[edge] = edges.get(edge, 0) + count
+    threshold = max(sum(profile['stacks'].values()), 1) * min_fraction
+    peak = max(list(totals.values()) + [1])
+    ids = {}
+    lines = ['digraph profile {',
+             '    node [shape=box, style=filled, fontname=sans, fontsize=10];']
+    for frame, total in sorted(totals.items(), key=lambda item: -item[1]):
+        if total < threshold:
+            continue
+        ids[frame] = 'n%d' % len(ids)
+        lines.append('    %s [label="%s\\n%d samples", fillcolor="0.0 %0.2f '
+                     '1.0"];' % (ids[frame], frame.replace('"', '\\"'),
+                                 total, total / peak))
+    for (caller, callee), count in sorted(edges.items()):
+        if count >= threshold and caller in ids and callee in ids:
+            lines.append('    %s -> %s [label="%d"];' % (ids[caller],
+                                                          ids[callee], count))
+    lines.append('}')
+    return '\n'.join(lines)
+
+
+def function_totals(profile):
+    """
+    Return {frame: [self, total]} sample counts.  A frame is counted once
+    per stack towards its total, however often it recurses.
+    """
+    totals = {}
+    for stack, count in profile['stacks'].items():
+        frames = stack.split(';')
+        for frame in set(frames):
+            entry = totals.get(frame)
+            if entry is None:
+                entry = totals[frame] = [0, 0]
+            entry[1] += count
+        totals[frames[-1]][0] += count
+    return totals
+
+
+def diff(before, after):
+    """
+    Compare two profiles function by function, normalised by the number of
+    stacks each one sampled.  Returns (frame, self before, self after,
+    total before, total after) tuples of fractions, largest change in total
+    first.
+    """
+    old = function_totals(before)
+    new = function_totals(after)
+    old_samples = max(sum(before['stacks'].values()), 1)
+    new_samples = max(sum(after['stacks'].values()), 1)
+    rows = []
+    for frame in set(old) | set(new):
+        old_self, old_total = old.get(frame, (0, 0))
+        new_self, new_total = new.get(frame, (0, 0))
+        rows.append((frame, old_self / old_samples, new_self / new_samples,
+                     old_total / old_samples, new_total / new_samples))
+    return sorted(rows, key=lambda row: (-abs(row[4] - row[3]),
+                                         -abs(row[2] - row[1]), row[0]))
+
+
+def diff_to_dot(before, after, min_fraction=0.005):
+    """
+    Render the call graph of `after` with each function coloured by how its
+    share of the samples changed since `before`: red for more, blue for
+    less.  Functions that disappeared are drawn dashed.
+    """
+    changes = dict((row[0], row) for row in diff(before, after))
+    edges = {}
+    for profile, weight in ((before, 0), (after, 1)):
+        samples = max(sum(profile['stacks'].values()), 1)
+        for stack, count in profile['stacks'].items():
+            frames = stack.split(';')
+            for edge in set(zip(frames, frames[1:])):
+                shares = edges.setdefault(edge, [0.0, 0.0])
+                shares[weight] += count / samples
+    peak = max([abs(row[4] - row[3]) for row in changes.values()] + [1e-9])
+    ids = {}
+    lines = ['digraph diff {',
+             '    node [shape=box, style=filled, fontname=sans, fontsize=10];']
+    for frame, old_self, new_self, old_total, new_total in sorted(
+            changes.values(), key=lambda row: -max(row[3], row[4])):
+        if max(old_total, new_total) < min_fraction:
+            continue
+        ids[frame] = 'n%d' % len(ids)
+        delta = new_total - old_total
+        hue = 0.0 if delta >= 0 else 0.6
+        style = '' if new_total else ', style="filled,dashed"'
+        lines.append('    %s [label="%s\\n%0.1f%% -> %0.1f%% (%+0.1f)", '
+                     'fillcolor="%0.1f %0.2f 1.0"%s];' % (
+                         ids[frame], frame.replace('"', '\\"'),
+                         100 * old_total, 100 * new_total, 100 * delta, hue,
+                         abs(delta) / peak, style))
+    for (caller, callee), (old, new) in sorted(edges.items()):
+        if max(old, new) >= min_fraction and caller in ids and callee in ids:
+            lines.append('    %s -> %s [label="%+0.1f%%"];' % (
+                ids[caller], ids[callee], 100 * (new - old)))
+    lines.append('}')
+    return '\n'.join(lines)
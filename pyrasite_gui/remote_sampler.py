@@ -0,0 +1,408 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+
+"""
+Sample the Python stacks of another process without running any code in it.
+
+The target's memory is read with ``process_vm_readv(2)``, starting from the
+`_PyRuntime` symbol of the python binary or libpython it has mapped, and
+following the interpreter, thread state and frame structures from there.
+Those structures are private to CPython and change between minor releases,
+so only the versions in :data:`OFFSETS` are supported.  Reading another
+process needs the same ptrace permission as injecting into it.
+"""
+
+from __future__ import division
+
+import os
+import sys
+import time
+import errno
+import struct
+import ctypes
+import logging
+
+log = logging.getLogger('pyrasite')
+
+MAX_THREADS = 1000
+MAX_DEPTH = 256
+
+# Structure offsets for 64-bit builds, by (major, minor) version.  Where the
+# current frame is reached through a _PyCFrame, `cframe` is its offset in
+# the thread state and `current_frame` the offset within the _PyCFrame.
+OFFSETS = {
+    (3, 11): dict(interpreters_head=40, threads_head=16, next=8,
+                  native_thread_id=160, cframe=56, current_frame=8,
+                  frame_code=32, frame_previous=48, frame_instr=56,
+                  frame_owner=None, co_filename=112, co_name=120,
+                  co_linetable=136, co_firstlineno=72, co_code=184,
+                  ascii_data=48, compact_data=72),
+    (3, 12): dict(interpreters_head=40, threads_head=72, next=8,
+                  native_thread_id=144, cframe=56, current_frame=0,
+                  frame_code=0, frame_previous=8, frame_instr=56,
+                  frame_owner=70, co_filename=112, co_name=120,
+                  co_linetable=136, co_firstlineno=68, co_code=192,
+                  ascii_data=40, compact_data=56),
+    (3, 13): dict(interpreters_head=632, threads_head=7344, next=8,
+                  native_thread_id=160, cframe=None, current_frame=72,
+                  frame_code=0, frame_previous=8, frame_instr=56,
+                  frame_owner=70, co_filename=112, co_name=120,
+                  co_linetable=136, co_firstlineno=68, co_code=200,
+                  ascii_data=40, compact_data=56),
+}
+
+# Common to every supported version
+FRAME_OWNED_BY_CSTACK = 3
+UNICODE_LENGTH = 16
+UNICODE_STATE = 32
+BYTES_SIZE = 16
+BYTES_DATA = 32
+
+
+class SamplerError(Exception):
+    pass
+
+
+class _iovec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+
+_libc = None
+
+
+def process_vm_readv():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(None, use_errno=True)
+        if not hasattr(_libc, 'process_vm_readv'):
+            raise SamplerError('process_vm_readv is not available')
+        _libc.process_vm_readv.restype = ctypes.c_ssize_t
+    return _libc.process_vm_readv
+
+
+class ProcessMemory(object):
+    """Reads another process's memory"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.readv = process_vm_readv()
+
+    def read(self, address, size):
+        buf = ctypes.create_string_buffer(size)
+        local = _iovec(ctypes.cast(buf, ctypes.c_void_p), size)
+        remote = _iovec(address, size)
+        got = self.readv(self.pid, ctypes.byref(local), 1,
+                         ctypes.byref(remote), 1, 0)
+        if got != size:
+            error = ctypes.get_errno()
+            if error in (errno.EPERM, errno.ESRCH):
+                raise SamplerError('Cannot read process %d: %s' % (
+                    self.pid, os.strerror(error)))
+            raise SamplerError('Bad read of %d bytes at 0x%x' % (size,
+                                                                 address))
+        return buf.raw
+
+    def word(self, address):
+        return struct.unpack('<Q', self.read(address, 8))[0]
+
+    def int32(self, address):
+        return struct.unpack('<i', self.read(address, 4))[0]
+
+
+##
+## Symbols
+##
+
+def elf_symbols(path, names):
+    """Return ({name: value}, lowest PT_LOAD address) from an ELF file"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] != b'\x7fELF' or data[4:5] != b'\x02':
+        raise SamplerError('%s is not a 64-bit ELF file' % path)
+    (phoff, shoff) = struct.unpack_from('<QQ', data, 32)
+    (phentsize, phnum, shentsize, shnum) = struct.unpack_from('<HHHH',
+                                                              data, 54)
+    loads = []
+    for i in range(phnum):
+        p_type, _, _, p_vaddr = struct.unpack_from(
+            '<IIQQ', data, phoff + i * phentsize)
+        if p_type == 1:  # PT_LOAD
+            loads.append(p_vaddr)
+    sections = [struct.unpack_from('<IIQQQQIIQQ', data, shoff + i * shentsize)
+                for i in range(shnum)]
+    found = {}
+    wanted = set(name.encode('ascii') for name in names)
+    for (_, sh_type, _, _, offset, size, link, _, _,
+         entsize) in sections:
+        if sh_type not in (2, 11):  # SHT_SYMTAB, SHT_DYNSYM
+            continue
+        strtab = sections[link][4]
+        for j in range(offset, offset + size, entsize):
+            st_name, _, _, _, st_value, _ = struct.unpack_from(
+                '<IBBHQQ', data, j)
+            if not st_value:
+                continue
+            end = data.index(b'\0', strtab + st_name)
+            name = data[strtab + st_name:end]
+            if name in wanted:
+                found[name.decode('ascii')] = st_value
+    return found, min(loads) & ~0xfff if loads else 0
+
+
+def find_symbols(pid, names):
+    """Find the run-time addresses of symbols in the target's libpython or
+    python binary"""
+    mapped = {}
+    with open('/proc/%d/maps' % pid) as maps:
+        for line in maps:
+            parts = line.split()
+            if len(parts) < 6 or 'python' not in os.path.basename(parts[5]):
+                continue
+            start = int(parts[0].split('-')[0], 16)
+            path = parts[5]
+            mapped[path] = min(mapped.get(path, start), start)
+    # libpython first, it has the interpreter when python is linked to it
+    for path in sorted(mapped, key=lambda path: 'libpython' not in path):
+        local = '/proc/%d/root%s' % (pid, path)
+        try:
+            symbols, first = elf_symbols(os.path.exists(local) and local
+                                         or path, names)
+        except (IOError, SamplerError) as e:
+            log.debug('Skipping %s: %s' % (path, e))
+            continue
+        if names[0] in symbols:
+            return dict((name, mapped[path] + value - first)
+                        for name, value in symbols.items())
+    raise SamplerError('No Python runtime found in process %d' % pid)
+
+
+##
+## Code objects
+##
+
+def varint(table, i):
+    b = table[i]
+    i += 1
+    value = b & 63
+    shift = 0
+    while b & 64:
+        b = table[i]
+        i += 1
+        shift += 6
+        value |= (b & 63) << shift
+    return value, i
+
+
+def signed_varint(table, i):
+    value, i = varint(table, i)
+    if value & 1:
+        return -(value >> 1), i
+    return value >> 1, i
+
+
+def addr2line(firstlineno, table, lasti):
+    """Find the line of code unit `lasti` in a 3.11+ location table"""
+    line = firstlineno
+    addr = 0
+    i = 0
+    while i < len(table):
+        first = table[i]
+        i += 1
+        code = (first >> 3) & 15
+        length = (first & 7) + 1
+        delta = 0
+        if code == 14:
+            delta, i = signed_varint(table, i)
+            for field in range(3):
+                _, i = varint(table, i)
+        elif code == 13:
+            delta, i = signed_varint(table, i)
+        elif code >= 10:
+            delta = code - 10
+            i += 2
+        elif code < 10:
+            i += 1
+        line += delta
+        if addr <= lasti < addr + length:
+            return code != 15 and line or None
+        addr += length
+    return None
+
+
+class CodeInfo(object):
+    __slots__ = ('filename', 'name', 'firstlineno', 'linetable', 'code')
+
+    def __init__(self, filename, name, firstlineno, linetable, code):
+        self.filename = filename
+        self.name = name
+        self.firstlineno = firstlineno
+        self.linetable = linetable
+        self.code = code  # address of the first code unit
+
+    def line(self, instr):
+        lasti = (instr - self.code) // 2
+        if lasti < 0:
+            return self.firstlineno
+        return addr2line(self.firstlineno, self.linetable,
+                         lasti) or self.firstlineno
+
+
+##
+## Sampling
+##
+
+class RemoteSampler(object):
+    """Reads the Python stacks of every thread in process `pid`"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.memory = ProcessMemory(pid)
+        symbols = find_symbols(pid, ['_PyRuntime', 'Py_Version'])
+        if 'Py_Version' not in symbols:
+            raise SamplerError('Python older than 3.11 is not supported')
+        version = self.memory.word(symbols['Py_Version'])
+        self.version = (version >> 24, (version >> 16) & 0xff)
+        self.offsets = OFFSETS.get(self.version)
+        if self.offsets is None:
+            raise SamplerError('Python %d.%d is not supported' %
+                               self.version)
+        self.runtime = symbols['_PyRuntime']
+        self.codes = {}  # code object address -> CodeInfo
+
+    def read_str(self, address):
+        read = self.memory.read
+        length = self.memory.word(address + UNICODE_LENGTH)
+        state = struct.unpack('<I', read(address + UNICODE_STATE, 4))[0]
+        kind = (state >> 2) & 7
+        if (state >> 6) & 1:  # ascii
+            return read(address + self.offsets['ascii_data'],
+                        length).decode('ascii')
+        data = read(address + self.offsets['compact_data'], length * kind)
+        return data.decode({1: 'latin-1', 2: 'utf-16-le',
+                            4: 'utf-32-le'}[kind])
+
+    def read_bytes(self, address):
+        size = self.memory.word(address + BYTES_SIZE)
+        return bytearray(self.memory.read(address + BYTES_DATA, size))
+
+    def code_info(self, address):
+        info = self.codes.get(address)
+        if info is None:
+            o = self.offsets
+            word = self.memory.word
+            info = self.codes[address] = CodeInfo(
+                self.read_str(word(address + o['co_filename'])),
+                self.read_str(word(address + o['co_name'])),
+                self.memory.int32(address + o['co_firstlineno']),
+                self.read_bytes(word(address + o['co_linetable'])),
+                address + o['co_code'])
+        return info
+
+    def thread_states(self):
+        word = self.memory.word
+        o = self.offsets
+        interp = word(self.runtime + o['interpreters_head'])
+        tstate = word(interp + o['threads_head'])
+        count = 0
+        while tstate and count < MAX_THREADS:
+            yield tstate
+            tstate = word(tstate + o['next'])
+            count += 1
+
+    def current_frame(self, tstate):
+        o = self.offsets
+        if o['cframe'] is None:
+            return self.memory.word(tstate + o['current_frame'])
+        cframe = self.memory.word(tstate + o['cframe'])
+        return cframe and self.memory.word(cframe + o['current_frame'])
+
+    def stack(self, tstate):
+        """Return (filename, name, first line, line) tuples, innermost
+        first"""
+        o = self.offsets
+        frames = []
+        frame = self.current_frame(tstate)
+        while frame and len(frames) < MAX_DEPTH:
+            header = self.memory.read(frame, 72)
+            code = struct.unpack_from('<Q', header, o['frame_code'])[0]
+            previous = struct.unpack_from('<Q', header,
+                                          o['frame_previous'])[0]
+            instr = struct.unpack_from('<Q', header, o['frame_instr'])[0]
+            if o['frame_owner'] is not None and bytearray(header)[
+                    o['frame_owner']] == FRAME_OWNED_BY_CSTACK:
+                code = 0  # the entry shim between C and Python code
+            if code:
+                try:
+                    info = self.code_info(code)
+                except (SamplerError, KeyError, UnicodeDecodeError):
+                    info = None  # a shim frame or one being torn down
+                if info is not None:
+                    frames.append((info.filename, info.name,
+                                   info.firstlineno, info.line(instr)))
+            frame = previous
+        return frames
+
+    def sample(self):
+        """Return {native thread id: stack} for every thread"""
+        stacks = {}
+        o = self.offsets
+        for tstate in self.thread_states():
+            native = self.memory.word(tstate + o['native_thread_id'])
+            try:
+                stacks[native] = self.stack(tstate)
+            except SamplerError as e:
+                # The thread moved on while we were reading it
+                log.debug('Torn read of thread %d: %s' % (native, e))
+        return stacks
+
+
+def format_stacks(stacks):
+    """Render a sample like pyrasite's dump_stacks payload does"""
+    lines = []
+    for native, frames in sorted(stacks.items()):
+        lines.append('Thread %d' % native)
+        for filename, name, first, line in reversed(frames):
+            lines.append('  File "%s", line %d, in %s' % (filename, line,
+                                                          name))
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def profile(pid, duration=1.0, interval=0.005, sampler=None):
+    """Sample `pid` for `duration` seconds into a folded-stack profile named
+    like the in-process sampler payload's, see pyrasite_gui/profiles.py"""
+    sampler = sampler or RemoteSampler(pid)
+    stacks = {}
+    samples = 0
+    end = time.time() + duration
+    while time.time() < end:
+        started = time.time()
+        for frames in sampler.sample().values():
+            if not frames:
+                continue
+            folded = ';'.join('%s (%s:%d)' % (name, filename, first)
+                              for filename, name, first, line
+                              in reversed(frames))
+            stacks[folded] = stacks.get(folded, 0) + 1
+        samples += 1
+        time.sleep(max(interval - (time.time() - started), 0))
+    return dict(samples=samples, interval=interval, stacks=stacks)
+
+
+if __name__ == '__main__':
+    print(format_stacks(RemoteSampler(int(sys.argv[1])).sample()))
@@ -0,0 +1,170 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+"""
+Lightweight timing spans for instrumenting pyrasite-gui itself.
+
+Spans are aggregated into per-name histograms with power-of-two microsecond
+buckets.  While disabled, a span is a single attribute check.
+"""
+
+from __future__ import division
+
+import json
+import time
+import threading
+from functools import wraps
+
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class Histogram(object):
+    """Count, total, extremes and log2 buckets of a series of durations"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.buckets = {}  # bucket -> count; bucket b holds < 2**b usecs
+
+    @classmethod
+    def from_stats(cls, count, total, max, buckets):
+        """Rebuild a histogram from a payload's [count, total, max, buckets]"""
+        histogram = cls()
+        histogram.count = count
+        histogram.total = total
+        histogram.max = max
+        histogram.buckets = dict((int(b), n) for b, n in buckets.items())
+        return histogram
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        if self.min is None or elapsed < self.min:
+            self.min = elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        bucket = int(elapsed * 1e6).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or
+                                      other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+
+    def percentile(self, fraction):
+        """Return the upper bound, in seconds, of the given percentile"""
+        wanted = self.count * fraction
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= wanted:
+                return (1 << bucket) / 1e6
+        return self.max
+
+    def to_dict(self):
+        return dict(count=self.count, total=self.total, min=self.min,
+                    max=self.max, mean=self.count and self.total / self.count,
+                    p50=self.percentile(0.5), p99=self.percentile(0.99),
+                    buckets=dict(('<%dus' % (1 << b), n)
+                                 for b, n in sorted(self.buckets.items())))
+
+
+class _NullSpan(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = clock()
+        return self
+
+    def __exit__(self, *exc):
+        self.timings.record(self.name, clock() - self.start)
+        return False
+
+
+class Timings(object):
+    """A thread-safe registry of named histograms"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def span(self, name):
+        """Return a context manager that times its body"""
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name)
+
+    def record(self, name, elapsed):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(elapsed)
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+
+    def snapshot(self):
+        with self.lock:
+            return dict((name, histogram.to_dict())
+                        for name, histogram in self.histograms.items())
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2, sort_keys=True)
+
+
+timings = Timings()
+
+
+def timed(name):
+    """Decorate a function so each call is recorded as a span"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kw):
+            if not timings.enabled:
+                return func(*args, **kw)
+            start = clock()
+            try:
+                return func(*args, **kw)
+            finally:
+                timings.record(name, clock() - start)
+        return wrapper
+    return decorator
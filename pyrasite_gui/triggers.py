@@ -0,0 +1,126 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+"""
+Threshold triggers over the resource metrics the GUI polls.
+
+:class:`MetricHistory` keeps the last few minutes of samples in a ring
+buffer, a :class:`Trigger` fires when one metric has stayed over its
+threshold for long enough, and a :class:`RateLimiter` bounds how often the
+captures they start may run.
+"""
+
+from __future__ import division
+
+import time
+from collections import deque
+
+HISTORY = 600  # seconds of metrics kept before a trigger fires
+
+# (name, description, unit); rss_growth is derived from rss samples
+METRICS = (('cpu', 'CPU % sustained above', '%'),
+           ('rss_growth', 'RSS growing faster than', 'kB/s'),
+           ('threads', 'Thread count above', ''),
+           ('connections', 'Connection count above', ''))
+
+
+class MetricHistory(object):
+    """A ring buffer of (time, {metric: value}) samples"""
+
+    def __init__(self, seconds=HISTORY, interval=1.0):
+        self.samples = deque(maxlen=int(seconds / interval) + 1)
+
+    def add(self, when=None, **metrics):
+        if when is None:
+            when = time.time()
+        self.samples.append((when, metrics))
+
+    def clear(self):
+        self.samples.clear()
+
+    def since(self, start):
+        return [sample for sample in self.samples if sample[0] >= start]
+
+    def to_list(self):
+        return list(self.samples)
+
+
+class Trigger(object):
+    """Fires when `metric` stays above `threshold` for `duration` seconds"""
+
+    def __init__(self, metric, threshold, duration):
+        self.metric = metric
+        self.threshold = threshold
+        self.duration = duration
+
+    def value(self, history, now=None):
+        """Return the metric's lowest value over the trigger's window, or
+        None when the history does not cover the window yet"""
+        if now is None:
+            now = time.time()
+        samples = history.samples
+        if not samples or now - samples[0][0] < self.duration:
+            return None
+        window = history.since(now - self.duration)
+        if self.metric == 'rss_growth':
+            rss = [(when, metrics['rss']) for when, metrics in window
+                   if 'rss' in metrics]
+            if len(rss) < 2 or rss[-1][0] <= rss[0][0]:
+                return None
+            return ((rss[-1][1] - rss[0][1]) / (rss[-1][0] - rss[0][0]) /
+                    1024)
+        values = [metrics[self.metric] for when, metrics in window
+                  if self.metric in metrics]
+        if not values:
+            return None
+        return min(values)
+
+    def fired(self, history, now=None):
+        value = self.value(history, now)
+        return value is not None and value > self.threshold
+
+    def describe(self, value=None):
+        for name, description, unit in METRICS:
+            if name == self.metric:
+                text = '%s %s%s for %ds' % (description, self.threshold,
+                                            unit, self.duration)
+                if value is not None:
+                    text += ' (%0.1f%s)' % (value, unit)
+                return text
+        return self.metric
+
+
+class RateLimiter(object):
+    """Allows an action at most once per `interval` seconds and `limit`
+    times per hour"""
+
+    def __init__(self, interval=300.0, limit=4):
+        self.interval = interval
+        self.limit = limit
+        self.times = deque()
+
+    def allow(self, now=None):
+        if now is None:
+            now = time.time()
+        while self.times and now - self.times[0] > 3600:
+            self.times.popleft()
+        if self.times and now - self.times[-1] < self.interval:
+            return False
+        if len(self.times) >= self.limit:
+            return False
+        self.times.append(now)
+        return True
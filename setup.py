@@ -15,7 +15,8 @@ setup(name='pyrasite-gui',
       author_email='lmacken@redhat.com',
       url='http://pyrasite.com',
       license='GPLv3',
-      packages=find_packages(exclude=['ez_setup', 'examples', 'tests']),
+      packages=find_packages(exclude=['ez_setup', 'examples', 'tests',
+                                      'benchmarks']),
       include_package_data=True,
       zip_safe=False,
       install_requires=[
@@ -29,6 +30,7 @@ setup(name='pyrasite-gui',
       entry_points="""
       [console_scripts]
       pyrasite-gui = pyrasite_gui.gui:main
+      pyrasite-agent = pyrasite_gui.agent:main
       """,
       classifiers=[
           'Development Status :: 4 - Beta',
@@ -0,0 +1,133 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+import socket
+import threading
+import unittest
+import zlib
+
+from pyrasite_gui import agent
+
+
+class FakeTarget(object):
+    """Stands in for a TargetProcess that is already connected"""
+
+    def __init__(self, fail=False):
+        self.sock = object()
+        self.fail = fail
+        self.closed = False
+
+    def dump_stacks(self):
+        if self.fail:
+            raise socket.timeout('timed out')
+        return 'Thread 0x1\n  File "a.py", line 1, in f\n\n'
+
+    def close(self):
+        self.closed = True
+
+
+class TestFraming(unittest.TestCase):
+
+    def setUp(self):
+        self.left, self.right = socket.socketpair()
+
+    def tearDown(self):
+        self.left.close()
+        self.right.close()
+
+    def test_round_trip(self):
+        message = dict(id=1, op='profile', args=dict(pids=[1, 2]),
+                       text=u'caf\xe9')
+        agent.send_frame(self.left, message)
+        agent.send_frame(self.left, dict(id=2))
+        self.assertEqual(agent.recv_frame(self.right), message)
+        self.assertEqual(agent.recv_frame(self.right), dict(id=2))
+
+    def test_large_frame(self):
+        # bigger than a single recv() returns
+        message = dict(stacks=[str(i) * 10 for i in range(50000)])
+        thread = threading.Thread(target=agent.send_frame,
+                                  args=(self.left, message))
+        thread.start()
+        self.assertEqual(agent.recv_frame(self.right), message)
+        thread.join()
+
+    def test_too_large(self):
+        self.left.sendall(agent.HEADER.pack(agent.MAX_FRAME + 1))
+        self.assertRaises(agent.AgentError, agent.recv_frame, self.right)
+
+    def test_closed(self):
+        data = zlib.compress(b'{}')
+        self.left.sendall(agent.HEADER.pack(len(data)) + data[:-1])
+        self.left.close()
+        self.assertRaises(EOFError, agent.recv_frame, self.right)
+
+    def test_parse_address(self):
+        self.assertEqual(agent.parse_address('tcp:example.com:1234'),
+                         (socket.AF_INET, ('example.com', 1234)))
+        self.assertEqual(agent.parse_address('example.com:1234'),
+                         (socket.AF_INET, ('example.com', 1234)))
+        self.assertEqual(agent.parse_address('example.com'),
+                         (socket.AF_INET, ('example.com',
+                                           agent.DEFAULT_PORT)))
+        self.assertEqual(agent.parse_address('unix:/run/agent.sock'),
+                         (socket.AF_UNIX, '/run/agent.sock'))
+
+
+class TestAgent(unittest.TestCase):
+
+    def setUp(self):
+        self.agent = agent.Agent()
+        self.good, self.bad = FakeTarget(), FakeTarget(fail=True)
+        self.agent.targets[1] = (self.good, threading.Lock())
+        self.agent.targets[2] = (self.bad, threading.Lock())
+
+    def test_stacks(self):
+        result = self.agent.op_stacks([1, 2])
+        self.assertEqual(len(result['stacks']), 1)
+        self.assertEqual(result['stacks'][0][2], [1])
+        self.assertEqual(list(result['errors']), [2])
+
+    def test_drop_failed(self):
+        self.agent.op_stacks([1, 2])
+        self.assertEqual(list(self.agent.targets), [1])
+        self.assertTrue(self.bad.closed)
+        self.assertFalse(self.good.closed)
+
+    def test_unknown(self):
+        self.assertRaises(agent.AgentError, self.agent.handle,
+                          dict(op='rm_rf'))
+
+    def test_serve(self):
+        server = agent.serve('tcp:127.0.0.1:0', self.agent)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            client = agent.AgentClient('tcp:127.0.0.1:%d' %
+                                       server.server_address[1], timeout=5)
+            result = client.request('stacks', pids=[1])
+            self.assertEqual(result['stacks'][0][1], 1)
+            self.assertRaises(agent.AgentError, client.request, 'rm_rf')
+            client.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyrasite_gui import captures
+
+
+class TestCaptures(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def save(self, kind, pid, created, **kw):
+        return captures.save(kind, dict(kw, pid=pid, created=created),
+                             directory=self.directory)
+
+    def test_round_trip(self):
+        path = self.save('trigger', 42, 1000.5, title='worker',
+                         reason='CPU', stacks='Thread 0x1')
+        self.assertEqual(os.path.basename(path), 'trigger-42-1000500.json')
+        self.assertEqual(os.listdir(self.directory),
+                         ['trigger-42-1000500.json'])
+        capture = captures.load(path)
+        self.assertEqual(capture['kind'], 'trigger')
+        self.assertEqual(capture['stacks'], 'Thread 0x1')
+        self.assertTrue(captures.describe(capture).startswith(
+            'worker (42) '))
+        self.assertTrue(captures.describe(capture).endswith(': CPU'))
+
+    def test_paths(self):
+        self.save('trigger', 1, 10)
+        self.save('profile', 2, 20)
+        self.save('trigger', 3, 30)
+        for name in ('notes.txt', 'broken.json', 'trigger-x-y.json'):
+            open(os.path.join(self.directory, name), 'w').close()
+        names = [os.path.basename(path) for path in
+                 captures.paths(directory=self.directory)]
+        self.assertEqual(names, ['trigger-3-30000.json',
+                                 'profile-2-20000.json',
+                                 'trigger-1-10000.json'])
+        self.assertEqual(len(captures.paths('trigger', self.directory)), 2)
+        self.assertEqual(captures.paths(directory=os.path.join(
+            self.directory, 'missing')), [])
+
+    def test_unreadable(self):
+        good = self.save('profile', 1, 10)
+        with open(os.path.join(self.directory, 'profile-2-20000.json'),
+                  'w') as f:
+            f.write('{')
+        found = captures.captures('profile', self.directory)
+        self.assertEqual([path for path, capture in found], [good])
+
+    def test_prune(self):
+        for created in range(5):
+            captures.save('trigger', dict(pid=1, created=created),
+                          directory=self.directory, keep=3)
+        self.save('profile', 1, 0)
+        self.assertEqual(
+            [captures.load(path)['created'] for path in
+             captures.paths('trigger', self.directory)], [4, 3, 2])
+        self.assertEqual(len(captures.paths('profile', self.directory)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,254 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyrasite_gui import exporters
+from pyrasite_gui.heap import HeapGraph, DominatorTree
+
+PROFILE = dict(samples=6, interval=0.005, stacks={
+    'main (app.py:1);handle (app.py:10);parse (json.py:100)': 3,
+    'main (app.py:1);handle (app.py:10)': 2,
+    'main (app.py:1);main (app.py:1)': 1})
+
+
+def write(writer, *args, **kw):
+    out = io.StringIO()
+    writer(*(args + (out,)), **kw)
+    return out.getvalue()
+
+
+def read_varint(data, i):
+    value = shift = 0
+    while True:
+        byte = data[i]
+        i += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, i
+
+
+def read_message(data):
+    """Decode protobuf wire format into {field: [values]}, with
+    length-delimited values left as bytes"""
+    data = bytearray(data)
+    fields = {}
+    i = 0
+    while i < len(data):
+        key, i = read_varint(data, i)
+        if key & 7 == 0:
+            value, i = read_varint(data, i)
+        else:
+            size, i = read_varint(data, i)
+            value, i = bytes(data[i:i + size]), i + size
+        fields.setdefault(key >> 3, []).append(value)
+    return fields
+
+
+def read_varints(data):
+    data = bytearray(data)
+    values, i = [], 0
+    while i < len(data):
+        value, i = read_varint(data, i)
+        values.append(value)
+    return values
+
+
+class TestProfileFormats(unittest.TestCase):
+
+    def test_parse_frame(self):
+        self.assertEqual(exporters.parse_frame('f (my app/a.py:12)'),
+                         ('f', 'my app/a.py', 12))
+        self.assertEqual(exporters.parse_frame('<native>'),
+                         ('<native>', '', 0))
+
+    def test_folded(self):
+        lines = write(exporters.write_folded, PROFILE).splitlines()
+        self.assertEqual(sorted(lines), sorted(
+            '%s %d' % item for item in PROFILE['stacks'].items()))
+
+    def test_speedscope(self):
+        document = json.loads(write(exporters.write_speedscope, PROFILE,
+                                    name='worker'))
+        frames = document['shared']['frames']
+        profile, = document['profiles']
+        self.assertEqual(profile['type'], 'sampled')
+        self.assertEqual(profile['name'], 'worker')
+        self.assertEqual(profile['endValue'], 6)
+        self.assertEqual(len(frames), 3)
+        stacks = {}
+        for sample, weight in zip(profile['samples'], profile['weights']):
+            stacks[';'.join('%s (%s:%d)' % (frames[i]['name'],
+                                            frames[i]['file'],
+                                            frames[i]['line'])
+                            for i in sample)] = weight
+        self.assertEqual(stacks, PROFILE['stacks'])
+
+    def test_callgrind(self):
+        text = write(exporters.write_callgrind, PROFILE)
+        self.assertTrue(text.startswith('# callgrind format\n'))
+        self.assertTrue('\nsummary: 6\n' in text)
+        own = {}
+        calls = {}
+        names = {}
+        for block in text.split('\n\n')[1:]:
+            lines = block.splitlines()
+            fn = lines[1][len('fn='):]
+            number, _, name = fn.partition(' ')
+            if name:
+                names[number] = name
+            own[names[number]] = int(lines[2].split()[1])
+            for i in range(3, len(lines), 4):
+                number, _, name = lines[i + 1][len('cfn='):].partition(' ')
+                if name:
+                    names[number] = name
+                calls[(names[number], fn.partition(' ')[2] or
+                       names[fn.partition(' ')[0]])] = \
+                    int(lines[i + 2].split()[0][len('calls='):])
+        self.assertEqual(own, {'main (app.py:1)': 1, 'handle (app.py:10)': 2,
+                               'parse (json.py:100)': 3})
+        # recursion is counted once, handle and parse are reached 5 and 3
+        self.assertEqual(calls, {
+            ('handle (app.py:10)', 'main (app.py:1)'): 5,
+            ('main (app.py:1)', 'main (app.py:1)'): 1,
+            ('parse (json.py:100)', 'handle (app.py:10)'): 3})
+
+    def test_pprof(self):
+        out = io.BytesIO()
+        exporters.write_pprof(PROFILE, out)
+        message = read_message(gzip.GzipFile(
+            fileobj=io.BytesIO(out.getvalue())).read())
+        strings = [value.decode('utf-8') for value in message[6]]
+        self.assertEqual(strings[0], '')
+        sample_type = read_message(message[1][0])
+        self.assertEqual((strings[sample_type[1][0]],
+                          strings[sample_type[2][0]]), ('samples', 'count'))
+        functions = {}
+        for data in message[5]:
+            function = read_message(data)
+            functions[function[1][0]] = (strings[function[2][0]],
+                                         strings[function[4][0]],
+                                         function[5][0])
+        locations = {}
+        for data in message[4]:
+            location = read_message(data)
+            line = read_message(location[4][0])
+            locations[location[1][0]] = functions[line[1][0]]
+            self.assertEqual(line[2][0], locations[location[1][0]][2])
+        stacks = {}
+        for data in message[2]:
+            sample = read_message(data)
+            frames = [locations[i] for i in read_varints(sample[1][0])]
+            # leaf first in pprof
+            stack = ';'.join('%s (%s:%d)' % frame
+                             for frame in reversed(frames))
+            stacks[stack] = read_varints(sample[2][0])[0]
+        self.assertEqual(stacks, PROFILE['stacks'])
+
+    def test_varint(self):
+        for value in (0, 1, 127, 128, 300, 1 << 35):
+            self.assertEqual(read_varints(exporters.varint(value)), [value])
+
+
+class TestHeapFormats(unittest.TestCase):
+
+    ROWS = [(0x10, 2, 50.0, 120, 60.0, 60.0, 100, 'dict'),
+            (0x20, 2, 50.0, 80, 40.0, 100.0, 40, 'str')]
+
+    def setUp(self):
+        self.graph = HeapGraph.from_records([
+            (0x10, 'module', 56, [0x20]),
+            (0x20, 'dict', 240, [0x30, 0x40]),
+            (0x30, 'str', 52, []),
+            (0x40, 'str', 60, [])])
+        self.dominators = DominatorTree(self.graph)
+
+    def test_summary_csv(self):
+        rows = list(csv.reader(io.StringIO(
+            write(exporters.write_summary_csv, self.ROWS))))
+        self.assertEqual(tuple(rows[0]), exporters.SUMMARY_FIELDS)
+        self.assertEqual(rows[1], [str(value) for value in self.ROWS[0]])
+        self.assertEqual(len(rows), 3)
+
+    def test_summary_jsonl(self):
+        lines = write(exporters.write_summary_jsonl, self.ROWS).splitlines()
+        self.assertEqual(json.loads(lines[1]), dict(
+            zip(exporters.SUMMARY_FIELDS, self.ROWS[1])))
+
+    def test_objects_csv(self):
+        rows = list(csv.DictReader(io.StringIO(write(
+            exporters.write_objects_csv, self.graph,
+            dominators=self.dominators))))
+        by_address = dict((int(row['address']), row) for row in rows)
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(by_address[0x20]['type'], 'dict')
+        self.assertEqual(int(by_address[0x20]['retained']), 352)
+        self.assertEqual(sorted(int(address) for address in
+                                by_address[0x20]['referents'].split()),
+                         [0x30, 0x40])
+        self.assertEqual(by_address[0x30]['referents'], '')
+
+    def test_objects_jsonl(self):
+        lines = write(exporters.write_objects_jsonl,
+                      self.graph).splitlines()
+        objects = dict((row['address'], row)
+                       for row in map(json.loads, lines))
+        self.assertEqual(objects[0x10]['referents'], [0x20])
+        # no dominator tree, no retained sizes
+        self.assertEqual(objects[0x10]['retained'], -1)
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'profile.folded')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_export(self):
+        exporters.export(self.path, False, exporters.write_folded, PROFILE)
+        self.assertEqual(os.listdir(self.directory), ['profile.folded'])
+        with open(self.path) as f:
+            self.assertEqual(len(f.read().splitlines()), 3)
+
+    def test_binary(self):
+        path = os.path.join(self.directory, 'profile.pb.gz')
+        exporters.export(path, True, exporters.write_pprof, PROFILE)
+        with gzip.open(path) as f:
+            self.assertTrue(f.read())
+
+    def test_failure(self):
+        def failing(profile, out):
+            out.write(u'partial\n')
+            raise ValueError('disk full')
+        self.assertRaises(ValueError, exporters.export, self.path, False,
+                          failing, PROFILE)
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
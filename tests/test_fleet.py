@@ -0,0 +1,114 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+import threading
+import time
+import unittest
+
+from pyrasite_gui import fleet
+
+STACK_A = '''  File "worker.py", line 10, in run
+    self.loop()
+  File "worker.py", line 20, in loop
+    time.sleep(1)'''
+
+STACK_B = '''  File "server.py", line 5, in serve
+    sock.accept()'''
+
+
+def dump(*stacks):
+    """Format stacks the way pyrasite's dump_stacks payload prints them"""
+    return ''.join('Thread 0x%x\n%s\n\n' % (0x7f00 + i, stack)
+                   for i, stack in enumerate(stacks))
+
+
+def wait(pool):
+    while not pool.finished():
+        time.sleep(0.001)
+
+
+class TestFanOut(unittest.TestCase):
+
+    def test_results(self):
+        pool = fleet.FanOut(lambda n: n * n, range(20), workers=4)
+        wait(pool)
+        self.assertEqual(pool.results, dict((n, n * n) for n in range(20)))
+        self.assertEqual(pool.errors, {})
+        self.assertEqual(pool.progress, 1.0)
+
+    def test_errors(self):
+        def func(n):
+            if n % 2:
+                raise ValueError(n)
+            return n
+        pool = fleet.FanOut(func, range(6), workers=2)
+        wait(pool)
+        self.assertEqual(sorted(pool.results), [0, 2, 4])
+        self.assertEqual(sorted(pool.errors), [1, 3, 5])
+        self.assertTrue(isinstance(pool.errors[1], ValueError))
+
+    def test_bounded(self):
+        lock = threading.Lock()
+        running = [0, 0]  # now, most at once
+
+        def func(n):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+
+        pool = fleet.FanOut(func, range(12), workers=3)
+        self.assertEqual(len(pool.threads), 3)
+        wait(pool)
+        self.assertTrue(running[1] <= 3)
+        self.assertEqual(len(pool.results), 12)
+
+    def test_nothing(self):
+        pool = fleet.FanOut(lambda n: n, [])
+        self.assertTrue(pool.finished())
+        self.assertEqual(pool.progress, 1.0)
+
+
+class TestMerge(unittest.TestCase):
+
+    def test_split_stacks(self):
+        self.assertEqual(fleet.split_stacks(dump(STACK_A, STACK_B)),
+                         [STACK_A, STACK_B])
+        self.assertEqual(fleet.split_stacks(''), [])
+
+    def test_merge_stacks(self):
+        merged = fleet.merge_stacks({
+            1: dump(STACK_A, STACK_A, STACK_B),
+            2: dump(STACK_A),
+            3: dump(STACK_B)})
+        self.assertEqual(merged, [(STACK_A, 3, [1, 2]),
+                                  (STACK_B, 2, [1, 3])])
+
+    def test_merge_summaries(self):
+        merged = fleet.merge_summaries({
+            1: {'dict': [10, 1000], 'str': [5, 200]},
+            2: {'dict': [1, 100], 'list': [2, 500]}})
+        self.assertEqual(merged, [
+            ('dict', 11, 1100, {1: (10, 1000), 2: (1, 100)}),
+            ('list', 2, 500, {2: (2, 500)}),
+            ('str', 5, 200, {1: (5, 200)})])
+
+
+if __name__ == '__main__':
+    unittest.main()
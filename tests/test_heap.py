@@ -0,0 +1,233 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+import random
+import unittest
+
+from pyrasite_gui import heap
+from pyrasite_gui.heap import HeapGraph, DominatorTree
+
+
+def build(records):
+    return HeapGraph.from_records(records)
+
+
+# module 0x10 -> dict 0x20 -> list 0x30 -> str 0x40, str 0x50
+#                dict 0x20 -> str 0x40
+# and an unreachable cycle between 0x60 and 0x70
+RECORDS = [
+    (0x30, 'list', 72, [0x40, 0x50]),
+    (0x10, 'module', 56, [0x20]),
+    (0x50, 'str', 60, []),
+    (0x20, 'dict', 240, [0x30, 0x40, 0x999]),
+    (0x40, 'str', 52, []),
+    (0x60, 'list', 64, [0x70]),
+    (0x70, 'list', 64, [0x60]),
+]
+
+
+class TestHeapGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = build(RECORDS)
+
+    def addresses(self, indexes):
+        return sorted(self.graph.addresses[i] for i in indexes)
+
+    def test_sorted_by_address(self):
+        self.assertEqual(list(self.graph.addresses),
+                         [0x10, 0x20, 0x30, 0x40, 0x50, 0x60, 0x70])
+        self.assertEqual(len(self.graph), 7)
+
+    def test_records_are_streamed(self):
+        graph = build(iter(RECORDS))
+        self.assertEqual(list(graph.sizes), [56, 240, 72, 52, 60, 64, 64])
+        self.assertEqual([graph.type_name(i) for i in range(len(graph))],
+                         ['module', 'dict', 'list', 'str', 'str', 'list',
+                          'list'])
+
+    def test_index(self):
+        self.assertEqual(self.graph.index(0x40), 3)
+        self.assertEqual(self.graph.index(0x45), -1)
+        self.assertEqual(self.graph.index(0x80), -1)
+
+    def test_referents_skip_unknown_addresses(self):
+        dict_index = self.graph.index(0x20)
+        self.assertEqual(self.addresses(self.graph.referents(dict_index)),
+                         [0x30, 0x40])
+
+    def test_referrers(self):
+        str_index = self.graph.index(0x40)
+        self.assertEqual(self.addresses(self.graph.referrers(str_index)),
+                         [0x20, 0x30])
+        self.assertEqual(list(self.graph.referrers(self.graph.index(0x10))),
+                         [])
+
+    def test_instances_and_largest(self):
+        self.assertEqual(self.addresses(self.graph.instances('str')),
+                         [0x40, 0x50])
+        self.assertEqual(list(self.graph.instances('tuple')), [])
+        largest = self.graph.largest('str', limit=1)
+        self.assertEqual(self.addresses(largest), [0x50])
+
+    def test_roots(self):
+        graph = self.graph
+        self.assertTrue(graph.is_root(graph.index(0x10)))
+        self.assertFalse(graph.is_root(graph.index(0x40)))
+
+    def test_path_to_root(self):
+        graph = self.graph
+        path = graph.path_to_root(graph.index(0x50))
+        self.assertEqual([graph.addresses[i] for i in path],
+                         [0x10, 0x20, 0x30, 0x50])
+
+    def test_no_path_from_unreachable_cycle(self):
+        self.assertEqual(self.graph.path_to_root(self.graph.index(0x60)), [])
+
+    def test_describe(self):
+        self.assertEqual(self.graph.describe(self.graph.index(0x20)),
+                         'dict 0x20 (240 bytes)')
+
+
+
+def reachable(graph, start, removed):
+    """Indexes reachable from `start` without passing through `removed`"""
+    seen = set()
+    pending = list(start)
+    while pending:
+        v = pending.pop()
+        if v == removed or v in seen:
+            continue
+        seen.add(v)
+        pending.extend(graph.referents(v))
+    return seen
+
+
+def naive_dominators(graph):
+    """Immediate dominators from the definition, for small graphs"""
+    roots = [v for v in range(len(graph)) if graph.is_root(v)]
+    everything = reachable(graph, roots, None)
+    dominators = {}
+    for d in range(len(graph)):
+        for v in everything - reachable(graph, roots, d):
+            dominators.setdefault(v, set()).add(d)
+    idom = {}
+    for v, found in dominators.items():
+        # The closest dominator is the one with the most dominators itself
+        strict = found - set([v])
+        idom[v] = max(strict, key=lambda d: len(dominators[d])) \
+            if strict else len(graph)
+    return idom
+
+
+def random_graph(rng, n):
+    """A module that reaches every object, plus random extra references"""
+    children = dict((i, set()) for i in range(n))
+    for i in range(1, n):
+        children[rng.randrange(i)].add(i)
+    for i in range(n * 2):
+        children[rng.randrange(n)].add(rng.randrange(1, n))
+    return build([((i + 1) * 16, 'list' if i else 'module',
+                   rng.randrange(1, 100), [(c + 1) * 16 for c in children[i]])
+                  for i in range(n)])
+
+
+class TestDominatorTree(unittest.TestCase):
+
+    def test_diamond(self):
+        # module -> a -> {b, c} -> d: only a dominates d
+        graph = build([(0x10, 'module', 1, [0x20]),
+                       (0x20, 'dict', 2, [0x30, 0x40]),
+                       (0x30, 'list', 4, [0x50]),
+                       (0x40, 'list', 8, [0x50]),
+                       (0x50, 'str', 16, [])])
+        tree = DominatorTree(graph)
+        idom = dict((graph.addresses[v], graph.addresses[tree.idom[v]])
+                    for v in range(len(graph)) if tree.idom[v] < len(graph))
+        self.assertEqual(idom, {0x20: 0x10, 0x30: 0x20, 0x40: 0x20,
+                                0x50: 0x20})
+        self.assertEqual(tree.idom[graph.index(0x10)], tree.root)
+        self.assertEqual(tree.retained[graph.index(0x10)], 31)
+        self.assertEqual(tree.retained[graph.index(0x20)], 30)
+        self.assertEqual(tree.retained[graph.index(0x30)], 4)
+        self.assertEqual(tree.retained[tree.root], 31)
+        self.assertEqual([graph.addresses[v] for v in tree.biggest(2)],
+                         [0x10, 0x20])
+
+    def test_unreachable_cycle_gets_a_dominator(self):
+        graph = build(RECORDS)
+        tree = DominatorTree(graph)
+        first, second = graph.index(0x60), graph.index(0x70)
+        self.assertEqual(tree.idom[first], tree.root)
+        self.assertEqual(tree.idom[second], first)
+        self.assertEqual(tree.retained[first], 128)
+
+    def test_matches_definition_on_random_graphs(self):
+        rng = random.Random(1234)
+        for trial in range(30):
+            graph = random_graph(rng, rng.randrange(2, 40))
+            tree = DominatorTree(graph)
+            expected = naive_dominators(graph)
+            self.assertEqual(dict((v, tree.idom[v]) for v in expected),
+                             expected)
+            for v in range(len(graph)):
+                dominated = [w for w in range(len(graph))
+                             if self.dominates(tree, v, w)]
+                self.assertEqual(tree.retained[v],
+                                 sum(graph.sizes[w] for w in dominated))
+
+    def dominates(self, tree, v, w):
+        while w != tree.root:
+            if w == v:
+                return True
+            w = tree.idom[w]
+        return False
+
+    def test_type_retained_counts_nested_types_once(self):
+        # module -> outer list -> inner list -> str
+        graph = build([(0x10, 'module', 1, [0x20]),
+                       (0x20, 'list', 10, [0x30]),
+                       (0x30, 'list', 20, [0x40]),
+                       (0x40, 'str', 40, [])])
+        retained = DominatorTree(graph).type_retained()
+        self.assertEqual(retained, {'module': 71, 'list': 70, 'str': 40})
+
+    def test_from_arrays(self):
+        graph = build(RECORDS)
+        tree = DominatorTree(graph)
+        copy = DominatorTree.from_arrays(graph, tree.idom, tree.order,
+                                         tree.retained)
+        self.assertEqual(copy.type_retained(), tree.type_retained())
+        self.assertEqual(copy.biggest(3), tree.biggest(3))
+
+    def test_progress(self):
+        graph = random_graph(random.Random(99), 3000)
+        seen = []
+        old_mask = heap.PROGRESS_MASK
+        heap.PROGRESS_MASK = 255
+        try:
+            tree = DominatorTree(graph, seen.append)
+        finally:
+            heap.PROGRESS_MASK = old_mask
+        self.assertTrue(len(seen) > 10)
+        self.assertEqual(seen, sorted(seen))
+        self.assertTrue(0.0 <= seen[0] and seen[-1] <= 1.0)
+        self.assertEqual(tree.progress, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
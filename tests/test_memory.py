@@ -0,0 +1,155 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+import os
+import unittest
+
+from pyrasite_gui import memory
+
+SMAPS = '''\
+55d0c0a00000-55d0c0a21000 rw-p 00000000 00:00 0                          [heap]
+Size:                132 kB
+Rss:                 100 kB
+Pss:                  60 kB
+Shared_Clean:         20 kB
+Shared_Dirty:         20 kB
+Private_Clean:        10 kB
+Private_Dirty:        50 kB
+Swap:                  4 kB
+VmFlags: rd wr mr mw me ac sd
+7f3a1c000000-7f3a1c021000 rw-p 00000000 00:00 0
+Rss:                   8 kB
+Pss:                   8 kB
+Private_Dirty:         8 kB
+7f3a1d000000-7f3a1d1a0000 r-xp 00000000 08:01 1234                       /usr/lib/libc.so.6
+Rss:                 400 kB
+Pss:                  40 kB
+Shared_Clean:        400 kB
+7f3a1e000000-7f3a1e010000 r--p 00000000 08:01 99                         /usr/lib/python3/mod.so.1
+Rss:                  16 kB
+Pss:                   2 kB
+Shared_Clean:         16 kB
+7f3a1f000000-7f3a1f001000 r--p 00000000 08:01 42                         /tmp/data file.bin
+Rss:                   4 kB
+Pss:                   4 kB
+Private_Clean:         4 kB
+7ffd5e000000-7ffd5e021000 rw-p 00000000 00:00 0                          [stack]
+Rss:                  12 kB
+Pss:                  12 kB
+Private_Dirty:        12 kB
+ffffffffff600000-ffffffffff601000 --xp 00000000 00:00 0                  [vsyscall]
+Rss:                   0 kB
+'''
+
+ROLLUP = '''\
+55d0c0a00000-7ffd5e021000 ---p 00000000 00:00 0                          [rollup]
+Rss:                 540 kB
+Pss:                 126 kB
+Shared_Clean:        436 kB
+Shared_Dirty:         20 kB
+Private_Clean:        14 kB
+Private_Dirty:        70 kB
+Swap:                  4 kB
+'''
+
+
+class TestSmaps(unittest.TestCase):
+
+    def test_category(self):
+        self.assertEqual(memory.category(''), 'Anonymous (arenas, mmap)')
+        self.assertEqual(memory.category('[heap]'), 'Python heap (brk)')
+        self.assertEqual(memory.category('[stack:1234]'), 'Stacks')
+        self.assertEqual(memory.category('[vdso]'), 'Other')
+        self.assertEqual(memory.category('/lib/libm.so.6'), 'Libraries')
+        self.assertEqual(memory.category('/x/_json.cpython-312.so'),
+                         'Libraries')
+        self.assertEqual(memory.category('/var/db.sqlite'), 'Mapped files')
+
+    def test_parse_smaps(self):
+        parsed = memory.parse_smaps(SMAPS.splitlines(True))
+        self.assertEqual(sorted(parsed), sorted(memory.CATEGORIES))
+        self.assertEqual(parsed['Python heap (brk)'], dict(
+            rss=100 << 10, pss=60 << 10, uss=60 << 10, shared=40 << 10,
+            swap=4 << 10))
+        self.assertEqual(parsed['Libraries'], dict(
+            rss=416 << 10, pss=42 << 10, uss=0, shared=416 << 10, swap=0))
+        # a path with spaces is still one mapped file
+        self.assertEqual(parsed['Mapped files']['uss'], 4 << 10)
+        self.assertEqual(parsed['Anonymous (arenas, mmap)']['uss'], 8 << 10)
+        self.assertEqual(parsed['Stacks']['rss'], 12 << 10)
+        self.assertEqual(parsed['Other']['rss'], 0)
+
+    def test_parse_rollup(self):
+        totals = memory.parse_rollup(ROLLUP.splitlines(True))
+        self.assertEqual(totals, dict(rss=540 << 10, pss=126 << 10,
+                                      uss=84 << 10, shared=456 << 10,
+                                      swap=4 << 10))
+        # the rollup is the sum of the full breakdown
+        summed = {}
+        for summary in memory.parse_smaps(SMAPS.splitlines(True)).values():
+            for key, value in summary.items():
+                summed[key] = summed.get(key, 0) + value
+        self.assertEqual(summed, totals)
+
+    @unittest.skipUnless(os.path.exists('/proc/self/smaps'), 'needs /proc')
+    def test_read_self(self):
+        breakdown = memory.read_smaps(os.getpid())
+        totals = memory.read_rollup(os.getpid())
+        self.assertTrue(totals['rss'] > 0)
+        self.assertTrue(totals['uss'] <= totals['pss'] <= totals['rss'])
+        self.assertTrue(sum(summary['rss'] for summary in breakdown.values())
+                        > 0)
+
+
+class TestMemoryCache(unittest.TestCase):
+
+    def test_cached(self):
+        calls = []
+
+        def reader(pid):
+            calls.append(pid)
+            return len(calls)
+
+        cache = memory.MemoryCache(reader, max_age=60)
+        self.assertEqual(cache.get(1), 1)
+        self.assertEqual(cache.get(1), 1)
+        self.assertEqual(cache.get(2), 2)
+        cache.forget(1)
+        self.assertEqual(cache.get(1), 3)
+        cache.max_age = 0
+        self.assertEqual(cache.get(1), 4)
+        self.assertEqual(calls, [1, 2, 1, 1])
+
+
+class TestGrowth(unittest.TestCase):
+
+    def test_rate(self):
+        growth = memory.Growth(history=3)
+        self.assertEqual(growth.rate(1), 0.0)
+        growth.add(1, dict(uss=1000, pss=0), when=100.0)
+        self.assertEqual(growth.rate(1), 0.0)
+        growth.add(1, dict(uss=2000, pss=0), when=110.0)
+        self.assertEqual(growth.rate(1), 100.0)
+        growth.add(1, dict(uss=2000, pss=0), when=120.0)
+        growth.add(1, dict(uss=5000, pss=0), when=130.0)
+        # only the last three samples are kept
+        self.assertEqual(growth.rate(1), 150.0)
+        self.assertEqual(growth.rate(1, 'pss'), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+import unittest
+
+from pyrasite_gui import profiles
+
+
+def profile(**stacks):
+    """A profile of `stacks`, with '.' separating frames for brevity"""
+    return dict(samples=sum(stacks.values()), interval=0.005,
+                stacks=dict((stack.replace('.', ';'), count)
+                            for stack, count in stacks.items()))
+
+
+class TestProfiles(unittest.TestCase):
+
+    def test_merge(self):
+        merged = profiles.merge([profile(**{'a.b': 2, 'a.c': 1}),
+                                 profile(**{'a.b': 3, 'd': 4})])
+        self.assertEqual(merged, dict(samples=10, stacks={
+            'a;b': 5, 'a;c': 1, 'd': 4}))
+        self.assertEqual(profiles.merge([]), dict(samples=0, stacks={}))
+
+    def test_call_tree(self):
+        root = profiles.call_tree(profile(**{'a.b': 3, 'a.b.c': 2, 'a': 1,
+                                             'd': 4}))
+        self.assertEqual(root.total, 10)
+        self.assertEqual([node.name for node in root.sorted_children()],
+                         ['a', 'd'])
+        a = root.children['a']
+        self.assertEqual((a.total, a.self), (6, 1))
+        b = a.children['b']
+        self.assertEqual((b.total, b.self), (5, 3))
+        self.assertEqual((b.children['c'].total, b.children['c'].self),
+                         (2, 2))
+        # every sample ends in exactly one frame
+        def selves(node):
+            return node.self + sum(selves(child)
+                                   for child in node.children.values())
+        self.assertEqual(selves(root), root.total)
+
+    def test_to_dot(self):
+        dot = profiles.to_dot(profile(**{'a.b': 99, 'a.c': 1}),
+                              min_fraction=0.05)
+        self.assertTrue(dot.startswith('digraph profile {'))
+        self.assertTrue(dot.endswith('}'))
+        self.assertTrue('a\\n100 samples' in dot)
+        self.assertTrue('b\\n99 samples' in dot)
+        # c is under the threshold, as is its edge
+        self.assertFalse('c\\n' in dot)
+        self.assertEqual(dot.count(' -> '), 1)
+
+    def test_to_dot_quotes(self):
+        dot = profiles.to_dot(profile(**{'say "hi"': 1}))
+        self.assertTrue('say \\"hi\\"' in dot)
+
+
+class TestDiff(unittest.TestCase):
+
+    def test_function_totals(self):
+        totals = profiles.function_totals(profile(**{'a.b': 3, 'a.b.b': 2,
+                                                     'a': 1}))
+        # recursion counts once per stack towards the total
+        self.assertEqual(totals, dict(a=[1, 6], b=[5, 5]))
+
+    def test_diff(self):
+        before = profile(**{'a.b': 50, 'a.c': 50})
+        after = profile(**{'a.b': 10, 'a.c': 10, 'a.d': 180})
+        rows = dict((row[0], row[1:]) for row in profiles.diff(before,
+                                                               after))
+        self.assertEqual(rows['a'], (0.0, 0.0, 1.0, 1.0))
+        self.assertEqual(rows['b'], (0.5, 0.05, 0.5, 0.05))
+        self.assertEqual(rows['d'], (0.0, 0.9, 0.0, 0.9))
+        # largest change in total first, unchanged functions last
+        order = [row[0] for row in profiles.diff(before, after)]
+        self.assertEqual(order, ['d', 'b', 'c', 'a'])
+
+    def test_diff_empty(self):
+        rows = profiles.diff(profile(), profile(**{'a': 1}))
+        self.assertEqual(rows, [('a', 0.0, 1.0, 0.0, 1.0)])
+
+    def test_diff_to_dot(self):
+        dot = profiles.diff_to_dot(profile(**{'a.b': 10, 'a.gone': 10}),
+                                   profile(**{'a.b': 20}))
+        self.assertTrue(dot.startswith('digraph diff {'))
+        self.assertTrue(dot.endswith('}'))
+        # a function that disappeared is dashed
+        gone = [line for line in dot.splitlines() if 'gone' in line][0]
+        self.assertTrue('dashed' in gone)
+        self.assertTrue('50.0% -> 100.0% (+50.0)' in dot)
+        edges = [line for line in dot.splitlines() if ' [label="' in line and
+                 line.split()[1] == '->']
+        self.assertEqual(len(edges), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
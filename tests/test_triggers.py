@@ -0,0 +1,99 @@
+# This file is part of pyrasite.
+#
+# pyrasite is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyrasite is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyrasite.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2012 Red Hat, Inc., Luke Macken <lmacken@redhat.com>
+
+import unittest
+
+from pyrasite_gui import triggers
+
+
+def history(samples, interval=1.0):
+    metrics = triggers.MetricHistory(seconds=60, interval=interval)
+    for when, values in samples:
+        metrics.add(when=when, **values)
+    return metrics
+
+
+class TestMetricHistory(unittest.TestCase):
+
+    def test_ring(self):
+        metrics = history([(t, dict(cpu=t)) for t in range(100)])
+        self.assertEqual(len(metrics.samples), 61)
+        self.assertEqual(metrics.to_list()[0], (39, dict(cpu=39)))
+        self.assertEqual([when for when, values in metrics.since(97)],
+                         [97, 98, 99])
+        metrics.clear()
+        self.assertEqual(metrics.to_list(), [])
+
+
+class TestTrigger(unittest.TestCase):
+
+    def test_sustained(self):
+        trigger = triggers.Trigger('cpu', 90, 10)
+        metrics = history([(t, dict(cpu=95)) for t in range(5)])
+        # not enough history yet
+        self.assertEqual(trigger.value(metrics, now=5), None)
+        self.assertFalse(trigger.fired(metrics, now=5))
+        for t in range(5, 20):
+            metrics.add(when=t, cpu=95)
+        self.assertEqual(trigger.value(metrics, now=20), 95)
+        self.assertTrue(trigger.fired(metrics, now=20))
+        # one dip inside the window is enough to hold it off
+        metrics.add(when=20, cpu=50)
+        self.assertEqual(trigger.value(metrics, now=21), 50)
+        self.assertFalse(trigger.fired(metrics, now=21))
+
+    def test_missing_metric(self):
+        trigger = triggers.Trigger('threads', 10, 5)
+        metrics = history([(t, dict(cpu=1)) for t in range(10)])
+        self.assertEqual(trigger.value(metrics, now=10), None)
+
+    def test_rss_growth(self):
+        trigger = triggers.Trigger('rss_growth', 100, 10)
+        metrics = history([(t, dict(rss=t * 200 * 1024)) for t in range(20)])
+        self.assertEqual(trigger.value(metrics, now=20), 200.0)
+        self.assertTrue(trigger.fired(metrics, now=20))
+        flat = history([(t, dict(rss=1 << 20)) for t in range(20)])
+        self.assertEqual(trigger.value(flat, now=20), 0.0)
+
+    def test_describe(self):
+        trigger = triggers.Trigger('cpu', 90, 60)
+        self.assertEqual(trigger.describe(),
+                         'CPU % sustained above 90% for 60s')
+        self.assertEqual(trigger.describe(97.25),
+                         'CPU % sustained above 90% for 60s (97.2%)')
+        self.assertEqual(triggers.Trigger('other', 1, 1).describe(), 'other')
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_interval(self):
+        limiter = triggers.RateLimiter(interval=60, limit=10)
+        self.assertTrue(limiter.allow(now=0))
+        self.assertFalse(limiter.allow(now=30))
+        self.assertTrue(limiter.allow(now=60))
+
+    def test_hourly(self):
+        limiter = triggers.RateLimiter(interval=0, limit=3)
+        self.assertEqual([limiter.allow(now=t) for t in (0, 1, 2, 3)],
+                         [True, True, True, False])
+        # the first one has aged out
+        self.assertTrue(limiter.allow(now=3600.5))
+        self.assertFalse(limiter.allow(now=3600.8))
+
+
+if __name__ == '__main__':
+    unittest.main()